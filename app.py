@@ -1,6 +1,10 @@
 import streamlit as st
-import time
-from src.rag_pipeline import get_rag_chain, get_retriever
+from src.rag_pipeline import get_query_cache, get_scope_index, get_snapshots, get_vectorstore, warm_up
+from src.rag_service import STREAM_ANSWERS, get_service, ServiceOverloaded, DeadlineExceeded
+from src.reranker import RERANK_ENABLED
+from src.telemetry import METRICS_PORT, get_telemetry, span
+
+AUTO_SCOPE = "Auto (from question)"
 
 # --- 1. CONFIGURATION ---
 st.set_page_config(
@@ -9,6 +13,13 @@ st.set_page_config(
     layout="wide"
 )
 
+# /metrics is served by the app process only (scripts importing telemetry never bind the port)
+@st.cache_resource
+def start_metrics_exporter():
+    return get_telemetry().start_exporter(METRICS_PORT)
+
+metrics_port = start_metrics_exporter()
+
 # --- 2. SIDEBAR (Context for the User) ---
 with st.sidebar:
     st.image("https://cdn-icons-png.flaticon.com/512/4121/4121044.png", width=80)
@@ -27,25 +38,69 @@ with st.sidebar:
     st.code("What are the main issues with Student Loans?", language=None)
     st.code("Are there delays in Money Transfers?", language=None)
     st.divider()
+    st.markdown("### Scope")
+    scope_index = get_scope_index()
+    product = st.selectbox("Product", [AUTO_SCOPE] + sorted(scope_index.products))
+    product = None if product == AUTO_SCOPE else product
+    issue_options = sorted(scope_index.issues[product]) if product else []
+    issue = st.selectbox("Issue", [AUTO_SCOPE] + issue_options, disabled=not product)
+    issue = None if issue == AUTO_SCOPE else issue
+    rerank = st.toggle("Re-rank evidence (cross-encoder)", value=RERANK_ENABLED,
+                       help="Scores 50 candidates and keeps the best 3; slower first answer.")
+    stream = st.toggle("Stream answer (typewriter)", value=STREAM_ANSWERS,
+                       help="Shows tokens as they are generated. Off: answers are generated in batches "
+                            "shared with other sessions (more questions per second, nothing shown until done).")
+    st.divider()
     st.markdown("### Controls")
     if st.button("🗑️ Reset Conversation"):
         st.session_state.messages = []
         st.rerun()
+    if st.button("♻️ Clear Answer Cache"):
+        get_query_cache().invalidate()
+    with st.expander("📈 Diagnostics"):
+        telemetry = get_telemetry()
+        report = telemetry.snapshot()
+        if not telemetry.enabled:
+            st.caption("Telemetry is off (RAG_TELEMETRY=0).")
+        elif report["spans"]:
+            st.dataframe([{"stage": name, "calls": s["count"], "p50 ms": round(s["p50_ms"]),
+                           "p95 ms": round(s["p95_ms"]), "p99 ms": round(s["p99_ms"])}
+                          for name, s in report["spans"].items()], hide_index=True)
+            st.json(report["counters"], expanded=False)
+        else:
+            st.caption("No requests yet.")
+        st.caption(f"Peak RSS: {report['peak_rss_mb']:.0f} MB")
+        snapshot = get_snapshots().stats()
+        st.caption(f"Index snapshot: {snapshot['version'] or 'none'} ({snapshot['swaps']} swaps, "
+                   f"{snapshot['in_flight']} requests in flight)")
+        if metrics_port:
+            st.caption(f"Prometheus: http://localhost:{metrics_port}/metrics")
 
 # --- 3. MAIN UI & LOGIC ---
 st.title("🏦 Customer Insight Dashboard")
 st.markdown("Welcome, Asha. Ask questions to analyze the latest complaint trends.")
 
-# Cache the heavy model loading
+# Start loading the models in the background as soon as the process starts
+@st.cache_resource
+def start_warm_up():
+    return warm_up(background=True)
+
+start_warm_up()
+
+# Every session talks to the same query service, which batches concurrent
+# questions into shared embedding / Flan-T5 calls (waits for the warm-up if it is still running).
+# The index underneath is not cached here: newly published snapshots are swapped in between requests.
 @st.cache_resource
 def load_system():
-    # Load the RAG Chain and the Retriever
-    return get_rag_chain(), get_retriever()
+    return get_service()
 
 # Load the model with a spinner
 with st.spinner("Initializing AI Brain & Loading Database..."):
     try:
-        chain, retriever = load_system()
+        service = load_system()
+        if get_vectorstore() is None:  # checked on every rerun: picked up once ingestion publishes
+            st.error("❌ Vector store not found. Run the ingestion first.")
+            st.stop()
     except Exception as e:
         st.error(f"❌ System Error: {e}")
         st.stop()
@@ -76,30 +131,73 @@ if prompt := st.chat_input("Type your question here..."):
         
         with st.spinner("Retrieving relevant complaints..."):
             try:
-                # A. Retrieve Context (The "Retrieval" part of RAG)
-                docs = retriever.invoke(prompt)
-                
-                # B. Generate Answer (The "Generation" part of RAG)
-                response_text = chain.invoke(prompt)
-                
-                # C. Streaming Output Effect
-                for chunk in response_text.split():
-                    full_response += chunk + " "
-                    time.sleep(0.05) # Adjust speed of typing here
-                    message_placeholder.markdown(full_response + "▌")
-                message_placeholder.markdown(full_response)
-
-                # D. Show Evidence (Sources)
-                with st.expander("📄 View Source Evidence (Retrieval Context)"):
-                    if not docs:
-                        st.warning("No relevant complaints found in the database.")
-                    for i, doc in enumerate(docs):
-                        st.markdown(f"**Complaint #{i+1} ({doc.metadata.get('product', 'Unknown Product')}):**")
-                        st.caption(f"_{doc.page_content}_")
-                        st.divider()
+                # A+B. Retrieve Context (batched with other sessions) & Generate Answer
+                docs, scope, timings, summary = [], None, {}, None
+                if stream:
+                    # C. Stream tokens to the UI as Flan-T5 produces them (one generation per answer)
+                    events = service.stream_sync(prompt, product=product, issue=issue, rerank=rerank)
+                    for kind, value in events:
+                        if kind == "scope":
+                            scope = value
+                        elif kind == "timings":
+                            timings = value
+                        elif kind == "docs":
+                            docs = value
+                        elif kind == "aggregate":  # counted from the aggregate store, no retrieval
+                            summary = value
+                        else:
+                            full_response += value
+                            with span("query.render"):
+                                message_placeholder.markdown(full_response + "▌")
+                else:
+                    # C. Whole answer from the generation batched with the other sessions' questions
+                    result = service.ask_sync(prompt, product=product, issue=issue, rerank=rerank)
+                    docs, scope, timings = result["docs"], result["scope"], result["timings"]
+                    summary = result.get("summary")
+                    full_response = result["answer"]
+                with span("query.render"):
+                    message_placeholder.markdown(full_response)
+                if scope and (scope["products"] or scope["issue"]):
+                    searched = ", ".join(scope["products"] + ([scope["issue"]] if scope["issue"] else []))
+                    st.caption(f"🔎 Searched only: {searched}")
+                if "fallback_reason" in timings:
+                    st.info("⚠️ No summary could be generated in time, so the answer lists the evidence directly.")
+
+                # D. Show Evidence (Sources), or the counts behind an aggregate answer
+                if summary is not None:
+                    with span("query.render"):
+                        st.caption("📊 Answered from the aggregate store (all complaints, not a sample)")
+                        st.dataframe([{"issue": name, "complaints": n, "share": f"{share:.0%}"}
+                                      for name, n, share in summary["top_issues"]], hide_index=True)
+                else:
+                    with span("query.render"), st.expander("📄 View Source Evidence (Retrieval Context)"):
+                        if not docs:
+                            st.warning("No relevant complaints found in the database.")
+                        for i, doc in enumerate(docs):
+                            similar = len(str(doc.metadata.get("complaint_ids", "")).split(",")) - 1
+                            st.markdown(f"**Complaint #{i+1} ({doc.metadata.get('product', 'Unknown Product')}):**"
+                                        + (f" _+{similar} near-identical complaints_" if similar > 0 else ""))
+                            st.caption(f"_{doc.page_content}_")
+                            st.divider()
 
                 # Save history
                 st.session_state.messages.append({"role": "assistant", "content": full_response})
 
+                cache_stats = get_query_cache().stats()
+                st.caption(f"Answer cache hit rate: {cache_stats['hit_rate']:.0%} "
+                           f"({cache_stats['exact_hits']} exact, {cache_stats['semantic_hits']} similar)")
+                stages = [(label, timings[key]) for key, label in
+                          (("aggregate_ms", "aggregate"), ("queue_ms", "queue"), ("retrieve_ms", "retrieve"),
+                           ("rerank_ms", "re-rank"), ("first_token_ms", "first token"),
+                           ("generate_ms", "generate"))
+                          if key in timings]
+                if stages:
+                    st.caption("⏱️ " + " · ".join(f"{label} {ms:.0f} ms" for label, ms in stages)
+                               + (" (re-rank over budget, dense order used)" if timings.get("fallback") else ""))
+
+            except ServiceOverloaded:
+                st.warning("⏳ The analyst is busy with other questions right now. Please try again in a moment.")
+            except DeadlineExceeded:
+                st.error("⌛ The answer took too long and was cancelled. Try a narrower question or scope.")
             except Exception as e:
                 st.error(f"Error: {e}")
\ No newline at end of file
@@ -0,0 +1,113 @@
+# benchmarks/bench_aggregates.py
+"""
+Benchmark: aggregate-store answers vs the retrieval path, on synthetic CFPB-shaped data.
+
+Streams a synthetic CSV (benchmarks/synthetic_cfpb.py) through the ingestion
+product filter twice, without and with AggregateBuilder.observe, to price
+the extra pass; then answers the aggregate-style questions with
+rag_pipeline.answer_aggregate and reports:
+
+  * build overhead and the store's size (Parquet if pyarrow is installed)
+  * p50 / p95 answer latency per question (scope inference included)
+  * that the counts equal an exact pandas count over every row of the target
+    products (narrative or not)
+    (the RAG chain only ever sees SAMPLE_SIZE complaints, 3 at a time)
+
+For comparison, the retrieval-only query path (no Flan-T5) is in
+benchmarks/baseline.json as query.path.p50_ms; generation adds ~1 s on CPU.
+
+    python benchmarks/bench_aggregates.py --rows 100000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import rag_pipeline as rp
+from aggregates import AGGREGATES_FILE, AggregateBuilder, pyarrow
+from chunking import ChunkRecord
+from ingestion import iter_product_chunks
+from scope_index import ScopeIndex
+from synthetic_cfpb import ensure_csv
+
+QUESTIONS = [
+    "What are the main issues with Student Loans?",
+    "How many Money Transfer complaints are filed per month?",
+    "How many complaints about credit card fees or interest?",
+    "Are complaints about checking accounts rising?",
+    "What are the most common problems overall?",
+]
+
+
+def stream(csv_path, builder=None):
+    """Rows of the target products (as the aggregate builder sees them) and the seconds it took."""
+    start = time.perf_counter()
+    chunks = iter_product_chunks(csv_path)
+    if builder is not None:
+        chunks = builder.observe(chunks)
+    frames = [chunk[["Product", "Issue"]] for chunk in chunks]
+    return pd.concat(frames), time.perf_counter() - start
+
+
+def scope_index_for(table):
+    """ScopeIndex knowing every product / issue of the store, as ingestion would build it."""
+    scope = ScopeIndex()
+    records = (ChunkRecord(str(i), "", {"product": p, "issue": s})
+               for i, (p, s) in enumerate(table[["product", "issue"]].itertuples(index=False)))
+    for _ in scope.observe(records):
+        pass
+    return scope
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate store build cost and answer latency")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeats", type=int, default=50)
+    args = parser.parse_args()
+
+    csv_path = ensure_csv(args.rows)
+    stream(csv_path)  # warm the page cache
+    _, plain_s = stream(csv_path)
+    builder = AggregateBuilder()
+    filtered, observed_s = stream(csv_path, builder)
+    start = time.perf_counter()
+    store = builder.build()
+    build_s = time.perf_counter() - start
+    print(f"{args.rows} rows, {len(filtered)} of the target products: streaming {plain_s:.2f}s, with aggregates "
+          f"{observed_s:.2f}s (+{observed_s - plain_s:.2f}s), build {1000 * build_s:.0f} ms, "
+          f"{len(store.table)} cells")
+    if pyarrow is not None:
+        path = tempfile.mkdtemp(prefix="bench_aggregates_")
+        store.save(path)
+        print(f"Parquet: {os.path.getsize(os.path.join(path, AGGREGATES_FILE)) / 1024:.0f} KB")
+    else:
+        print(f"pyarrow not installed; in-memory table {store.table.memory_usage(deep=True).sum() / 1024:.0f} KB")
+
+    rp.get_aggregate_store = lambda: store
+    scope = scope_index_for(store.table)
+    rp.get_scope_index = lambda: scope
+    exact = filtered.fillna({"Issue": "Unknown"}).groupby(["Product", "Issue"]).size()
+    print(f"\n  {'question':<58} {'p50':>8} {'p95':>8}  {'scope':<40} exact")
+    for question in QUESTIONS:
+        latencies = []
+        for _ in range(args.repeats + 1):
+            start = time.perf_counter()
+            result = rp.answer_aggregate(question)
+            latencies.append(1000 * (time.perf_counter() - start))
+        if result is None:
+            print(f"  {question:<58} not routed (drill-down)")
+            continue
+        products, issue = result["scope"]["products"], result["scope"]["issue"]
+        expected = exact.loc[products] if products else exact
+        matches = result["summary"]["total"] == int(expected.sum())
+        if issue:
+            matches &= result["summary"]["issue_total"] == int(expected.xs(issue, level="Issue").sum())
+        label = ", ".join(products + ([issue] if issue else [])) or "all products"
+        print(f"  {question:<58} {np.percentile(latencies[1:], 50):6.2f}ms {np.percentile(latencies[1:], 95):6.2f}ms"
+              f"  {label[:40]:<40} {'yes' if matches else 'NO'}")
@@ -0,0 +1,60 @@
+# benchmarks/bench_cold_start.py
+"""
+Cold-start timings for the query side.
+
+Each measurement runs in a fresh interpreter so nothing is already imported:
+  * import      - `import src.rag_pipeline`
+  * retriever   - import + first retrieval (embedder + Chroma, no Flan-T5)
+  * first answer - import + get_rag_chain() + first chain.invoke()
+  * warm answer - same, but warm_up() is started right after import
+
+    python benchmarks/bench_cold_start.py --repeat 3
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+QUESTION = "Why are customers complaining about overdraft fees?"
+
+SCENARIOS = {
+    "import": "import src.rag_pipeline",
+    "retriever": "import src.rag_pipeline as rp\nrp.get_retriever().invoke(Q)",
+    "first answer": "import src.rag_pipeline as rp\nrp.get_rag_chain().invoke(Q)",
+    "warm answer": "import src.rag_pipeline as rp\nrp.warm_up()\nrp.get_rag_chain().invoke(Q)",
+}
+
+TIMER = """
+import time
+_start = time.perf_counter()
+Q = {question!r}
+{body}
+print(time.perf_counter() - _start)
+"""
+
+
+def measure(body):
+    code = TIMER.format(question=QUESTION, body=body)
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start timings for src/rag_pipeline.py")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", choices=list(SCENARIOS), action="append")
+    parser.add_argument("--json", help="Optional path to write the results to")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only or SCENARIOS:
+        runs = [measure(SCENARIOS[name]) for _ in range(args.repeat)]
+        results[name] = {"median_s": statistics.median(runs), "runs": runs}
+        print(f"{name:>13}: median {results[name]['median_s']:.2f}s over {len(runs)} runs")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,176 @@
+# benchmarks/bench_compact_store.py
+"""
+Benchmark: recall@k vs memory vs latency of the compact store against Chroma HNSW.
+
+Builds a throwaway Chroma index of synthetic 384-d unit vectors (clustered
+like sentence embeddings, product metadata as ingestion writes it), exports
+it with export_compact_store in both modes, then serves the same queries from
+
+  chroma   - the Chroma collection (HNSW, float32, what get_retriever uses today)
+  float16  - compact store, brute-force scan of the mmapped float16 vectors
+  pq       - compact store, PQ code scan + exact re-score of a shortlist
+
+Each backend is loaded and queried in a fresh process, so its resident
+memory is its own. Recall@k is measured against an exact float32 search.
+Reported: load time, p50 / p95 latency (unscoped and with a product
+filter), recall@k, RSS growth after load + queries (of which "anon" is
+heap that cannot be paged out; mmapped store pages are reclaimable) and
+size on disk.
+
+    python benchmarks/bench_compact_store.py --chunks 100000
+    python benchmarks/bench_compact_store.py --db ./chroma_db   # vectors of a real ingest
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+PRODUCTS = ["Credit card", "Personal loan", "Student loan", "Checking or savings account",
+            "Money transfer, virtual currency, or money service"]
+DIM = 384           # all-MiniLM-L6-v2
+CLUSTERS = 400
+INSERT_BATCH = 5000
+
+
+def make_vectors(n, rng, spread=1.0):
+    """Unit vectors around CLUSTERS topic centres; every topic leans towards one product."""
+    centres = rng.normal(size=(CLUSTERS, DIM))
+    topics = rng.integers(CLUSTERS, size=n)
+    vectors = centres[topics] + spread * rng.normal(size=(n, DIM))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    products = np.where(rng.random(n) < 0.8, topics % len(PRODUCTS), rng.integers(len(PRODUCTS), size=n))
+    return vectors.astype(np.float32), products
+
+
+def build_chroma(path, vectors, products):
+    from langchain_chroma import Chroma
+    store = Chroma(persist_directory=path)
+    for start in range(0, len(vectors), INSERT_BATCH):
+        end = min(start + INSERT_BATCH, len(vectors))
+        store._collection.upsert(
+            ids=[f"chunk-{i}" for i in range(start, end)],
+            embeddings=vectors[start:end].tolist(),
+            documents=[f"synthetic chunk {i}" for i in range(start, end)],
+            metadatas=[{"product": PRODUCTS[p] if p >= 0 else "Other", "issue": "Fees"} for p in products[start:end]],
+        )
+    return store
+
+
+def read_chroma(path):
+    """(vectors, products) of an existing Chroma store, e.g. ./chroma_db after ingestion."""
+    from langchain_chroma import Chroma
+    from snapshots import resolve
+    path = resolve(path)[1] or path  # the published snapshot
+    collection, vectors, products, offset = Chroma(persist_directory=path)._collection, [], [], 0
+    while True:
+        page = collection.get(include=["embeddings", "metadatas"], limit=INSERT_BATCH, offset=offset)
+        if not page["ids"]:
+            break
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        products += [(m or {}).get("product") for m in page["metadatas"]]
+        offset += len(page["ids"])
+    vectors = np.concatenate(vectors)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True), products
+
+
+def exact_top_k(vectors, queries, k, allowed=None):
+    scores = queries @ vectors.T
+    if allowed is not None:
+        scores[:, ~allowed] = -np.inf
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def rss_mb():
+    """(resident, anonymous) MB; the rest is file-backed mmap pages the kernel can drop under pressure."""
+    with open("/proc/self/statm") as f:
+        _, resident, shared = (int(n) for n in f.read().split()[:3])
+    page_mb = os.sysconf("SC_PAGE_SIZE") / 2**20
+    return np.array([resident * page_mb, (resident - shared) * page_mb])
+
+
+def disk_mb(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names) / 2**20
+
+
+def serve(backend, path, queries, k, product):
+    """Runs in a fresh process: loads one backend and answers `queries` (unscoped, then scoped)."""
+    from scope_index import build_filter
+    from langchain_chroma import Chroma
+    from compact_store import CompactVectorStore
+    base = rss_mb()
+    start = time.perf_counter()
+    store = Chroma(persist_directory=path) if backend == "chroma" else CompactVectorStore.load(path)
+    load_ms = 1000 * (time.perf_counter() - start)
+
+    results = {"load_ms": load_ms}
+    for name, where in (("unscoped", None), ("scoped", build_filter([product]))):
+        ids, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            docs = store.similarity_search_by_vector(query.tolist(), k=k, filter=where)
+            latencies.append(1000 * (time.perf_counter() - start))
+            ids.append([int(d.id[len("chunk-"):]) for d in docs])
+        results[name] = {"ids": ids, "p50_ms": np.percentile(latencies[5:], 50),
+                         "p95_ms": np.percentile(latencies[5:], 95)}
+    results["rss_mb"], results["anon_mb"] = rss_mb() - base
+    return results
+
+
+def recall(found, exact):
+    return np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, exact)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact store (float16 / PQ) vs Chroma HNSW")
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--db", help="Use the vectors of this Chroma store instead of synthetic ones")
+    args = parser.parse_args()
+
+    from compact_store import export_compact_store
+    rng = np.random.default_rng(0)
+    path = tempfile.mkdtemp(prefix="bench_compact_")
+    try:
+        if args.db:
+            vectors, products = read_chroma(args.db)
+            products = np.array([PRODUCTS.index(p) if p in PRODUCTS else -1 for p in products])
+        else:
+            vectors, products = make_vectors(args.chunks, rng)
+        # Queries: perturbed chunks, so each has a few close neighbours and many far ones
+        queries = vectors[rng.integers(len(vectors), size=args.queries)]
+        queries = queries + 0.5 * rng.normal(size=queries.shape).astype(np.float32) / np.sqrt(DIM)
+        product = PRODUCTS[2]  # a small product: where a filter matters most
+
+        start = time.perf_counter()
+        store = build_chroma(os.path.join(path, "chroma"), vectors, products)
+        print(f"Indexed {len(vectors)} vectors in Chroma in {time.perf_counter() - start:.1f}s")
+        for mode in ("float16", "pq"):
+            start = time.perf_counter()
+            export_compact_store(store, os.path.join(path, mode), mode=mode)
+            print(f"Exported the {mode} compact store in {time.perf_counter() - start:.1f}s")
+        del store
+
+        exact = {"unscoped": exact_top_k(vectors, queries, args.k),
+                 "scoped": exact_top_k(vectors, queries, args.k, products == PRODUCTS.index(product))}
+        print(f"\n{len(vectors)} chunks, {args.queries} queries, k={args.k}, scoped = {product!r}")
+        print(f"  {'backend':<8} {'load':>8} {'p50':>8} {'p95':>8} {'recall':>7} "
+              f"{'p50 scoped':>11} {'recall scoped':>14} {'RSS':>8} {'anon':>8} {'disk':>8}")
+        for backend in ("chroma", "float16", "pq"):
+            with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+                result = pool.submit(serve, backend, os.path.join(path, backend), queries, args.k, product).result()
+            size = disk_mb(os.path.join(path, backend))
+            print(f"  {backend:<8} {result['load_ms']:6.0f}ms {result['unscoped']['p50_ms']:6.2f}ms "
+                  f"{result['unscoped']['p95_ms']:6.2f}ms {recall(result['unscoped']['ids'], exact['unscoped']):7.1%} "
+                  f"{result['scoped']['p50_ms']:9.2f}ms {recall(result['scoped']['ids'], exact['scoped']):14.1%} "
+                  f"{result['rss_mb']:6.0f}MB {result['anon_mb']:6.0f}MB {size:6.0f}MB")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,155 @@
+# benchmarks/bench_context_budget.py
+"""
+Benchmark: prompt size, encoder latency and answer quality at several context budgets.
+
+Every question gets three retrieved-size complaint chunks (about 200 MiniLM
+tokens each, so the joined prompt overflows flan-t5-base's 512-token
+encoder) with the sentence that answers it buried somewhere inside one
+chunk and a paraphrase of it in another. Each budget builds the prompt with
+rag_pipeline.build_context; budget 0 is the old format_docs join.
+
+Reported per budget:
+  * prompt tokens (generator tokenizer if cached, else the estimate) and
+    the share of prompts the encoder would truncate
+  * evidence kept - share of prompts whose answer sentence survives packing
+    *and* truncation to 512 tokens
+  * with --llm: encoder forward latency, generation time and token F1 of
+    the Flan-T5 answer against a short reference answer
+
+    python benchmarks/bench_context_budget.py --budgets 128 256 384 0
+    python benchmarks/bench_context_budget.py --llm --repeats 3
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from langchain_core.documents import Document
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import rag_pipeline as rp
+from context_builder import ENCODER_MAX_TOKENS
+
+BUDGETS = [128, 192, 256, 384, 0]
+CASES = [  # question, answer sentence, paraphrase in another chunk, reference answer
+    ("Why are customers charged late fees on credit cards?",
+     "The card issuer charged a late fee because the payment posted one day after the due date.",
+     "A late fee was added since my payment posted after the due date.",
+     "the payment posted after the due date"),
+    ("Why are Money Transfers being delayed?",
+     "The transfer was held for a compliance review that took ten business days.",
+     "My money transfer sat in compliance review for ten days.",
+     "a compliance review"),
+    ("What is the issue with Savings Accounts?",
+     "The advertised APY was 2% but the savings account only paid 0.5%.",
+     "My savings account paid far less than the advertised APY.",
+     "the apy paid was lower than advertised"),
+    ("What happens if I pay off my personal loan early?",
+     "Paying the personal loan off early triggered a prepayment penalty that was never disclosed.",
+     "They charged me a prepayment penalty for paying off the loan early.",
+     "a prepayment penalty is charged"),
+    ("Why was my Zelle transfer not refunded?",
+     "The bank refused a refund because the Zelle payment was authorized by me.",
+     "Zelle refunds were denied since I had authorized the payment.",
+     "the payment was authorized"),
+]
+FILLER = [
+    "I have been a customer of this bank for more than ten years.",
+    "I called customer service on XX/XX/XXXX and waited on hold for over an hour.",
+    "The representative transferred me to another department without explanation.",
+    "I sent a written letter to the company and never received a response.",
+    "My account statements do not match the transactions I made that month.",
+    "I asked for a supervisor but was told nobody was available.",
+    "This has caused me a great deal of stress and financial hardship.",
+    "I filed a dispute online and the case was closed the same day.",
+    "The mobile app showed a different balance than the branch did.",
+    "I was promised a call back within 48 hours that never came.",
+    "I have attached copies of my bank statements and the emails I exchanged.",
+    "They keep asking me for the same documents I already provided twice.",
+    "My credit score dropped after they reported the account as delinquent.",
+    "The branch manager said there was nothing she could do about it.",
+]
+
+
+def make_chunks(case, rng, k=rp.TOP_K, sentences=12):
+    """k chunks of filler; the answer sits in a random one, its paraphrase in another."""
+    _, answer, paraphrase, _ = case
+    chunks = [list(rng.choice(FILLER, size=sentences, replace=False)) for _ in range(k)]
+    holder, other = rng.choice(k, size=2, replace=False)
+    chunks[holder].insert(int(rng.integers(sentences)), answer)
+    chunks[other].insert(int(rng.integers(sentences)), paraphrase)
+    return [Document(id=f"chunk-{i}", page_content=" ".join(c), metadata={"complaint_id": 3_000_000 + i})
+            for i, c in enumerate(chunks)]
+
+
+def evidence_kept(prompt, answer, count):
+    """True if `answer` is in the prompt and ends within the encoder window."""
+    end = prompt.find(answer)
+    return end >= 0 and count(prompt[:end + len(answer)]) <= ENCODER_MAX_TOKENS
+
+
+def token_f1(prediction, reference):
+    pred, ref = prediction.lower().split(), reference.lower().split()
+    common = sum(min(pred.count(w), ref.count(w)) for w in set(pred))
+    if not pred or not ref or not common:
+        return 0.0
+    precision, recall = common / len(pred), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def time_encoder(llm, prompt, repeats):
+    """Median ms of one encoder forward pass over the (truncated) prompt."""
+    import torch
+    tokenizer, model = llm.pipeline.tokenizer, llm.pipeline.model
+    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=ENCODER_MAX_TOKENS)
+    encoder = model.get_encoder()
+    times = []
+    with torch.inference_mode():
+        for _ in range(repeats + 1):
+            start = time.perf_counter()
+            encoder(**inputs)
+            times.append(1000 * (time.perf_counter() - start))
+    return float(np.median(times[1:]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Context budget vs encoder latency and answer quality")
+    parser.add_argument("--budgets", type=int, nargs="+", default=BUDGETS, help="0 = join the chunks whole")
+    parser.add_argument("--variants", type=int, default=20, help="Random chunk layouts per question")
+    parser.add_argument("--llm", action="store_true", help="Also time Flan-T5 and score its answers")
+    parser.add_argument("--repeats", type=int, default=3, help="Encoder passes per prompt (with --llm)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    builder = rp.get_context_builder()
+    from chunking import approximate_token_count
+    counter = "estimated" if builder.count is approximate_token_count else "Flan-T5 tokenizer"
+    llm = rp.get_llm() if args.llm else None
+    items = [(case, make_chunks(case, rng)) for case in CASES for _ in range(args.variants)]
+    print(f"{len(items)} prompts ({len(CASES)} questions x {args.variants} layouts), tokens {counter}")
+
+    for budget in args.budgets:
+        tokens, truncated, kept, build_ms, encoder_ms, generate_ms, f1 = [], [], [], [], [], [], []
+        for case, docs in items:
+            question, answer, _, reference = case
+            start = time.perf_counter()
+            prompt = rp.RAG_PROMPT.format(context=rp.build_context(question, docs, budget=budget), question=question)
+            build_ms.append(1000 * (time.perf_counter() - start))
+            n = builder.count(prompt)
+            tokens.append(n)
+            truncated.append(n > ENCODER_MAX_TOKENS)
+            kept.append(evidence_kept(prompt, answer, builder.count))
+            if llm is not None and len(encoder_ms) < len(CASES) * 2:  # latency on a sample, quality on all
+                encoder_ms.append(time_encoder(llm, prompt, args.repeats))
+            if llm is not None:
+                start = time.perf_counter()
+                f1.append(token_f1(llm.invoke(prompt), reference))
+                generate_ms.append(1000 * (time.perf_counter() - start))
+        line = (f"  budget {budget or 'none':>4}: prompt {np.mean(tokens):5.0f} tokens (max {max(tokens)}) | "
+                f"truncated {np.mean(truncated):4.0%} | evidence kept {np.mean(kept):4.0%} | "
+                f"build {np.median(build_ms):.2f} ms")
+        if llm is not None:
+            line += (f" | encoder {np.median(encoder_ms):6.1f} ms | generate {np.median(generate_ms):6.0f} ms"
+                     f" | answer F1 {np.mean(f1):.2f}")
+        print(line)
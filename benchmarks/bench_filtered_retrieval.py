@@ -0,0 +1,123 @@
+# benchmarks/bench_filtered_retrieval.py
+"""
+Benchmark: scoped (metadata-filtered) vs unscoped retrieval.
+
+Builds a throwaway Chroma index of synthetic 384-d vectors in five
+overlapping product clusters, once as the main collection alone (the
+default) and once with per-product partitions (RAG_PRODUCT_PARTITIONS=1 /
+--partitions), then runs the same product-specific queries three ways:
+
+  unscoped  - whole collection, no filter (the old get_retriever)
+  where     - whole collection with a product metadata filter
+  partition - the product's own collection (what search_scope uses)
+
+Reports the build time and on-disk size of both indexes, then latency
+(p50 / p95) and precision@k, i.e. the share of retrieved chunks that
+belong to the asked-about product.
+
+    python benchmarks/bench_filtered_retrieval.py --chunks 20000
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from langchain_chroma import Chroma
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from scope_index import build_filter, partition_name
+from ingestion import upsert_partitioned
+
+PRODUCTS = ["Credit card", "Personal loan", "Student loan", "Checking or savings account",
+            "Money transfer, virtual currency, or money service"]
+DIM = 384           # all-MiniLM-L6-v2
+INSERT_BATCH = 5000
+
+
+def make_vectors(n, spread, rng):
+    """Unit vectors around one centre per product; `spread` controls how much the products overlap."""
+    centres = rng.normal(size=(len(PRODUCTS), DIM))
+    labels = rng.integers(len(PRODUCTS), size=n)
+    vectors = centres[labels] + spread * rng.normal(size=(n, DIM))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return centres, labels, vectors.astype(np.float32)
+
+
+def build_store(path, labels, vectors, partitioned=True):
+    store = Chroma(persist_directory=path, collection_metadata={"hnsw:space": "cosine"})
+    for start in range(0, len(vectors), INSERT_BATCH):
+        end = min(start + INSERT_BATCH, len(vectors))
+        rows = dict(
+            ids=[str(i) for i in range(start, end)],
+            embeddings=vectors[start:end].tolist(),
+            documents=["" for _ in range(start, end)],
+            metadatas=[{"product": PRODUCTS[p]} for p in labels[start:end]],
+        )
+        if partitioned:
+            upsert_partitioned(store, **rows)
+        store._collection.upsert(**rows)
+    return store
+
+
+def disk_mb(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files) / 2**20
+
+
+def search_fn(store, mode):
+    partitions = {}
+
+    def search(product, vector, k):
+        if mode == "partition":
+            if product not in partitions:
+                partitions[product] = Chroma(client=store._client, collection_name=partition_name(product))
+            return partitions[product].similarity_search_by_vector(vector, k=k)
+        where = build_filter([product]) if mode == "where" else None
+        return store.similarity_search_by_vector(vector, k=k, filter=where)
+    return search
+
+
+def run(search, queries, k):
+    latencies, precisions = [], []
+    for product, vector in queries:
+        start = time.perf_counter()
+        docs = search(product, vector.tolist(), k)
+        latencies.append(time.perf_counter() - start)
+        precisions.append(sum(d.metadata["product"] == product for d in docs) / k)
+    ms = 1000 * np.array(latencies)
+    return np.percentile(ms, 50), np.percentile(ms, 95), np.mean(precisions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scoped vs unscoped retrieval benchmark")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--spread", type=float, default=1.0, help="Per-dimension noise; higher = more product overlap")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centres, labels, vectors = make_vectors(args.chunks, args.spread, rng)
+    # Queries sit between their product and a random other one, like a vague question
+    query_labels = rng.integers(len(PRODUCTS), size=args.queries)
+    others = rng.integers(len(PRODUCTS), size=args.queries)
+    queries = [(PRODUCTS[p], 0.55 * centres[p] + 0.45 * centres[o] + args.spread * rng.normal(size=DIM))
+               for p, o in zip(query_labels, others)]
+
+    path = tempfile.mkdtemp(prefix="bench_scope_")
+    try:
+        for partitioned in (False, True):
+            start = time.perf_counter()
+            store = build_store(os.path.join(path, str(partitioned)), labels, vectors, partitioned=partitioned)
+            label = "main + partitions" if partitioned else "main only"
+            print(f"Indexed {args.chunks} chunks ({label}) in {time.perf_counter() - start:.1f}s, "
+                  f"{disk_mb(os.path.join(path, str(partitioned))):.0f} MB on disk")
+        for mode in ("unscoped", "where", "partition"):
+            search = search_fn(store, mode)
+            run(search, queries[:10], args.k)  # warm the HNSW / metadata pages
+            p50, p95, precision = run(search, queries, args.k)
+            print(f"  {mode:<9}: p50 {p50:6.2f} ms | p95 {p95:6.2f} ms | precision@{args.k} {precision:.0%}")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
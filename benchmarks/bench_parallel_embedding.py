@@ -0,0 +1,74 @@
+# benchmarks/bench_parallel_embedding.py
+"""
+Scaling bench for the parallel embedding stage.
+
+Encodes the same synthetic complaint chunks with 1, 2, 4, ... worker
+processes (up to the core count) and prints chunks/sec, speedup and
+parallel efficiency. Pool start-up and model loading are excluded by a
+warm-up call. Run on an ingest box with:
+
+    python benchmarks/bench_parallel_embedding.py --chunks 20000
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from parallel_embedding import ParallelEmbedder
+
+WORDS = ("account bank card charged fee late payment interest credit loan transfer pending "
+         "refund dispute customer service balance overdraft statement called told XXXX").split()
+
+
+def make_chunks(n, seed=0):
+    """Chunk-sized texts with the skewed length mix the 500-char splitter produces."""
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(mean=4.0, sigma=0.6, size=n), 5, 95).astype(int)  # words
+    return [" ".join(rng.choice(WORDS, size=k)) for k in lengths]
+
+
+def worker_counts(max_workers):
+    counts, w = [], 1
+    while w < max_workers:
+        counts.append(w)
+        w *= 2
+    return counts + [max_workers]
+
+
+def run(chunks, workers, sort_by_length):
+    with ParallelEmbedder(workers=workers, torch_threads=1, sort_by_length=sort_by_length) as embedder:
+        embedder.embed_documents(chunks[:workers * 64])  # warm-up: spawn pool, load models
+        embedder.worker_stats.clear()
+        start = time.perf_counter()
+        embedder.embed_documents(chunks)
+        elapsed = time.perf_counter() - start
+        per_worker = [s["chunks_per_sec"] for s in embedder.report().values()]
+    return len(chunks) / elapsed, float(np.mean(per_worker))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--unsorted", action="store_true", help="Disable length-sorted batching")
+    parser.add_argument("--json", help="Optional path to write the results to")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    results, base = [], None
+    print(f"{'workers':>7} {'chunks/s':>10} {'per worker':>11} {'speedup':>8} {'efficiency':>10}")
+    for workers in worker_counts(args.max_workers):
+        total, per_worker = run(chunks, workers, sort_by_length=not args.unsorted)
+        base = base or total
+        speedup = total / base
+        results.append({"workers": workers, "chunks_per_sec": total,
+                        "per_worker_chunks_per_sec": per_worker, "speedup": speedup})
+        print(f"{workers:>7} {total:>10.1f} {per_worker:>11.1f} {speedup:>7.2f}x {speedup / workers:>9.0%}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,117 @@
+# benchmarks/bench_service_load.py
+"""
+Load generator for the async query service (src/rag_service.py).
+
+N closed-loop clients each ask a question, wait for the answer and ask the
+next one. Reports throughput and end-to-end latency p50 / p95 / p99 at 1, 8
+and 32 concurrent clients, with micro-batching on and off (batch size 1).
+
+By default the stages are simulated with the cost shape measured on CPU
+(generation dominates and a padded batch of 8 costs far less than 8 single
+calls), so the bench runs anywhere. --real uses the actual models and
+./chroma_db instead.
+
+    python benchmarks/bench_service_load.py --requests 64
+    python benchmarks/bench_service_load.py --real --clients 1 8 --requests 16
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from contextlib import nullcontext
+import numpy as np
+from langchain_core.documents import Document
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from rag_service import MAX_BATCH_SIZE, PipelineStages, RAGService, ServiceOverloaded
+
+QUESTIONS = [
+    "Why are customers complaining about overdraft fees?",
+    "What are the main issues with Student Loans?",
+    "Are there delays in Money Transfers?",
+    "What is the issue with Savings Accounts?",
+    "What happens if I pay off my loan early?",
+]
+
+
+class SimulatedStages(PipelineStages):
+    """Sleeps for as long as each stage takes on a laptop CPU (Flan-T5-base, MiniLM, Chroma)."""
+
+    EMBED_MS = (8, 1.5)        # fixed, per question
+    RETRIEVE_MS = 6
+    GENERATE_MS = (900, 120)   # fixed, per extra prompt in the padded batch
+
+    def pin(self):
+        return nullcontext()  # no index behind the simulated stages
+
+    def version(self):
+        return None
+
+    def embed(self, questions):
+        time.sleep((self.EMBED_MS[0] + self.EMBED_MS[1] * len(questions)) / 1000)
+        return [[0.0] for _ in questions]
+
+    def aggregate(self, question, product=None, issue=None):
+        return None  # every question goes through retrieval and generation
+
+    def scope(self, question, product=None, issue=None):
+        return {"products": [], "issue": None}
+
+    def cached(self, question, scope, rerank=False):
+        return None
+
+    def store(self, question, scope, result, rerank=False, version=None):
+        pass
+
+    def retrieve(self, question, scope, vector, rerank=False, k=3):
+        time.sleep(self.RETRIEVE_MS / 1000)
+        return [Document(page_content="evidence", id="c1")], {"retrieve_ms": self.RETRIEVE_MS}
+
+    def generate(self, prompts):
+        time.sleep((self.GENERATE_MS[0] + self.GENERATE_MS[1] * (len(prompts) - 1)) / 1000)
+        return ["answer"] * len(prompts)
+
+
+async def run_clients(service, clients, requests_per_client):
+    latencies, rejected = [], 0
+
+    async def client(i):
+        nonlocal rejected
+        for j in range(requests_per_client):
+            question = QUESTIONS[(i + j) % len(QUESTIONS)] + f" ({i}-{j})"  # unique: no cache hits
+            start = time.perf_counter()
+            try:
+                await service.ask(question, use_cache=False)
+            except ServiceOverloaded:
+                rejected += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    return latencies, rejected, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for the RAG query service")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--real", action="store_true", help="Use the real models and ./chroma_db")
+    args = parser.parse_args()
+
+    stages = PipelineStages() if args.real else SimulatedStages()
+    print(f"{'simulated' if not args.real else 'real'} stages, {args.requests} requests per level")
+    for batch_size in (1, MAX_BATCH_SIZE):
+        for clients in args.clients:
+            service = RAGService(stages, max_batch_size=batch_size)
+            per_client = max(1, args.requests // clients)
+            latencies, rejected, elapsed = asyncio.run(run_clients(service, clients, per_client))
+            service.close()
+            ms = 1000 * np.array(latencies)
+            batches = service.stats()["batches"]
+            print(f"  batch<={batch_size} clients={clients:>2}: {len(latencies) / elapsed:6.2f} req/s | "
+                  f"p50 {np.percentile(ms, 50):7.0f} ms | p95 {np.percentile(ms, 95):7.0f} ms | "
+                  f"p99 {np.percentile(ms, 99):7.0f} ms | mean batch {len(latencies) / max(1, batches):4.1f}"
+                  + (f" | rejected {rejected}" if rejected else ""))
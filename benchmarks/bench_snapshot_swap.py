@@ -0,0 +1,139 @@
+# benchmarks/bench_snapshot_swap.py
+"""
+Benchmark: query latency and errors while a new index snapshot is published and swapped in.
+
+Builds a throwaway snapshot of synthetic 384-d vectors (see snapshots.py)
+and serves it through rag_pipeline with a short poll interval. Query
+threads call rp.retrieve in a loop while the main thread writes the next
+snapshot (a copy of the published one plus new chunks) and publishes it.
+
+Reported:
+  * cost of immutability on the ingestion side: copying the published
+    snapshot, and publish() itself
+  * time from publish to the new snapshot serving requests (poll + open +
+    warm-up, done off the request path)
+  * p50 / p95 / max retrieval latency before, while the new snapshot is
+    written (in this process, so it competes for the CPU), around (1 s after
+    publish) and after the swap, failed requests (should be 0) and which
+    versions answered
+  * whether the old snapshot was closed and deleted once idle
+
+    python benchmarks/bench_snapshot_swap.py --chunks 50000 --threads 4
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import numpy as np
+
+os.environ.setdefault("RAG_SNAPSHOT_POLL_S", "0.1")
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import rag_pipeline as rp
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from snapshots import list_snapshots, new_snapshot, publish
+
+DIM = 384           # all-MiniLM-L6-v2
+INSERT_BATCH = 5000
+SETTLE_S = 2.0      # query time before the publish and after the swap
+
+
+def add_vectors(path, start, n, rng):
+    store = Chroma(persist_directory=path)
+    for offset in range(start, start + n, INSERT_BATCH):
+        end = min(offset + INSERT_BATCH, start + n)
+        vectors = rng.normal(size=(end - offset, DIM))
+        store._collection.upsert(
+            ids=[f"chunk-{i}" for i in range(offset, end)],
+            embeddings=(vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).tolist(),
+            documents=[f"synthetic chunk {i}" for i in range(offset, end)],
+            metadatas=[{"product": "Credit card", "issue": "Fees"}] * (end - offset),
+        )
+    store._client.close()
+
+
+def summary(latencies):
+    if not latencies:
+        return "no requests"
+    return (f"{len(latencies):6d} requests | p50 {np.percentile(latencies, 50):6.2f} ms | "
+            f"p95 {np.percentile(latencies, 95):6.2f} ms | max {max(latencies):7.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency during a hot snapshot swap")
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--new-chunks", type=int, default=5_000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    root = tempfile.mkdtemp(prefix="bench_snapshots_")
+    try:
+        version, path = new_snapshot(root)
+        add_vectors(path, 0, args.chunks, rng)
+        publish(root, version)
+        rp.VECTOR_STORE_PATH = root
+        rp.registry.register("embeddings", lambda: DeterministicFakeEmbedding(size=DIM))
+        manager = rp.get_snapshots()
+        print(f"Serving {version} ({args.chunks} chunks), poll every {manager.poll_interval_s}s")
+
+        queries = rng.normal(size=(256, DIM))
+        queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).tolist()
+        scope = {"products": [], "issue": None}
+        records, failures, stop = [], [], threading.Event()
+
+        def client(seed):
+            i = seed
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    with rp.pinned_snapshot() as snapshot:
+                        rp.retrieve("q", scope, hybrid=False, vector=queries[i % len(queries)])
+                    records.append((start, 1000 * (time.perf_counter() - start), snapshot.version))
+                except Exception as e:
+                    failures.append(repr(e))
+                i += args.threads
+
+        rp.retrieve("q", scope, hybrid=False, vector=queries[0])  # opens the first snapshot and its HNSW index
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        time.sleep(SETTLE_S)
+
+        # Ingestion side: copy, write the new chunks, publish
+        start = ingest_at = time.perf_counter()
+        next_version, next_path = new_snapshot(root)
+        copy_s = time.perf_counter() - start
+        add_vectors(next_path, args.chunks, args.new_chunks, rng)
+        start = time.perf_counter()
+        publish(root, next_version)
+        published_at = time.perf_counter()
+        publish_ms = 1000 * (published_at - start)
+        while manager.stats()["version"] != next_version and time.perf_counter() - published_at < 60:
+            time.sleep(0.005)
+        swapped_at = time.perf_counter()
+        time.sleep(SETTLE_S)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        print(f"Copy of the published snapshot: {copy_s:.2f}s; publish: {publish_ms:.2f} ms; "
+              f"serving the new snapshot {swapped_at - published_at:.2f}s after publish")
+        windows = {"before": lambda t: t < ingest_at,
+                   "ingest": lambda t: ingest_at <= t < published_at,  # same process and CPUs as the queries
+                   "around": lambda t: published_at <= t < published_at + 1.0,
+                   "after": lambda t: t >= published_at + 1.0}
+        for name, in_window in windows.items():
+            print(f"  {name:<6}: {summary([ms for t, ms, _ in records if in_window(t)])}")
+        answered = {v: sum(1 for *_, seen in records if seen == v) for v in (version, next_version)}
+        print(f"  failed requests: {len(failures)}" + (f" (first: {failures[0]})" if failures else ""))
+        print(f"  answered by {version}: {answered[version]}, by {next_version}: {answered[next_version]}")
+        stats = manager.stats()
+        print(f"  retired snapshots still open: {stats['retired']}; on disk: {list_snapshots(root)}")
+        manager.stop()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
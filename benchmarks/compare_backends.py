@@ -0,0 +1,153 @@
+# benchmarks/compare_backends.py
+"""
+Accuracy vs latency for the inference backends (torch / int8 / onnx), CPU only.
+
+Each backend runs in a fresh process, so load time and peak memory are its own:
+  * MiniLM  - encodes the same chunks; reports chunks/sec and the cosine
+              between each vector and the fp32 torch vector (drift)
+  * Flan-T5 - answers the same RAG prompts with llm.batch(); reports
+              seconds/answer and agreement with the torch answers
+              (exact match and token F1)
+
+Chunks come from ./chroma_db when it exists, otherwise from a built-in sample.
+
+    python benchmarks/compare_backends.py --backends torch int8 onnx --chunks 512
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import resource
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'src'))
+
+from inference_backends import BACKENDS
+
+SAMPLE_CHUNKS = [
+    "I was charged a late fee even though I paid on time. This is unfair.",
+    "The interest rate on my credit card jumped to 25% without notice.",
+    "My transfer to Kenya is stuck pending for 5 days and nobody can tell me why.",
+    "Hidden exchange rate fees on my money transfer were too high.",
+    "The advertised APY was 2% but I only got 0.5% on my savings account.",
+    "A prepayment penalty on my personal loan was never disclosed.",
+    "I sent money with Zelle to the wrong person and the bank refuses to help.",
+    "Overdraft fees were charged twice for the same transaction.",
+]
+QUESTIONS = [
+    "What are the complaints about Credit Cards?",
+    "Why are Money Transfers being delayed?",
+    "What is the issue with Savings Accounts?",
+    "What happens if I pay off my loan early?",
+]
+
+
+def load_chunks(n):
+    from snapshots import resolve
+    _, path = resolve(os.path.join(ROOT, "chroma_db"))  # the published snapshot
+    if path is not None:
+        from langchain_chroma import Chroma
+        texts = Chroma(persist_directory=path).get(include=["documents"], limit=n)["documents"]
+        if texts:
+            return texts
+    return (SAMPLE_CHUNKS * (n // len(SAMPLE_CHUNKS) + 1))[:n]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def run_backend(backend, chunks, with_llm):
+    """Runs in a child process: loads both models on `backend` and times them."""
+    from inference_backends import load_embeddings
+    from embedding_cache import EMBEDDING_MODEL_NAME
+    result = {"backend": backend}
+
+    start = time.perf_counter()
+    embedder = load_embeddings(EMBEDDING_MODEL_NAME, backend)
+    embedder.embed_documents(chunks[:8])  # warm-up
+    result["embed_load_s"] = time.perf_counter() - start
+    start = time.perf_counter()
+    result["vectors"] = np.asarray(embedder.embed_documents(chunks), dtype=np.float32)
+    result["chunks_per_sec"] = len(chunks) / (time.perf_counter() - start)
+
+    if with_llm:
+        from local_llm import load_llm
+        from rag_pipeline import RAG_PROMPT
+        context = "\n\n".join(SAMPLE_CHUNKS[:4])
+        prompts = [RAG_PROMPT.format(context=context, question=q) for q in QUESTIONS]
+        start = time.perf_counter()
+        llm = load_llm(backend=backend)
+        llm.invoke(prompts[0])  # warm-up
+        result["llm_load_s"] = time.perf_counter() - start
+        start = time.perf_counter()
+        result["answers"] = [a.strip() for a in llm.batch(prompts)]
+        result["s_per_answer"] = (time.perf_counter() - start) / len(prompts)
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def token_f1(prediction, reference):
+    pred, ref = prediction.lower().split(), reference.lower().split()
+    common = sum(min(pred.count(w), ref.count(w)) for w in set(pred))
+    if not pred or not ref or not common:
+        return 1.0 if pred == ref else 0.0
+    precision, recall = common / len(pred), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def cosine(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare torch / int8 / onnx inference on CPU")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--skip-llm", action="store_true", help="Only compare the embedder")
+    parser.add_argument("--json", help="Optional path to write the results to")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.chunks)
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]  # torch is the reference
+    results = {}
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+            results[backend] = pool.submit(run_backend, backend, chunks, not args.skip_llm).result()
+
+    reference = results["torch"]
+    report = {}
+    print(f"{len(chunks)} chunks, {len(QUESTIONS)} questions")
+    for backend, r in results.items():
+        drift = cosine(r["vectors"], reference["vectors"])
+        row = {
+            "chunks_per_sec": r["chunks_per_sec"],
+            "embed_load_s": r["embed_load_s"],
+            "cosine_mean": float(drift.mean()),
+            "cosine_min": float(drift.min()),
+            "peak_rss_mb": r["peak_rss_mb"],
+        }
+        line = (f"{backend:>6} | MiniLM {r['chunks_per_sec']:7.1f} chunks/s, cosine vs torch "
+                f"mean {row['cosine_mean']:.5f} min {row['cosine_min']:.5f}")
+        if "answers" in r:
+            row.update(
+                s_per_answer=r["s_per_answer"],
+                llm_load_s=r["llm_load_s"],
+                exact_match=float(np.mean([a == b for a, b in zip(r["answers"], reference["answers"])])),
+                token_f1=float(np.mean([token_f1(a, b) for a, b in zip(r["answers"], reference["answers"])])),
+            )
+            line += (f" | Flan-T5 {r['s_per_answer']:.2f} s/answer, agreement exact {row['exact_match']:.0%} "
+                     f"F1 {row['token_f1']:.2f}")
+        print(line + f" | peak RSS {r['peak_rss_mb']:.0f} MB")
+        report[backend] = row
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,243 @@
+# benchmarks/run_benchmarks.py
+"""
+Reproducible performance suite: the ingestion stages and the query path on
+synthetic CFPB-shaped data (see benchmarks/synthetic_cfpb.py). Offline and CPU only.
+
+Each size (10k / 100k / 1m rows) runs in a fresh process, so peak RSS is its own:
+  * ingestion - the CSV goes through the real stages (csv_load, filter,
+    sample, chunk, embed, upsert, index_build) into a throwaway Chroma dir
+  * query     - QUESTIONS go through resolve_scope, hybrid retrieve at a
+                fixed k and build_prompt (plus Flan-T5 with --llm)
+Stage times come from the telemetry spans (src/telemetry.py). Embedding and
+the Chroma upsert overlap (background writer), so on few cores the stage
+times include contention and add up to more than ingest.total_ms.
+
+Embedding uses a hashing embedder by default, so nothing is downloaded and
+timings do not depend on the network; --embedder minilm uses the real model
+(it must already be in the local Hugging Face cache).
+
+Results are compared with benchmarks/baseline.json: a time or memory figure
+more than REGRESSION_TOLERANCE above the baseline (or a throughput that much
+below it) is flagged, and --check exits with status 1.
+
+    python benchmarks/run_benchmarks.py --sizes 10k 100k
+    python benchmarks/run_benchmarks.py --sizes 10k --update-baseline
+    python benchmarks/run_benchmarks.py --sizes 10k --check
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'src'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_cfpb import ensure_csv
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+REGRESSION_TOLERANCE = 0.20
+NOISE_FLOOR = {"_ms": 5.0, "_mb": 25.0}   # smaller absolute changes are never flagged
+QUERY_K = 3
+TOKEN_COUNTER = "approx"
+QUESTIONS = [
+    "Why are customers complaining about overdraft fees?",
+    "What are the main issues with Student Loans?",
+    "Are there delays in Money Transfers?",
+    "What is the issue with Savings Accounts?",
+    "What happens if I pay off my personal loan early?",
+    "Why was my Zelle transfer not refunded?",
+    "Complaints about late fees on credit cards",
+    "Is the APY on savings accounts lower than advertised?",
+]
+
+
+class HashingEmbeddings(Embeddings):
+    """Offline stand-in for MiniLM: hashed word and bigram counts, l2-normalised, 384 dims."""
+
+    def __init__(self, dim=384):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        self.vectorizer = HashingVectorizer(n_features=dim, ngram_range=(1, 2), alternate_sign=False)
+
+    def embed_documents(self, texts):
+        return self.vectorizer.transform(list(texts)).toarray().astype(np.float32).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def load_embedder(name):
+    if name == "hashing":
+        return HashingEmbeddings()
+    from inference_backends import load_embeddings
+    from embedding_cache import EMBEDDING_MODEL_NAME
+    return load_embeddings(EMBEDDING_MODEL_NAME, "torch")
+
+
+def span_metrics(report, prefix, fields):
+    return {f"{name}.{field}": stats[field] for name, stats in report["spans"].items()
+            if name.startswith(prefix) for field in fields}
+
+
+def run_size(csv_path, rows, embedder, k, repeats, with_llm, chunk_workers):
+    """Runs in a child process: ingests `csv_path` into a temp dir, then times the query path."""
+    import rag_pipeline as rp
+    from langchain_chroma import Chroma
+    from chunking import ChunkDeduplicator, iter_record_chunks
+    from ingestion import (SAMPLE_SIZE, iter_filtered_chunks, iter_records, mark_index_updated,
+                           stratified_reservoir_sample, sync_chunks, update_metadata)
+    from lexical_index import LexicalIndexBuilder
+    from scope_index import ScopeIndex
+    from telemetry import peak_rss_mb, span, telemetry
+
+    embeddings = load_embedder(embedder)
+    path = tempfile.mkdtemp(prefix="bench_suite_")
+    try:
+        # 1. Ingestion, stage by stage
+        telemetry.reset()
+        start = time.perf_counter()
+        sampled_df, counts = stratified_reservoir_sample(iter_filtered_chunks(csv_path), SAMPLE_SIZE)
+        dedup, scope, lexical = ChunkDeduplicator(), ScopeIndex(), LexicalIndexBuilder()
+        # Token-sized like run_ingestion, with the estimate rather than the MiniLM tokenizer: chunk
+        # counts must not depend on the local HF cache
+        chunks = iter_record_chunks(iter_records(sampled_df), workers=chunk_workers, mode="tokens",
+                                    token_counter=TOKEN_COUNTER)
+        chunks = lexical.observe(scope.observe(dedup.observe(chunks)))
+        store = Chroma(persist_directory=path, embedding_function=embeddings)
+        _, _, total = sync_chunks(store, chunks)
+        with span("ingest.dedup_metadata"):
+            update_metadata(store, dedup.metadata_updates(stored=set()))
+        with span("ingest.index_build"):
+            scope.save(path)
+            lexical.build().save(path)
+        mark_index_updated(path)
+        ingest_s = time.perf_counter() - start
+        metrics = span_metrics(telemetry.snapshot(), "ingest.", ["total_ms"])
+        metrics.update({"ingest.total_ms": 1000 * ingest_s, "ingest.rows_per_s": rows / ingest_s,
+                        "ingest.chunks_per_s": total / ingest_s})
+        info = {"rows": rows, "filtered_rows": int(counts.sum()), "sampled_rows": len(sampled_df),
+                "token_counter": TOKEN_COUNTER, "chunks": total, "duplicate_chunks": dedup.stats()["dropped_exact"] + dedup.stats()["dropped_near"]}
+
+        # 2. Query path at fixed k
+        rp.VECTOR_STORE_PATH = path  # served in place (no snapshots), opened on the first question
+        rp.registry.register("embeddings", lambda: embeddings)
+        llm = rp.get_llm() if with_llm else None
+
+        def ask(question):
+            with span("query.path"):
+                with span("query.scope"):
+                    scope = rp.resolve_scope(question)
+                docs = rp.retrieve(question, scope, k=k)["docs"]
+                prompt = rp.build_prompt(question, docs)
+                if llm is not None:
+                    with span("query.generate"):
+                        llm.invoke(prompt)
+
+        for question in QUESTIONS:  # warm-up: partitions, BM25 index, thread pool
+            ask(question)
+        telemetry.reset()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for question in QUESTIONS:
+                ask(question)
+        metrics.update(span_metrics(telemetry.snapshot(), "query.", ["p50_ms", "p95_ms"]))
+        metrics["query.qps_per_s"] = repeats * len(QUESTIONS) / (time.perf_counter() - start)
+        metrics["peak_rss_mb"] = peak_rss_mb()
+        return info, metrics
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def compare(metrics, baseline, tolerance=REGRESSION_TOLERANCE):
+    """{name: relative change} for every metric that got worse by more than `tolerance`."""
+    regressions = {}
+    for name, value in metrics.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        change = (value - base) / base
+        if name.endswith("_per_s"):  # throughput: lower is worse
+            if -change > tolerance:
+                regressions[name] = change
+            continue
+        floor = next((f for suffix, f in NOISE_FLOOR.items() if name.endswith(suffix)), 0.0)
+        if change > tolerance and value - base > floor:
+            regressions[name] = change
+    return regressions
+
+
+def machine_info():
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def print_report(key, info, metrics, regressions, baseline):
+    print(f"\n== {key}: {info['rows']} rows -> {info['filtered_rows']} relevant -> "
+          f"{info['sampled_rows']} sampled -> {info['chunks']} chunks")
+    for name, value in metrics.items():
+        base = baseline.get(name)
+        unit = "/s" if name.endswith("_per_s") else " MB" if name.endswith("_mb") else " ms"
+        line = f"  {name:<28} {value:12.1f}{unit}"
+        if base:
+            line += f"   baseline {base:10.1f} ({(value - base) / base:+.0%})"
+        if name in regressions:
+            line += "   ⚠️ REGRESSION"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestion + query benchmark suite on synthetic CFPB data")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["10k"])
+    parser.add_argument("--embedder", choices=["hashing", "minilm"], default="hashing")
+    parser.add_argument("--k", type=int, default=QUERY_K)
+    parser.add_argument("--repeats", type=int, default=10, help="Passes over QUESTIONS")
+    parser.add_argument("--llm", action="store_true", help="Also time Flan-T5 generation")
+    parser.add_argument("--chunk-workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 on any regression")
+    args = parser.parse_args()
+
+    saved = {"machine": {}, "results": {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+    if saved["machine"] and saved["machine"] != machine_info():
+        print(f"⚠️ Baseline was recorded on {saved['machine']}; this is {machine_info()}.")
+
+    failed = False
+    for size in args.sizes:
+        rows = SIZES[size]
+        start = time.perf_counter()
+        csv_path = ensure_csv(rows, args.seed)
+        print(f"Synthetic CSV for {size}: {csv_path} ({time.perf_counter() - start:.1f}s)")
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+            info, metrics = pool.submit(run_size, csv_path, rows, args.embedder, args.k, args.repeats,
+                                        args.llm, args.chunk_workers).result()
+        key = f"{size}/{args.embedder}/k{args.k}" + ("/llm" if args.llm else "")
+        baseline = saved["results"].get(key, {}).get("metrics", {})
+        regressions = compare(metrics, baseline, args.tolerance)
+        print_report(key, info, metrics, regressions, baseline)
+        failed = failed or bool(regressions)
+        if args.update_baseline:
+            saved["results"][key] = {"info": info, "metrics": metrics}
+
+    if args.update_baseline:
+        saved["machine"] = machine_info()
+        with open(args.baseline, "w") as f:
+            json.dump(saved, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+    elif failed:
+        print(f"\n⚠️ Regressions above {args.tolerance:.0%} against {args.baseline}")
+        if args.check:
+            sys.exit(1)
@@ -0,0 +1,129 @@
+# benchmarks/synthetic_cfpb.py
+"""
+Synthetic complaint CSVs shaped like the CFPB export, for offline benchmarks.
+
+Same 18 columns as the real file. About 45% of rows belong to products
+outside TARGET_PRODUCTS (credit reporting, debt collection, mortgages),
+so the ingestion filter has real work to do. About 60% of rows have no
+narrative. Target products are skewed like the real data: credit cards
+are more than 10x student loans. Narrative lengths are log-normal, with a
+median of about 1,000 characters, a long tail to 10k, and XXXX redactions.
+
+Rows are generated and written in blocks, so a 1M-row file (~1.3 GB)
+never sits in memory. Files are cached by size and seed.
+
+    python benchmarks/synthetic_cfpb.py --rows 100000 --out data/synthetic/complaints_100k.csv
+"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+BLOCK_ROWS = 50_000
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "synthetic")
+
+# Share of all rows, per product (the first six are ingestion.TARGET_PRODUCTS)
+PRODUCT_SHARES = {
+    "Credit card or prepaid card": 0.20,
+    "Checking or savings account": 0.12,
+    "Credit card": 0.07,
+    "Money transfer, virtual currency, or money service": 0.06,
+    "Personal loan": 0.025,
+    "Student loan": 0.015,
+    "Credit reporting, credit repair services, or other personal consumer reports": 0.30,
+    "Debt collection": 0.12,
+    "Mortgage": 0.09,
+}
+NARRATIVE_RATE = 0.40
+ISSUES = {
+    "Credit card or prepaid card": ["Problem with a purchase shown on your statement", "Fees or interest",
+                                    "Getting a credit card", "Closing your account"],
+    "Credit card": ["Billing disputes", "Late fee", "APR or interest rate", "Identity theft / Fraud / Embezzlement"],
+    "Checking or savings account": ["Managing an account", "Problem caused by your funds being low",
+                                    "Opening an account", "Closing an account"],
+    "Money transfer, virtual currency, or money service": ["Fraud or scam", "Money was not available when promised",
+                                                           "Other transaction problem"],
+    "Personal loan": ["Struggling to pay your loan", "Charged fees or interest you didn't expect",
+                      "Getting the loan"],
+    "Student loan": ["Dealing with your lender or servicer", "Struggling to repay your loan"],
+}
+OTHER_ISSUES = ["Incorrect information on your report", "Attempts to collect debt not owed",
+                "Trouble during payment process"]
+COMPANIES = ["BANK OF AMERICA, NATIONAL ASSOCIATION", "WELLS FARGO & COMPANY", "JPMORGAN CHASE & CO.",
+             "CITIBANK, N.A.", "CAPITAL ONE FINANCIAL CORPORATION", "Navient Solutions, LLC.", "PayPal Holdings, Inc."]
+STATES = ["CA", "TX", "FL", "NY", "GA", "IL", "PA", "OH", "NC", "MI"]
+WORDS = ("i my account bank card charged fee late payment interest credit loan transfer pending refund "
+         "dispute customer service balance overdraft statement called told them they the was and to on "
+         "for not have been months days XXXX XX/XX/XXXX zelle apy escrow rate money sent received").split()
+COLUMNS = ["Date received", "Product", "Sub-product", "Issue", "Sub-issue", "Consumer complaint narrative",
+           "Company public response", "Company", "State", "ZIP code", "Tags", "Consumer consent provided?",
+           "Submitted via", "Date sent to company", "Company response to consumer", "Timely response?",
+           "Consumer disputed?", "Complaint ID"]
+
+
+def narrative(rng, chars):
+    sentences, total = [], 0
+    while total < chars:
+        sentence = " ".join(rng.choice(WORDS, size=int(rng.integers(6, 20)))).capitalize() + "."
+        sentences.append(sentence)
+        total += len(sentence) + 1
+    return " ".join(sentences)[:chars]
+
+
+def make_block(rng, start_id, rows):
+    """One DataFrame block of `rows` synthetic complaints with ids from `start_id`."""
+    names = list(PRODUCT_SHARES)
+    shares = np.array(list(PRODUCT_SHARES.values()))
+    products = rng.choice(names, size=rows, p=shares / shares.sum())
+    has_text = rng.random(rows) < NARRATIVE_RATE
+    lengths = np.clip(rng.lognormal(mean=6.9, sigma=0.75, size=rows), 40, 10_000).astype(int)
+    days = rng.integers(0, 5 * 365, size=rows)
+    received = pd.Timestamp("2020-01-01") + pd.to_timedelta(days, unit="D")
+    return pd.DataFrame({
+        "Date received": received.strftime("%Y-%m-%d"),
+        "Product": products,
+        "Sub-product": "General-purpose credit card or charge card",
+        "Issue": [rng.choice(ISSUES.get(p, OTHER_ISSUES)) for p in products],
+        "Sub-issue": "",
+        "Consumer complaint narrative": [narrative(rng, n) if t else None for t, n in zip(has_text, lengths)],
+        "Company public response": "Company has responded to the consumer and the CFPB",
+        "Company": rng.choice(COMPANIES, size=rows),
+        "State": rng.choice(STATES, size=rows),
+        "ZIP code": rng.integers(10_000, 99_999, size=rows).astype(str),
+        "Tags": "",
+        "Consumer consent provided?": np.where(has_text, "Consent provided", "Consent not provided"),
+        "Submitted via": "Web",
+        "Date sent to company": (received + pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
+        "Company response to consumer": "Closed with explanation",
+        "Timely response?": "Yes",
+        "Consumer disputed?": "N/A",
+        "Complaint ID": np.arange(start_id, start_id + rows),
+    }, columns=COLUMNS)
+
+
+def write_csv(path, rows, seed=0, block_rows=BLOCK_ROWS):
+    """Writes `rows` synthetic complaints to `path`, block by block (deterministic for a seed)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    rng = np.random.default_rng(seed)
+    tmp_path = path + ".tmp"
+    for start in range(0, rows, block_rows):
+        block = make_block(rng, 1_000_000 + start, min(block_rows, rows - start))
+        block.to_csv(tmp_path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def ensure_csv(rows, seed=0, data_dir=DATA_DIR):
+    """Path of the cached synthetic CSV for (rows, seed), generating it on first use."""
+    path = os.path.join(data_dir, f"complaints_{rows}_seed{seed}.csv")
+    return path if os.path.exists(path) else write_csv(path, rows, seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic CFPB-shaped complaints CSV")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Output path (default: data/synthetic/complaints_<rows>_seed<seed>.csv)")
+    args = parser.parse_args()
+    path = write_csv(args.out, args.rows, args.seed) if args.out else ensure_csv(args.rows, args.seed)
+    print(f"Wrote {args.rows} rows to {path} ({os.path.getsize(path) / 2**20:.0f} MB)")
@@ -1,50 +1,176 @@
+import os
+import time
+import asyncio
+import argparse
 import pandas as pd
-from src.rag_pipeline import get_rag_chain
+from src.rag_pipeline import get_vectorstore
+from src.rag_service import MAX_PENDING, RAGService
 
-def run_evaluation():
+GOLD_PATH = "data/gold_questions.csv"
+RESULTS_PATH = "rag_evaluation_results.csv"
+TOP_K = 3
+SEARCH_WORKERS = 8
+EVAL_DEADLINE_S = 30 * 60  # the whole gold set is queued at once
+
+# Used when no gold file is available
+DEFAULT_QUESTIONS = [
+    "What are the complaints about Credit Cards?",
+    "Why are Money Transfers being delayed?",
+    "What is the issue with Savings Accounts?",
+    "Do customers like the Customer Service?",
+    "What happens if I pay off my loan early?"
+]
+
+def load_gold_set(path=GOLD_PATH):
+    """
+    Gold questions as a DataFrame with `question`, `reference_answer` and
+    `expected_complaint_ids` (list). Reads CSV (ids separated by ';') or JSONL.
+    """
+    if not os.path.exists(path):
+        print(f"⚠️ Gold file not found at {path}. Using the built-in questions.")
+        gold = pd.DataFrame({"question": DEFAULT_QUESTIONS})
+    elif path.endswith(".jsonl"):
+        gold = pd.read_json(path, lines=True)
+    else:
+        gold = pd.read_csv(path, dtype=str)
+
+    if "reference_answer" not in gold:
+        gold["reference_answer"] = ""
+    if "expected_complaint_ids" not in gold:
+        gold["expected_complaint_ids"] = None
+    gold["reference_answer"] = gold["reference_answer"].fillna("")
+    gold["expected_complaint_ids"] = gold["expected_complaint_ids"].map(_parse_ids)
+    return gold
+
+def _parse_ids(value):
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    if not isinstance(value, str) or not value.strip():
+        return []
+    return [v.strip() for v in value.split(";") if v.strip()]
+
+def token_f1(prediction, reference):
+    """Bag-of-words F1 between the generated and the reference answer."""
+    pred, ref = prediction.lower().split(), reference.lower().split()
+    common = sum(min(pred.count(w), ref.count(w)) for w in set(pred))
+    if not pred or not ref or not common:
+        return 0.0
+    precision, recall = common / len(pred), common / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+def hit_at_k(retrieved_ids, expected_ids):
+    """True if any expected complaint was retrieved; None if the row has no expected IDs."""
+    if not expected_ids:
+        return None
+    return any(i in expected_ids for i in retrieved_ids)
+
+def retrieved_complaint_ids(docs):
+    """Complaints the retrieved chunks stand for: a deduplicated chunk lists all of them in complaint_ids."""
+    ids = []
+    for doc in docs:
+        listed = doc.metadata.get("complaint_ids") or str(doc.metadata.get("complaint_id", ""))
+        ids.extend(i for i in listed.split(",") if i not in ids)
+    return ids
+
+def _amortized(timings, key, size_key="batch_size"):
+    """A batch-wide stage time divided by the number of questions sharing it (None if the stage did not run)."""
+    if timings.get(key) is None:
+        return None
+    return timings[key] / (timings.get(size_key) or 1)
+
+async def _ask_all(service, questions, k, rerank):
+    # Every question is submitted at once; the service micro-batches them (and never answers
+    # from the aggregate store: this evaluates retrieval + generation)
+    return await asyncio.gather(*(service.ask(q, k=k, rerank=rerank, use_cache=False, aggregates=False)
+                                  for q in questions), return_exceptions=True)
+
+def run_evaluation(gold_path=GOLD_PATH, k=TOP_K, search_workers=SEARCH_WORKERS, output_path=RESULTS_PATH,
+                   rerank=False, batch_size=None):
     print("--- STARTING RAG EVALUATION (Free Mode) ---")
-    
-    # 1. Initialize the Chain
+
+    # 1. Initialize the components (the answer cache is bypassed on purpose)
     try:
-        chain = get_rag_chain()
+        vectorstore = get_vectorstore()
     except Exception as e:
-        print(f"Error initializing RAG Chain: {e}")
+        print(f"Error initializing RAG components: {e}")
+        return
+    if vectorstore is None:
         return
 
-    # 2. Define the Test Questions
-    test_questions = [
-        "What are the complaints about Credit Cards?",
-        "Why are Money Transfers being delayed?",
-        "What is the issue with Savings Accounts?",
-        "Do customers like the Customer Service?",
-        "What happens if I pay off my loan early?"
-    ]
+    # 2. Load the Gold Questions
+    gold = load_gold_set(gold_path)
+    questions = gold["question"].tolist()
+    n = len(questions)
+    print(f"\nThinking about {n} questions... (This may take a moment on your CPU)\n")
 
+    # 3. Ask them through the query service, like the app does. The whole set is one batch by default:
+    # one embedding call for every question, and llm.batch() splits generation into padded passes
+    service = RAGService(max_batch_size=batch_size or n, search_workers=search_workers,
+                         max_pending=max(n, MAX_PENDING), default_deadline_s=EVAL_DEADLINE_S)
+    run_start = time.perf_counter()
+    try:
+        answers = asyncio.run(_ask_all(service, questions, k, rerank))
+    finally:
+        service.close()
+    total_s = time.perf_counter() - run_start
+
+    # 4. Score & collect
     results = []
+    for row, result in zip(gold.itertuples(), answers):
+        if isinstance(result, Exception):
+            print(f"Q: {row.question}\n❌ {type(result).__name__}: {result}\n")
+            result = {"docs": [], "answer": "", "timings": {}}
+        answer, timings = result["answer"], result["timings"]
+        retrieved_ids = retrieved_complaint_ids(result["docs"])
+        expected = row.expected_complaint_ids
+        results.append({
+            "Question": row.question,
+            "Generated Answer": answer,
+            "Reference Answer": row.reference_answer,
+            "Answer F1": token_f1(answer, row.reference_answer) if row.reference_answer else None,
+            "Retrieved Complaint IDs": ";".join(retrieved_ids),
+            f"Hit@{k}": hit_at_k(retrieved_ids, expected),
+            "Queue ms": timings.get("queue_ms"),
+            "Search ms": timings.get("retrieve_ms"),
+            "Rerank ms": timings.get("rerank_ms", 0.0),
+            # Embedding and generation run once per batch: the batch time split evenly over its questions
+            "Embed ms (amortized)": _amortized(timings, "embed_ms"),
+            "Generate ms (amortized)": _amortized(timings, "generate_ms", "generate_batch_size"),
+            "Batch size": timings.get("batch_size"),
+        })
+        print(f"Q: {row.question}\nA: {answer}\n")
 
-    # 3. Ask the Questions
-    print("\nThinking... (This may take a moment on your CPU)\n")
-    
-    for q in test_questions:
-        print(f"Asking: {q}...")
-        try:
-            # Run the RAG pipeline
-            answer = chain.invoke(q)
-            
-            # Save result
-            results.append({
-                "Question": q,
-                "Generated Answer": answer
-            })
-            print(f"Answer: {answer}\n")
-            
-        except Exception as e:
-            print(f"Failed: {e}")
-
-    # 4. Save results to CSV
     df = pd.DataFrame(results)
-    df.to_csv("rag_evaluation_results.csv", index=False)
-    print("\n✅ Evaluation Complete. Results saved to 'rag_evaluation_results.csv'")
+
+    # 5. Report
+    stats = service.stats()
+    print(f"Stage means per question: search {df['Search ms'].mean():.0f} ms | rerank {df['Rerank ms'].mean():.0f} ms "
+          f"| embed {df['Embed ms (amortized)'].mean():.0f} ms | generate {df['Generate ms (amortized)'].mean():.0f} ms "
+          f"(embed / generate amortized over each batch)")
+    print(f"Throughput: {n / total_s:.2f} questions/sec ({n} questions in {total_s:.1f}s, "
+          f"{stats['batches']} batches)")
+    scored = df[f"Hit@{k}"].dropna()
+    if len(scored):
+        print(f"Retrieval hit@{k}: {scored.mean():.0%} over {len(scored)} questions with expected complaint IDs")
+    else:
+        print(f"Retrieval hit@{k}: not scored, no question in {gold_path} has expected_complaint_ids")
+    if df["Answer F1"].notna().any():
+        print(f"Mean answer F1 vs reference: {df['Answer F1'].mean():.2f} "
+              f"over {df['Answer F1'].notna().sum()} questions with a reference answer")
+
+    # 6. Save results to CSV
+    df.to_csv(output_path, index=False)
+    print(f"\n✅ Evaluation Complete. Results saved to '{output_path}'")
+    return df
 
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Evaluate the RAG pipeline against a gold question set.")
+    parser.add_argument("--gold", default=GOLD_PATH, help="CSV or JSONL with question/reference_answer/expected_complaint_ids")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--workers", type=int, default=SEARCH_WORKERS, help="Concurrent vector searches")
+    parser.add_argument("--batch-size", type=int, help="Questions per service batch (default: all of them)")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--rerank", action="store_true", help="Re-rank a wider candidate pool with the cross-encoder")
+    args = parser.parse_args()
+    run_evaluation(args.gold, k=args.k, search_workers=args.workers, output_path=args.output, rerank=args.rerank,
+                   batch_size=args.batch_size)
@@ -6,7 +6,8 @@ import sys
 # Add 'src' to python path to ensure imports work
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from ingestion import perform_stratified_split, chunk_documents
+from ingestion import perform_stratified_split
+from chunking import chunk_documents
 from rag_engine import generate_answer_safe
 
 def create_dummy_data():
@@ -49,8 +50,8 @@ def run_ingestion_pipeline():
     # Convert DataFrame to a format LangChain likes (list of Document objects)
     from langchain_core.documents import Document
     documents = [
-        Document(page_content=row['text'], metadata={"category": row['risk_category']}) 
-        for _, row in kb_df.iterrows()
+        Document(page_content=text, metadata={"category": category})
+        for text, category in zip(kb_df['text'].tolist(), kb_df['risk_category'].tolist())
     ]
     
     chunks = chunk_documents(documents)
@@ -60,10 +61,10 @@ def run_ingestion_pipeline():
 def run_rag_test():
     print("--- TESTING RAG ENGINE ---")
     # This is a mock test to see if the imports work. 
-    # Real generation requires an OpenAI Key.
+    # Generation runs on the local Flan-T5; OpenAI is only needed for a hosted model.
     try:
         print("RAG Engine imports are successful.")
-        print("To run a real query, ensure OPENAI_API_KEY is set in your environment.")
+        print("Retries, circuit breaker and evidence-only fallback are configured in src/rag_engine.py.")
     except Exception as e:
         print(f"Error: {e}")
 
@@ -1,15 +1,23 @@
 # mock_ingestion.py
 import os
-import shutil
-from langchain_huggingface import HuggingFaceEmbeddings
+import pandas as pd
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from src.embedding_cache import EMBEDDING_MODEL_NAME, load_embedding_model
+from src.inference_backends import EMBED_BACKEND, EmbedderMismatch, check_index_embedder, index_embedder
+from src.ingestion import CHUNK_MODE, close_client, sync_chunks, mark_index_updated, update_metadata
+from src.chunking import TOKEN_COUNTER, ChunkDeduplicator, default_token_counter, get_text_splitter, iter_chunks
+from src.scope_index import ScopeIndex
+from src.lexical_index import LexicalIndexBuilder
+from src.aggregates import AGGREGATES_FILE, AggregateBuilder, pyarrow
+from src.compact_store import export_compact_store, read_manifest
+from src.snapshots import (
+    collect_garbage, current_version, discard, new_snapshot, publish, read_index_meta, resolve, write_index_meta
+)
 
-def create_mock_database():
-    # Clear old db
-    if os.path.exists("./chroma_db"):
-        shutil.rmtree("./chroma_db")
+DB_PATH = "./chroma_db"
 
+def create_mock_database():
     # Fake CrediTrust Data
     complaints = [
         "Credit Card: I was charged a late fee even though I paid on time. This is unfair.",
@@ -20,16 +28,71 @@ def create_mock_database():
         "Personal Loan: Prepayment penalty was not disclosed.",
         "Service: Chatbot is useless, I need a human agent."
     ]
+    # Product / issue metadata so scoped retrieval can be tried on the mock data
+    scopes = [
+        ("Credit card", "Fees or interest"),
+        ("Credit card", "Fees or interest"),
+        ("Money transfer, virtual currency, or money service", "Money was not available when promised"),
+        ("Money transfer, virtual currency, or money service", "Fees or interest"),
+        ("Checking or savings account", "Managing an account"),
+        ("Personal loan", "Fees or interest"),
+        ("Checking or savings account", "Customer service"),
+    ]
 
     print("Creating vector database... this creates the 'Brain' of the AI...")
-    docs = [Document(page_content=t) for t in complaints]
-    
-    vectorstore = Chroma.from_documents(
-        documents=docs,
-        embedding=HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2"),
-        persist_directory="./chroma_db"
+    docs = [
+        Document(page_content=t, metadata={"complaint_id": f"mock-{i}", "product": product, "issue": issue})
+        for i, (t, (product, issue)) in enumerate(zip(complaints, scopes))
+    ]
+
+    # The chunks go into the published index: same embedder and token counter checks as run_ingestion
+    built_with = read_index_meta(resolve(DB_PATH)[1] or DB_PATH)
+    try:
+        mismatch = check_index_embedder(built_with, EMBEDDING_MODEL_NAME, EMBED_BACKEND)
+    except EmbedderMismatch as e:
+        print(f"❌ Error: {e}.")
+        return
+    if mismatch:
+        print(f"❌ Error: {mismatch}. Set RAG_EMBED_BACKEND={built_with['embed_backend']}.")
+        return
+    token_counter = None
+    if CHUNK_MODE == "tokens":
+        token_counter = TOKEN_COUNTER or built_with.get("token_counter") or default_token_counter()
+
+    # Upsert by chunk id into a copy of the published snapshot, so re-running is a no-op
+    version, snapshot_dir = new_snapshot(DB_PATH)
+    vectorstore = Chroma(
+        embedding_function=load_embedding_model(backend=EMBED_BACKEND),
+        persist_directory=snapshot_dir
     )
-    print("✅ Database created!")
+    dedup, scope, lexical = ChunkDeduplicator(), ScopeIndex(), LexicalIndexBuilder()
+    chunks = iter_chunks(docs, get_text_splitter(mode=CHUNK_MODE, token_counter=token_counter))
+    added, deleted, total = sync_chunks(vectorstore, lexical.observe(scope.observe(dedup.observe(chunks))))
+    merged = update_metadata(vectorstore, dedup.metadata_updates())
+    scope.save(snapshot_dir)
+    lexical.build().save(snapshot_dir)
+    write_index_meta(snapshot_dir, chunk_mode=CHUNK_MODE, token_counter=token_counter,
+                     **index_embedder(EMBEDDING_MODEL_NAME, EMBED_BACKEND))
+    # The copy may hold the aggregate and compact stores of a real ingestion: rebuild them for the mock data
+    if pyarrow is not None:
+        aggregates = AggregateBuilder()
+        aggregates.add(pd.DataFrame({"Product": [p for p, _ in scopes], "Issue": [i for _, i in scopes],
+                                     "Complaint ID": [d.metadata["complaint_id"] for d in docs],
+                                     "Consumer complaint narrative": complaints}))
+        aggregates.build().save(snapshot_dir)
+    elif os.path.exists(os.path.join(snapshot_dir, AGGREGATES_FILE)):
+        os.remove(os.path.join(snapshot_dir, AGGREGATES_FILE))
+    if (compact := read_manifest(snapshot_dir)) is not None:
+        export_compact_store(vectorstore, snapshot_dir, mode=compact["mode"])
+    close_client(vectorstore)
+    # Same rule as run_ingestion: a run that only merged complaint ids is published too
+    if added or deleted or merged or current_version(DB_PATH) is None:
+        mark_index_updated(snapshot_dir)
+        publish(DB_PATH, version)
+        collect_garbage(DB_PATH)
+    else:
+        discard(DB_PATH, version)
+    print(f"✅ Database created! ({total} chunks, {added} added, {deleted} deleted)")
 
 if __name__ == "__main__":
-    create_mock_database()
\ No newline at end of file
+    create_mock_database()
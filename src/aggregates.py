@@ -0,0 +1,162 @@
+# src/aggregates.py
+import os
+import re
+import pandas as pd
+
+try:
+    from .telemetry import span
+except ImportError:  # run with src/ on sys.path
+    from telemetry import span
+
+try:  # optional (not in requirements.txt): pandas' Parquet engine; without it there is no aggregate store
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# --- CONFIGURATION ---
+AGGREGATES_FILE = "aggregates.parquet"  # written next to the Chroma files by ingestion
+AGGREGATE_ROUTING = os.getenv("RAG_AGGREGATE_ROUTING", "1") != "0"
+EXEMPLARS_PER_CELL = 3   # complaint ids kept per (product, issue, month)
+TOP_ISSUES = 5
+TREND_MONTHS = 6         # "recent" window compared with the one before it
+UNKNOWN_MONTH = "unknown"
+COLUMNS = ["product", "issue", "month", "count", "exemplar_ids"]
+
+# Questions about volumes, rankings and trends ("What are the main issues with Student Loans?"). Yes/no
+# questions about a product ("Are there delays in Money Transfers?") want the narratives, so they go to RAG
+_AGGREGATE = re.compile(
+    r"\b(main|top|most common|common|biggest|frequent|recurring)\s+(issues?|problems?|complaints?|reasons?)\b"
+    r"|\bhow many\b|\bhow often\b|\b(trends?|trending|over time|per month|monthly|volume)\b"
+    r"|\b(increas\w*|decreas\w*|ris(e|es|ing)|grow\w*|spik\w*)\b"
+    r"|^what (are|is) the (issues?|problems?|complaints?) (with|about|in)\b",
+    re.IGNORECASE,
+)
+# ... unless they ask about a specific case or cause, which needs the narratives
+_DRILL_DOWN = re.compile(r"\b(why|what happens|how (do|can|did|should) i|my|me|i)\b|#?\b\d{6,}\b", re.IGNORECASE)
+
+
+def is_aggregate_question(question):
+    return bool(_AGGREGATE.search(question)) and not _DRILL_DOWN.search(question)
+
+
+class AggregateBuilder:
+    """
+    Counts every complaint of the target products by product, issue and
+    month: not just the indexed sample, and also those filed without a
+    narrative. Exemplar ids are only taken from complaints with a narrative.
+    """
+
+    def __init__(self, exemplars=EXEMPLARS_PER_CELL):
+        self.exemplars = exemplars
+        self.cells = {}  # (product, issue, month) -> [count, [complaint ids]]
+
+    def observe(self, frames):
+        """Pass-through generator over the CSV chunks, before rows without text are dropped."""
+        for frame in frames:
+            with span("ingest.aggregate"):
+                self.add(frame)
+            yield frame
+
+    def add(self, df):
+        if "Date received" in df:
+            months = pd.to_datetime(df["Date received"], errors="coerce", format="mixed").dt.strftime("%Y-%m")
+        else:
+            months = pd.Series(UNKNOWN_MONTH, index=df.index)
+        rows = pd.DataFrame({
+            "product": df["Product"].to_numpy(),
+            "issue": df["Issue"].fillna("Unknown").to_numpy() if "Issue" in df else "Unknown",
+            "month": months.fillna(UNKNOWN_MONTH).to_numpy(),
+            "id": df["Complaint ID"].to_numpy() if "Complaint ID" in df else None,
+        })
+        keys = ["product", "issue", "month"]
+        for key, count in rows.groupby(keys, sort=False).size().items():
+            self.cells.setdefault(key, [0, []])[0] += int(count)
+        if "Complaint ID" in df:
+            if "Consumer complaint narrative" in df:  # exemplars are complaints the user can read
+                rows = rows[df["Consumer complaint narrative"].notna().to_numpy()]
+            for *key, complaint_id in rows.groupby(keys, sort=False).head(self.exemplars).itertuples(index=False):
+                ids = self.cells[tuple(key)][1]
+                if len(ids) < self.exemplars and str(complaint_id) not in ids:
+                    ids.append(str(complaint_id))
+
+    def build(self):
+        table = pd.DataFrame(
+            [(*key, count, ",".join(ids)) for key, (count, ids) in self.cells.items()], columns=COLUMNS
+        )
+        return AggregateStore(table.astype({"count": "int64"}).sort_values(["product", "issue", "month"],
+                                                                            ignore_index=True))
+
+
+class AggregateStore:
+    """
+    Complaint counts by product / issue / month with a few exemplar complaint
+    ids per cell, one small Parquet file. Answers "main issues" and trend
+    questions over all complaints in milliseconds, without retrieval or Flan-T5.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def save(self, db_path):
+        os.makedirs(db_path, exist_ok=True)
+        tmp_path = os.path.join(db_path, AGGREGATES_FILE + ".tmp")
+        self.table.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(db_path, AGGREGATES_FILE))
+
+    @classmethod
+    def load(cls, db_path):
+        """The saved store, or None if ingestion has not written one (or pyarrow is missing)."""
+        path = os.path.join(db_path, AGGREGATES_FILE)
+        if pyarrow is None or not os.path.exists(path):
+            return None
+        return cls(pd.read_parquet(path))
+
+    def summarize(self, products=None, issue=None):
+        """Totals, top issues, the recent trend and exemplar ids for a scope (everything when unscoped)."""
+        table = self.table[self.table["product"].isin(products)] if products else self.table
+        focus = table[table["issue"] == issue] if issue else table
+        by_issue = table.groupby("issue")["count"].sum().sort_values(ascending=False, kind="stable")
+        monthly = focus[focus["month"] != UNKNOWN_MONTH].groupby("month")["count"].sum().sort_index()
+        total = int(table["count"].sum())
+
+        # Most recent exemplars: a few for the asked-about issue, else one per top issue
+        exemplars, per_issue = [], EXEMPLARS_PER_CELL if issue else 1
+        for name in ([issue] if issue else by_issue.index[:TOP_ISSUES]):
+            cells = focus[focus["issue"] == name].sort_values(
+                "month", ascending=False, key=lambda m: m.where(m != UNKNOWN_MONTH, ""))
+            exemplars += [i for cell in cells["exemplar_ids"] for i in cell.split(",") if i][:per_issue]
+        return {
+            "products": list(products or []),
+            "issue": issue,
+            "total": total,
+            "issue_total": int(focus["count"].sum()) if issue else None,
+            "top_issues": [(name, int(n), n / total) for name, n in by_issue.head(TOP_ISSUES).items()],
+            "first_month": monthly.index[0] if len(monthly) else None,
+            "last_month": monthly.index[-1] if len(monthly) else None,
+            "recent": int(monthly.tail(TREND_MONTHS).sum()),
+            "previous": int(monthly.iloc[-2 * TREND_MONTHS:-TREND_MONTHS].sum()) if len(monthly) > TREND_MONTHS else 0,
+            "exemplar_ids": exemplars,
+        }
+
+
+def format_summary(summary):
+    """Markdown answer for a summarize() result."""
+    scope = ", ".join(summary["products"]) or "all products"
+    if not summary["total"]:
+        return f"No complaints are recorded for {scope}."
+    span_text = (f" between {summary['first_month']} and {summary['last_month']}"
+                 if summary["first_month"] else "")
+    blocks = [f"**{summary['total']:,} complaints** about {scope}{span_text}."]
+    if summary["issue"]:
+        share = summary["issue_total"] / summary["total"]
+        blocks.append(f"**{summary['issue']}**: {summary['issue_total']:,} of them ({share:.0%}).")
+    else:
+        blocks.append("Main issues:\n" + "\n".join(
+            f"{rank}. {name}: {n:,} ({share:.0%})" for rank, (name, n, share) in enumerate(summary["top_issues"], 1)))
+    if summary["previous"]:
+        change = (summary["recent"] - summary["previous"]) / summary["previous"]
+        blocks.append(f"Last {TREND_MONTHS} months: {summary['recent']:,} complaints "
+                      f"({change:+.0%} on the {TREND_MONTHS} months before).")
+    if summary["exemplar_ids"]:
+        blocks.append("Example complaints: " + ", ".join(f"#{i}" for i in summary["exemplar_ids"]))
+    return "\n\n".join(blocks)
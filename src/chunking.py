@@ -0,0 +1,335 @@
+# src/chunking.py
+import os
+import re
+import hashlib
+import logging
+import multiprocessing as mp
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+logger = logging.getLogger("CreditRAG")
+
+# --- CONFIGURATION ---
+CHUNK_SIZE = 500      # Defined in assignment (Task 2)
+CHUNK_OVERLAP = 50
+# Library default "chars": the original 500-character splitter, so chunk_documents / get_text_splitter
+# keep the assignment's chunks. "tokens" sizes chunks by MiniLM tokenizer count; run_ingestion uses it
+CHUNK_MODE = "chars"
+TOKENIZER_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+TOKENIZER_PATH = os.getenv("RAG_TOKENIZER_PATH")  # a tokenizer.json; otherwise the local HF cache is tried
+# "minilm" (the real tokenizer) or "approx"; unset: whatever the published index was chunked with
+# (recorded in its index_meta.json), else "minilm" if the tokenizer is on disk. Changing it re-chunks everything.
+TOKEN_COUNTER = os.getenv("RAG_TOKEN_COUNTER")
+TOKEN_COUNTERS = ("minilm", "approx")
+APPROX_TOKEN_MARGIN = 1.25  # the estimate is scaled up by this much, so it stays above the real count
+EMBED_MAX_TOKENS = 254    # MiniLM's 256-token window minus [CLS] and [SEP]; anything longer is truncated
+CHUNK_TOKENS = 200        # target size, leaves headroom for the approximate counter
+CHUNK_OVERLAP_TOKENS = 20
+MIN_CHUNK_TOKENS = 24     # shorter tail fragments are merged into the previous chunk
+SIMHASH_MAX_DISTANCE = 3  # near-duplicate: at most this many of the 64 SimHash bits differ
+SHINGLE_WORDS = 3
+CHUNK_WORKERS = os.cpu_count() or 1
+RECORDS_PER_TASK = 500        # complaints per worker task
+PARALLEL_MIN_RECORDS = 5000   # below this, process start-up costs more than it saves
+
+
+class ComplaintRecord:
+    """One complaint, without the per-row pydantic validation of a Document."""
+    __slots__ = ("text", "product", "complaint_id", "issue")
+
+    def __init__(self, text, product, complaint_id, issue):
+        self.text = text
+        self.product = product
+        self.complaint_id = complaint_id
+        self.issue = issue
+
+    @property
+    def metadata(self):
+        return {"product": self.product, "complaint_id": self.complaint_id, "issue": self.issue}
+
+
+class ChunkRecord:
+    """A chunk ready for indexing; exposes the same id/page_content/metadata as a Document."""
+    __slots__ = ("id", "page_content", "metadata")
+
+    def __init__(self, id, page_content, metadata):
+        self.id = id
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+# --- TOKEN COUNTING ---
+
+_WORD_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\w\s]")
+_REDACTED_WORD = re.compile(r"[xX]{3,}")  # CFPB redactions: "XXXX" is xx ##xx
+
+
+def approximate_token_count(text):
+    """
+    WordPiece-like estimate used when the MiniLM tokenizer is not available
+    offline: one token per punctuation mark, long words and numbers split
+    into pieces, redactions in pairs of letters. Scaled up by
+    APPROX_TOKEN_MARGIN for the short words it still undercounts (names
+    like "Zelle" are ze ##lle), so chunks stay inside the window. Not
+    rounded: the splitter adds up the counts of the words it merges, and
+    rounding each one up would make every word two tokens.
+    """
+    count = 0
+    for word in _WORD_PATTERN.findall(text):
+        if _REDACTED_WORD.fullmatch(word):
+            count += -(-len(word) // 2)
+        else:
+            count += 1 if len(word) <= 7 else -(-len(word) // 5)
+    return count * APPROX_TOKEN_MARGIN
+
+
+def _load_tokenizer_counter(tokenizer_path, model_id):
+    """len(tokens) with the `model_id` tokenizer if it is on disk, else None (never downloads)."""
+    try:
+        from tokenizers import Tokenizer
+        if tokenizer_path is None:
+            from huggingface_hub import try_to_load_from_cache
+            cached = try_to_load_from_cache(model_id, "tokenizer.json")
+            tokenizer_path = cached if isinstance(cached, str) else None
+        if tokenizer_path is not None:
+            tokenizer = Tokenizer.from_file(tokenizer_path)
+            tokenizer.no_truncation()
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+    except Exception as e:  # missing package, unreadable file
+        logger.warning("chunking: could not load the %s tokenizer (%s)", model_id, e)
+    return None
+
+
+def load_token_counter(tokenizer_path=TOKENIZER_PATH, model_id=TOKENIZER_MODEL_ID):
+    """len(tokens) with the `model_id` tokenizer if it is on disk, else approximate_token_count (never downloads)."""
+    return _load_tokenizer_counter(tokenizer_path, model_id) or approximate_token_count
+
+
+def default_token_counter():
+    """The counter a new index is chunked with: "minilm" if its tokenizer is on disk, else "approx"."""
+    return "minilm" if _load_tokenizer_counter(TOKENIZER_PATH, TOKENIZER_MODEL_ID) is not None else "approx"
+
+
+def get_token_counter(name):
+    """
+    The "minilm" or "approx" counter. Chunk boundaries (and so chunk ids)
+    depend on it, so it is chosen once per index and never swapped
+    silently: "minilm" raises if the tokenizer is not on disk.
+    """
+    if name == "approx":
+        return approximate_token_count
+    if name != "minilm":
+        raise ValueError(f"Unknown token counter {name!r}; use one of {TOKEN_COUNTERS}")
+    counter = _load_tokenizer_counter(TOKENIZER_PATH, TOKENIZER_MODEL_ID)
+    if counter is None:
+        raise RuntimeError(f"The index is chunked with the {TOKENIZER_MODEL_ID} tokenizer, which is not on disk; "
+                           "set RAG_TOKENIZER_PATH to its tokenizer.json, or rebuild with RAG_TOKEN_COUNTER=approx")
+    return counter
+
+
+class TokenAwareSplitter(RecursiveCharacterTextSplitter):
+    """
+    Recursive splitter measured in tokens. A tail fragment shorter than
+    `min_chunk_tokens` is merged into the chunk before it when the result
+    still fits `max_tokens`, so complaints don't end in near-empty chunks.
+    """
+
+    def __init__(self, token_counter, chunk_size=CHUNK_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS,
+                 min_chunk_tokens=MIN_CHUNK_TOKENS, max_tokens=EMBED_MAX_TOKENS):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, length_function=token_counter)
+        self.min_chunk_tokens = min_chunk_tokens
+        self.max_tokens = max_tokens
+
+    def split_text(self, text):
+        chunks = super().split_text(text)
+        if len(chunks) > 1 and self._length_function(chunks[-1]) < self.min_chunk_tokens:
+            start = text.rfind(chunks[-2])
+            merged = text[start:].strip() if start >= 0 else ""
+            if merged and self._length_function(merged) <= self.max_tokens:
+                chunks[-2:] = [merged]
+        return chunks
+
+
+def get_text_splitter(chunk_size=None, chunk_overlap=None, mode=CHUNK_MODE, token_counter=TOKEN_COUNTER):
+    """
+    The ingestion splitter; sizes are in tokens for mode="tokens" (counted by
+    `token_counter`, see get_token_counter; default_token_counter() if
+    unset), characters for "chars".
+    """
+    if mode == "chars":
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size or CHUNK_SIZE,
+                                              chunk_overlap=CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap)
+    if mode != "tokens":
+        raise ValueError(f"Unknown chunk mode {mode!r}; use 'tokens' or 'chars'")
+    return TokenAwareSplitter(get_token_counter(token_counter or default_token_counter()),
+                              chunk_size=chunk_size or CHUNK_TOKENS,
+                              chunk_overlap=CHUNK_OVERLAP_TOKENS if chunk_overlap is None else chunk_overlap)
+
+
+def chunk_documents(documents, chunk_size=None, chunk_overlap=None, mode=CHUNK_MODE):
+    """Splits a list of Documents into chunks."""
+    return get_text_splitter(chunk_size, chunk_overlap, mode).split_documents(documents)
+
+
+def make_chunk_id(complaint_id, ordinal, text):
+    """Deterministic chunk key: complaint, position in the complaint, content hash."""
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+    return f"{complaint_id}-{ordinal}-{digest}"
+
+
+def iter_chunks(documents, splitter=None):
+    """Lazily chunks a stream of Documents (same output as chunk_documents), assigning chunk ids."""
+    splitter = splitter or get_text_splitter()
+    for doc in documents:
+        complaint_id = doc.metadata.get("complaint_id", "Unknown")
+        for ordinal, chunk in enumerate(splitter.split_documents([doc])):
+            chunk.id = make_chunk_id(complaint_id, ordinal, chunk.page_content)
+            yield chunk
+
+
+# --- RECORD CHUNKING (single process or a process pool) ---
+
+_splitters = {}
+
+
+def split_records(records, mode=CHUNK_MODE, token_counter=TOKEN_COUNTER):
+    """Chunks a batch of ComplaintRecords; same texts and metadata as split_documents."""
+    splitter = _splitters.get((mode, token_counter))
+    if splitter is None:
+        splitter = _splitters[(mode, token_counter)] = get_text_splitter(mode=mode, token_counter=token_counter)
+    chunks = []
+    for record in records:
+        meta = record.metadata
+        for ordinal, text in enumerate(splitter.split_text(record.text)):
+            chunks.append(ChunkRecord(make_chunk_id(record.complaint_id, ordinal, text), text, dict(meta)))
+    return chunks
+
+
+def iter_record_chunks(records, workers=CHUNK_WORKERS, min_parallel=PARALLEL_MIN_RECORDS, mode=CHUNK_MODE,
+                       token_counter=TOKEN_COUNTER):
+    """
+    Yields ChunkRecords for `records` in input order.
+
+    With more than `min_parallel` records, batches of RECORDS_PER_TASK are
+    split in `workers` processes; at most 2 * workers batches are in flight
+    so chunks are still produced lazily for the embed stage.
+    """
+    records = list(records)
+    batches = (records[i:i + RECORDS_PER_TASK] for i in range(0, len(records), RECORDS_PER_TASK))
+    if workers <= 1 or len(records) < min_parallel:
+        for batch in batches:
+            yield from split_records(batch, mode, token_counter)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+        pending = deque(pool.submit(split_records, b, mode, token_counter) for b in islice(batches, 2 * workers))
+        while pending:
+            chunks = pending.popleft().result()
+            next_batch = next(batches, None)
+            if next_batch is not None:
+                pending.append(pool.submit(split_records, next_batch, mode, token_counter))
+            yield from chunks
+
+
+# --- DEDUPLICATION ---
+
+_REDACTION = re.compile(r"\b[xX]{2}/[xX]{2}/(?:[xX]{2,4}|\d{2,4})\b|\b[xX]{2,}\b|\{\$[\d,.]+\}")
+_NORMALIZED_WORD = re.compile(r"[a-z0-9]+")
+_BANDS = 4  # 64-bit SimHash = 4 bands of 16 bits
+
+
+def normalize_words(text):
+    """Lower-cased words with CFPB redactions (XXXX, XX/XX/XXXX, XX/XX/2023, {$1.00}) collapsed to "x"."""
+    return _NORMALIZED_WORD.findall(_REDACTION.sub(" x ", text).lower())
+
+
+def simhash(words, shingle_words=SHINGLE_WORDS):
+    """64-bit SimHash of the word shingles (bitwise majority vote of their hashes)."""
+    shingles = [" ".join(words[i:i + shingle_words]) for i in range(max(1, len(words) - shingle_words + 1))]
+    digests = b"".join(hashlib.blake2b(s.encode(), digest_size=8).digest() for s in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1)
+    return int.from_bytes(np.packbits(bits.sum(axis=0) * 2 > len(shingles)).tobytes(), "big")
+
+
+class ChunkDeduplicator:
+    """
+    Drops exact and near-duplicate chunks from a chunk stream.
+
+    Exact means the same words after normalize_words. Near means the 64-bit
+    SimHash differs in at most `max_distance` bits; candidates come from 4
+    bands of 16 bits, since two hashes that close always share a band.
+    Chunks are only compared within the same product and issue, so scoped
+    retrieval still finds every topic.
+
+    The first chunk is kept. Its metadata["complaint_ids"] lists every
+    complaint it stands for, comma-joined (Chroma metadata is scalar). Ids
+    added after the chunk was passed on come from metadata_updates().
+    """
+
+    def __init__(self, max_distance=SIMHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.complaint_ids = {}     # kept chunk id -> [complaint id, ...]
+        self.dropped = {"exact": 0, "near": 0}
+        self._exact = {}
+        self._bands = defaultdict(list)
+
+    def observe(self, chunks):
+        """Pass-through: yields only the chunks that are kept."""
+        for chunk in chunks:
+            if self.add(chunk):
+                yield chunk
+
+    def add(self, chunk):
+        """True if `chunk` is new; otherwise its complaint is credited to the kept chunk."""
+        meta = chunk.metadata
+        namespace = (meta.get("product"), meta.get("issue"))
+        complaint_id = str(meta.get("complaint_id", "Unknown"))
+        words = normalize_words(chunk.page_content)
+        digest = hashlib.blake2b(" ".join(words).encode(), digest_size=16).digest()
+        kept_id, kind, fingerprint = self._exact.get((namespace, digest)), "exact", None
+        if kept_id is None and len(words) >= SHINGLE_WORDS:
+            fingerprint = simhash(words)
+            kept_id, kind = self._find_near(namespace, fingerprint), "near"
+        if kept_id == chunk.id:  # the same chunk again
+            return False
+        if kept_id is not None:
+            self.dropped[kind] += 1
+            ids = self.complaint_ids[kept_id]
+            if complaint_id not in ids:
+                ids.append(complaint_id)
+            return False
+
+        self._exact[(namespace, digest)] = chunk.id
+        if fingerprint is not None:
+            for band in range(_BANDS):
+                self._bands[(namespace, band, (fingerprint >> (16 * band)) & 0xFFFF)].append((fingerprint, chunk.id))
+        self.complaint_ids[chunk.id] = [complaint_id]
+        meta["complaint_ids"] = complaint_id
+        return True
+
+    def _find_near(self, namespace, fingerprint):
+        for band in range(_BANDS):
+            for other, chunk_id in self._bands.get((namespace, band, (fingerprint >> (16 * band)) & 0xFFFF), ()):
+                if (other ^ fingerprint).bit_count() <= self.max_distance:
+                    return chunk_id
+        return None
+
+    def metadata_updates(self, stored=None):
+        """
+        {chunk id: {"complaint_ids": "..."}} for the kept chunks whose stored
+        list may be out of date: those credited with a duplicate after they
+        were passed on, and those in `stored` (ids already in the index before
+        this run), which may still list duplicates that are gone. A chunk
+        written by this run for one complaint already holds it. Without
+        `stored`, every kept chunk is returned; ingestion.update_metadata only
+        writes the ones that changed.
+        """
+        return {chunk_id: {"complaint_ids": ",".join(ids)} for chunk_id, ids in self.complaint_ids.items()
+                if stored is None or len(ids) > 1 or chunk_id in stored}
+
+    def stats(self):
+        return {"kept": len(self.complaint_ids), "dropped_exact": self.dropped["exact"],
+                "dropped_near": self.dropped["near"]}
@@ -0,0 +1,382 @@
+# src/compact_store.py
+"""
+Compact, memory-mapped alternative to the Chroma store (RAG_VECTOR_BACKEND=compact).
+
+Ingestion exports the Chroma collection into COMPACT_DIR next to it:
+
+    vectors.npy        float16 unit vectors, n x 384 (2 bytes per dim instead of 4)
+    codes.npy          product-quantized codes, PQ_SUBVECTORS x n uint8 ("pq" mode only)
+    codebook.npy       PQ_SUBVECTORS x PQ_CENTROIDS x 8 float32 centroids
+    product_codes.npy  per-row product / issue ids for scoped search
+    records.bin        one JSON [id, text, metadata] per row, addressed by record_offsets.npy
+    sorted_ids.npy     chunk ids in sorted order (+ sorted_rows.npy) for get_by_ids
+
+Everything is opened with mmap, so loading costs a few page faults rather
+than deserializing the collection. In "pq" mode a query scans only the
+codes (48 bytes per chunk) to shortlist RESCORE_FACTOR * k candidates, then
+re-scores those rows exactly against their float16 vectors; the vectors
+of other rows are never paged in. "float16" mode scans the vectors directly.
+"""
+import os
+import json
+import uuid
+import shutil
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# --- CONFIGURATION ---
+VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma")  # "chroma" | "compact"
+COMPACT_MODE = os.getenv("RAG_COMPACT_MODE", "pq")          # "pq" | "float16"
+COMPACT_DIR = "compact_store"  # inside the Chroma directory
+PQ_SUBVECTORS = 48             # 384 dims -> 8-dim sub-vectors, one byte each
+PQ_CENTROIDS = 256
+PQ_TRAIN_SIZE = 10_000         # rows sampled to train the codebook
+PQ_ITERATIONS = 15
+RESCORE_FACTOR = 30            # shortlist = max(RESCORE_MIN, RESCORE_FACTOR * k) rows
+RESCORE_MIN = 200
+SCAN_BLOCK = 16_384            # rows converted to float32 at a time in float16 scans
+EXPORT_PAGE_SIZE = 5000
+MODES = ("pq", "float16")
+
+
+# --- PRODUCT QUANTIZATION ---
+
+def _nearest(x, centroids):
+    """Index of the closest centroid (squared l2) for every row of x."""
+    return ((centroids ** 2).sum(axis=1) - 2 * x @ centroids.T).argmin(axis=1)
+
+
+def train_codebook(sample, subvectors=PQ_SUBVECTORS, centroids=PQ_CENTROIDS, iterations=PQ_ITERATIONS, seed=0):
+    """k-means per sub-space: (subvectors, centroids, dim // subvectors) float32."""
+    n, dim = sample.shape
+    if dim % subvectors:
+        raise ValueError(f"{dim} dims do not split into {subvectors} sub-vectors")
+    rng = np.random.default_rng(seed)
+    centroids = min(centroids, n)
+    parts = sample.reshape(n, subvectors, dim // subvectors)
+    codebook = np.empty((subvectors, centroids, dim // subvectors), dtype=np.float32)
+    for j in range(subvectors):
+        x = np.ascontiguousarray(parts[:, j])
+        means = x[rng.choice(n, centroids, replace=False)].copy()
+        for _ in range(iterations):
+            assign = _nearest(x, means)
+            counts = np.bincount(assign, minlength=centroids)
+            sums = np.stack([np.bincount(assign, weights=x[:, d], minlength=centroids) for d in range(x.shape[1])], 1)
+            alive = counts > 0
+            means[alive] = sums[alive] / counts[alive, None]
+            means[~alive] = x[rng.choice(n, int((~alive).sum()))]  # re-seed empty clusters
+        codebook[j] = means
+    return codebook
+
+
+def encode(vectors, codebook):
+    """PQ codes of `vectors` as (subvectors, n) uint8."""
+    subvectors, _, width = codebook.shape
+    parts = vectors.reshape(len(vectors), subvectors, width)
+    return np.stack([_nearest(parts[:, j], codebook[j]) for j in range(subvectors)]).astype(np.uint8)
+
+
+# --- WRITER ---
+
+class CompactStoreWriter:
+    """
+    Streams rows into a fresh store directory; `close` trains the codebook,
+    encodes the vectors and swaps the directory in for COMPACT_DIR.
+
+        writer = CompactStoreWriter(db_path, count=n, dim=384)
+        writer.add(ids, embeddings, documents, metadatas)
+        writer.close()
+    """
+
+    def __init__(self, db_path, count, dim, mode=COMPACT_MODE, subvectors=PQ_SUBVECTORS):
+        if mode not in MODES:
+            raise ValueError(f"Unknown compact store mode {mode!r}; expected one of {MODES}")
+        if mode == "pq" and dim % subvectors:
+            raise ValueError(f"{dim} dims do not split into {subvectors} sub-vectors")
+        self.path = os.path.join(db_path, COMPACT_DIR)
+        self.tmp_path = f"{self.path}.tmp-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.tmp_path)
+        self.mode = mode
+        self.subvectors = subvectors
+        self.count = 0
+        self.vectors = np.lib.format.open_memmap(os.path.join(self.tmp_path, "vectors.npy"), mode="w+",
+                                                 dtype=np.float16, shape=(count, dim))
+        self.ids, self.products, self.issues = [], [], []
+        self.product_names, self.issue_names = {}, {}
+        self.offsets = [0]
+        self._records = open(os.path.join(self.tmp_path, "records.bin"), "wb")
+
+    def add(self, ids, embeddings, documents, metadatas):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        self.vectors[self.count:self.count + len(vectors)] = vectors
+        self.count += len(vectors)
+        for chunk_id, text, meta in zip(ids, documents, metadatas):
+            meta = meta or {}
+            line = json.dumps([chunk_id, text, meta]).encode("utf-8")
+            self._records.write(line)
+            self.offsets.append(self.offsets[-1] + len(line))
+            self.ids.append(chunk_id)
+            self.products.append(self.product_names.setdefault(meta.get("product"), len(self.product_names)))
+            self.issues.append(self.issue_names.setdefault(meta.get("issue"), len(self.issue_names)))
+
+    def close(self):
+        self._records.close()
+        self.vectors.flush()
+        vectors = self.vectors[:self.count]
+        save = lambda name, array: np.save(os.path.join(self.tmp_path, name), array)
+        manifest = {"version": uuid.uuid4().hex, "mode": self.mode, "count": self.count,
+                    "dim": vectors.shape[1], "products": list(self.product_names), "issues": list(self.issue_names)}
+
+        # 1. Codebook on a sample, then codes block by block
+        if self.mode == "pq" and self.count:
+            sample = np.random.default_rng(0).choice(self.count, min(self.count, PQ_TRAIN_SIZE), replace=False)
+            codebook = train_codebook(np.asarray(vectors[np.sort(sample)], dtype=np.float32), self.subvectors)
+            codes = np.lib.format.open_memmap(os.path.join(self.tmp_path, "codes.npy"), mode="w+",
+                                              dtype=np.uint8, shape=(self.subvectors, self.count))
+            for start in range(0, self.count, SCAN_BLOCK):
+                block = np.asarray(vectors[start:start + SCAN_BLOCK], dtype=np.float32)
+                codes[:, start:start + len(block)] = encode(block, codebook)
+            codes.flush()
+            save("codebook.npy", codebook)
+            manifest["subvectors"] = self.subvectors
+
+        # 2. Row attributes and the id lookup
+        save("product_codes.npy", np.array(self.products, dtype=np.int32))
+        save("issue_codes.npy", np.array(self.issues, dtype=np.int32))
+        save("record_offsets.npy", np.array(self.offsets, dtype=np.int64))
+        ids = np.array(self.ids, dtype="S")
+        order = np.argsort(ids, kind="stable")
+        save("sorted_ids.npy", ids[order])
+        save("sorted_rows.npy", order.astype(np.int64))
+        del self.vectors
+        with open(os.path.join(self.tmp_path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+        # 3. Publish: readers keep their mmaps of the old files until they reload
+        old_path = f"{self.path}.old-{uuid.uuid4().hex[:8]}"
+        if os.path.exists(self.path):
+            os.replace(self.path, old_path)
+        os.replace(self.tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+        return manifest
+
+
+def export_compact_store(vectorstore, db_path, mode=COMPACT_MODE, page_size=EXPORT_PAGE_SIZE,
+                         subvectors=PQ_SUBVECTORS):
+    """Copies the main Chroma collection into a compact store (vectors are read back, not re-embedded)."""
+    collection = vectorstore._collection
+    count = collection.count()
+    page = collection.get(include=["embeddings"], limit=1)
+    dim = len(page["embeddings"][0]) if page["ids"] else 0
+    writer = CompactStoreWriter(db_path, count, dim, mode=mode, subvectors=subvectors)
+    offset = 0
+    while offset < count:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        writer.add(page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+        offset += len(page["ids"])
+    return writer.close()
+
+
+def read_manifest(db_path):
+    """Manifest of the compact store in `db_path` (None if there is none)."""
+    try:
+        with open(os.path.join(db_path, COMPACT_DIR, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# --- READER ---
+
+class CompactVectorStore(VectorStore):
+    """
+    Read-only LangChain vector store over a compact store directory.
+
+    Supports what the pipeline uses: similarity search (optionally with a
+    Chroma-style `where` on product / issue), get_by_ids and as_retriever.
+    Scores are squared l2 distances between unit vectors (lower is closer),
+    like the default Chroma collection. The files are re-opened when
+    ingestion publishes a new version; `close` unmaps them.
+    """
+
+    def __init__(self, db_path, embedding_function=None, rescore_factor=RESCORE_FACTOR):
+        self.path = os.path.join(db_path, COMPACT_DIR)
+        self.embedding_function = embedding_function
+        self.rescore_factor = rescore_factor
+        self._stamp = None
+        self._refresh()
+
+    @classmethod
+    def load(cls, db_path, embedding_function=None, **kwargs):
+        """The store, or None if ingestion has not written one yet."""
+        if not os.path.exists(os.path.join(db_path, COMPACT_DIR, "manifest.json")):
+            return None
+        return cls(db_path, embedding_function, **kwargs)
+
+    def close(self):
+        """Drops the memory maps, so the files can be deleted (on Windows too)."""
+        self.__dict__.update(manifest={"count": 0}, vectors=None, codes=None, codebook=None, product_codes=None,
+                             issue_codes=None, offsets=None, records=b"", sorted_ids=None, sorted_rows=None)
+        self._stamp = "closed"
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def _refresh(self):
+        if self._stamp == "closed":
+            return
+        try:
+            stat = os.stat(os.path.join(self.path, "manifest.json"))
+        except OSError:
+            return  # mid-swap or removed: keep serving the files already mapped
+        if (stat.st_ino, stat.st_mtime_ns) == self._stamp:
+            return
+        with open(os.path.join(self.path, "manifest.json")) as f:
+            manifest = json.load(f)
+        load = lambda name: np.load(os.path.join(self.path, name), mmap_mode="r")
+        pq = manifest["mode"] == "pq" and manifest["count"] > 0
+        records_path = os.path.join(self.path, "records.bin")
+        self.__dict__.update(
+            manifest=manifest,
+            vectors=load("vectors.npy")[:manifest["count"]],
+            codes=load("codes.npy") if pq else None,
+            codebook=np.load(os.path.join(self.path, "codebook.npy")) if pq else None,
+            product_codes=load("product_codes.npy"),
+            issue_codes=load("issue_codes.npy"),
+            offsets=load("record_offsets.npy"),
+            records=np.memmap(records_path, dtype=np.uint8, mode="r") if os.path.getsize(records_path) else b"",
+            sorted_ids=load("sorted_ids.npy"),
+            sorted_rows=load("sorted_rows.npy"),
+            product_index={name: i for i, name in enumerate(manifest["products"])},
+            issue_index={name: i for i, name in enumerate(manifest["issues"])},
+        )
+        self._stamp = (stat.st_ino, stat.st_mtime_ns)
+
+    def __len__(self):
+        return self.manifest["count"]
+
+    def memory_report(self):
+        """Bytes per component: what stays resident ("scan") versus what is paged in on demand."""
+        scan = self.codes.nbytes if self.codes is not None else self.vectors.nbytes
+        return {"scan_bytes": scan, "vector_bytes": self.vectors.nbytes, "record_bytes": len(self.records),
+                "float32_bytes": self.vectors.size * 4}
+
+    # --- Search ---
+
+    def _rows(self, where):
+        """Row ids matching a Chroma `where` on product / issue (None means every row)."""
+        if not where:
+            return None
+        if "$and" in where:
+            masks = [self._mask(clause) for clause in where["$and"]]
+            return np.flatnonzero(np.logical_and.reduce(masks))
+        return np.flatnonzero(self._mask(where))
+
+    def _mask(self, clause):
+        ((field, condition),) = clause.items()
+        if field == "product":
+            codes, index = self.product_codes, self.product_index
+        elif field == "issue":
+            codes, index = self.issue_codes, self.issue_index
+        else:
+            raise ValueError(f"The compact store can only filter on product / issue, not {field!r}")
+        if isinstance(condition, dict):
+            values = condition["$in"] if "$in" in condition else [condition["$eq"]]
+        else:
+            values = [condition]
+        return np.isin(codes, [index[v] for v in values if v in index])
+
+    def _scores(self, query, rows):
+        """Cosine similarity of `query` with `rows` (or all rows), scanned block by block from float16."""
+        vectors = self.vectors
+        total = len(vectors) if rows is None else len(rows)
+        scores = np.empty(total, dtype=np.float32)
+        for start in range(0, total, SCAN_BLOCK):
+            stop = min(start + SCAN_BLOCK, total)
+            block = vectors[start:stop] if rows is None else vectors[rows[start:stop]]
+            scores[start:stop] = np.asarray(block, dtype=np.float32) @ query
+        return scores
+
+    def _approximate_scores(self, query, rows):
+        """Asymmetric PQ distance: per-sub-space lookup tables summed over the codes."""
+        subvectors, _, width = self.codebook.shape
+        tables = np.einsum("ms,mks->mk", query.reshape(subvectors, width), self.codebook)
+        scores = np.zeros(len(self.vectors) if rows is None else len(rows), dtype=np.float32)
+        for j in range(subvectors):
+            codes = self.codes[j] if rows is None else self.codes[j][rows]
+            scores += tables[j].take(codes)  # take() is ~2x faster than fancy indexing here
+        return scores
+
+    def search_vector(self, embedding, k=4, where=None):
+        """[(row, squared l2 distance)] of the k nearest rows, best first."""
+        self._refresh()
+        if not len(self):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        rows = self._rows(where)
+        if rows is not None and not len(rows):
+            return []
+        total = len(self) if rows is None else len(rows)
+        shortlist = max(RESCORE_MIN, self.rescore_factor * k)
+        if self.codes is not None and total > shortlist:
+            approximate = self._approximate_scores(query, rows)
+            candidates = np.argpartition(-approximate, shortlist - 1)[:shortlist]
+            candidates = np.sort(candidates if rows is None else rows[candidates])  # sequential page reads
+            scores = self._scores(query, candidates)
+        else:
+            candidates, scores = rows, self._scores(query, rows)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i if candidates is None else candidates[i]), float(2 - 2 * scores[i])) for i in top]
+
+    def _document(self, row):
+        start, stop = int(self.offsets[row]), int(self.offsets[row + 1])
+        chunk_id, text, meta = json.loads(bytes(self.records[start:stop]).decode("utf-8"))
+        return Document(id=chunk_id, page_content=text, metadata=meta)
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None, **kwargs):
+        return [(self._document(row), distance) for row, distance in self.search_vector(embedding, k, filter)]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector_with_relevance_scores(
+            self.embedding_function.embed_query(query), k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def get_by_ids(self, ids, /):
+        self._refresh()
+        if not len(self):
+            return []
+        wanted = np.array(list(ids), dtype="S")
+        positions = np.minimum(np.searchsorted(self.sorted_ids, wanted), len(self.sorted_ids) - 1)
+        found = self.sorted_ids[positions] == wanted
+        return [self._document(int(self.sorted_rows[p])) for p in positions[found]]
+
+    # --- Writes go through ingestion ---
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        raise NotImplementedError("The compact store is read-only; ingestion writes it (see export_compact_store)")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, db_path=None, mode=COMPACT_MODE, **kwargs):
+        """Embeds `texts` and writes a compact store under `db_path` (for tests and benchmarks)."""
+        texts = list(texts)
+        vectors = embedding.embed_documents(texts)
+        writer = CompactStoreWriter(db_path, len(texts), len(vectors[0]), mode=mode, **kwargs)
+        writer.add(ids or [uuid.uuid4().hex for _ in texts], vectors, texts, metadatas or [{} for _ in texts])
+        writer.close()
+        return cls(db_path, embedding)
@@ -0,0 +1,128 @@
+# src/context_builder.py
+import os
+import re
+import math
+
+try:
+    from .chunking import load_token_counter
+    from .lexical_index import tokenize
+except ImportError:  # run with src/ on sys.path
+    from chunking import load_token_counter
+    from lexical_index import tokenize
+
+# --- CONFIGURATION ---
+GENERATOR_TOKENIZER_ID = "google/flan-t5-base"
+GENERATOR_TOKENIZER_PATH = os.getenv("RAG_GENERATOR_TOKENIZER_PATH")  # a tokenizer.json; else the local HF cache
+ENCODER_MAX_TOKENS = 512   # flan-t5-base encoder window; the pipeline truncates anything longer
+# Context tokens per prompt (also capped by what the template and question leave); 0 = old join-everything
+CONTEXT_BUDGET_TOKENS = int(os.getenv("RAG_CONTEXT_BUDGET", "384"))
+REDUNDANCY_THRESHOLD = 0.7  # a sentence sharing this much of its terms (Jaccard) with a kept one is dropped
+RANK_WEIGHT = 1.0           # prior for sentences of higher-ranked chunks: RANK_WEIGHT / (1 + rank)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+def complaint_tag(doc):
+    """Citation tag of a chunk: its complaint id (or chunk id when the metadata has none)."""
+    complaint_id = (doc.metadata or {}).get("complaint_id")
+    return str(complaint_id if complaint_id is not None else doc.id)
+
+
+class PackedContext:
+    """The prompt context and what went into it."""
+    __slots__ = ("text", "tokens", "sentences", "citations", "redundant", "over_budget")
+
+    def __init__(self, text, tokens, sentences, citations, redundant, over_budget):
+        self.text = text
+        self.tokens = tokens
+        self.sentences = sentences      # [(complaint tag, sentence)] in prompt order
+        self.citations = citations      # {tag: [complaint ids]} incl. near-duplicates merged at ingestion
+        self.redundant = redundant      # sentences dropped as repeats of a kept one
+        self.over_budget = over_budget  # sentences that did not fit
+
+
+class ContextBuilder:
+    """
+    Packs the best sentences of the retrieved chunks into a token budget.
+
+    Sentences are scored by the idf-weighted question terms they contain,
+    plus a prior for the rank of their chunk, and taken greedily while they
+    fit; near-repeats of a kept sentence are skipped. Kept sentences go back
+    in chunk order and original order, one line per chunk, led by the
+    complaint id so the answer can cite it:
+
+        [#3241187] I was charged a late fee. The payment posted on time.
+    """
+
+    def __init__(self, token_counter=None, redundancy_threshold=REDUNDANCY_THRESHOLD, rank_weight=RANK_WEIGHT):
+        self.count = token_counter or load_token_counter(GENERATOR_TOKENIZER_PATH, GENERATOR_TOKENIZER_ID)
+        self.redundancy_threshold = redundancy_threshold
+        self.rank_weight = rank_weight
+
+    def build(self, question, docs, budget=CONTEXT_BUDGET_TOKENS):
+        """PackedContext of at most `budget` tokens (None: no limit, only repeats are dropped)."""
+        # 1. Candidate sentences with their terms
+        candidates = []
+        for rank, doc in enumerate(docs):
+            for position, sentence in enumerate(split_sentences(doc.page_content)):
+                candidates.append((rank, position, sentence, set(tokenize(sentence))))
+        df = {}
+        for *_, terms in candidates:
+            for term in terms:
+                df[term] = df.get(term, 0) + 1
+        query = set(tokenize(question))
+
+        def score(candidate):
+            rank, position, _, terms = candidate
+            relevance = sum(math.log(1 + len(candidates) / df[t]) for t in query & terms)
+            return (relevance / math.sqrt(1 + len(terms)) + self.rank_weight / (1 + rank), -rank, -position)
+
+        # 2. Greedy packing, best first; a chunk's tag is paid for with its first sentence
+        kept, kept_terms, tagged = [], [], set()
+        redundant = over_budget = 0
+        used = 0
+        for candidate in sorted(candidates, key=score, reverse=True):
+            rank, _, sentence, terms = candidate
+            if not terms or any(len(terms & other) / len(terms | other) >= self.redundancy_threshold
+                                for other in kept_terms):
+                redundant += 1
+                continue
+            cost = self.count(sentence) + 1
+            if rank not in tagged:
+                cost += self.count(f"[#{complaint_tag(docs[rank])}]") + 1
+            if budget is not None and used + cost > budget:
+                over_budget += 1
+                continue
+            kept.append(candidate)
+            kept_terms.append(terms)
+            tagged.add(rank)
+            used += cost
+
+        # 3. Back in reading order; the estimate above is per piece, so check the joined text
+        kept.sort(key=lambda c: (c[0], c[1]))
+        text = self._format(docs, kept)
+        tokens = self.count(text)
+        while budget is not None and tokens > budget and kept:
+            kept.remove(min(kept, key=score))
+            over_budget += 1
+            text = self._format(docs, kept)
+            tokens = self.count(text)
+
+        citations = {}
+        for rank in sorted({c[0] for c in kept}):
+            meta = docs[rank].metadata or {}
+            ids = meta.get("complaint_ids") or complaint_tag(docs[rank])
+            citations[complaint_tag(docs[rank])] = str(ids).split(",")
+        return PackedContext(text, tokens, [(complaint_tag(docs[c[0]]), c[2]) for c in kept], citations,
+                             redundant, over_budget)
+
+    @staticmethod
+    def _format(docs, kept):
+        lines = {}
+        for rank, _, sentence, _ in kept:
+            lines.setdefault(rank, [f"[#{complaint_tag(docs[rank])}]"]).append(sentence)
+        return "\n".join(" ".join(line) for line in lines.values())
@@ -0,0 +1,341 @@
+# src/embedding_cache.py
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import logging
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    from .inference_backends import EMBED_BACKEND, cache_namespace, check_backend, load_embeddings
+except ImportError:
+    from inference_backends import EMBED_BACKEND, cache_namespace, check_backend, load_embeddings
+
+# --- CONFIGURATION ---
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+CACHE_DIR = "./embedding_cache"
+CACHE_DTYPE = "float16"              # float16 halves the file; cosine drift is ~1e-4 for MiniLM
+MAX_CACHE_BYTES = 2 * 1024 ** 3      # Vectors file budget before LRU eviction kicks in
+SQL_BATCH = 500                      # Stay well below SQLite's bound-variable limit
+
+_WHITESPACE = re.compile(r"\s+")
+logger = logging.getLogger("CreditRAG")
+
+
+def normalize_text(text):
+    """Canonical form used for cache keys (unicode NFC, collapsed whitespace)."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(model_name, text, kind="doc"):
+    """Content address of an embedding: (model, query/doc, normalized text)."""
+    payload = f"{model_name}\0{kind}\0{normalize_text(text)}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed vector store for one embedding model.
+
+    Vectors live in a flat `vectors.bin` file (memory-mapped, one fixed-size
+    slot per entry); `index.sqlite` maps key -> slot and tracks last use for
+    LRU eviction. Slot allocation happens inside an IMMEDIATE transaction,
+    so several processes can share one cache directory. Entries are evicted
+    before new slots are allocated and slots never go past max_entries, so
+    the file stays within `max_bytes` (it is compacted and truncated if the
+    budget was lowered). The vector dim and dtype are kept in the meta
+    table; a cache written with other ones is cleared instead of misread.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, cache_dir=CACHE_DIR,
+                 dtype=CACHE_DTYPE, max_bytes=MAX_CACHE_BYTES):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.path = os.path.join(cache_dir, slug)
+        os.makedirs(self.path, exist_ok=True)
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = max_bytes
+        self.vectors_path = os.path.join(self.path, "vectors.bin")
+        self._lock = threading.RLock()
+        self._mmap = None
+        self._dim = None
+
+        self._db = sqlite3.connect(os.path.join(self.path, "index.sqlite"),
+                                   check_same_thread=False, isolation_level=None, timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER, last_used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        stored_dtype = self._meta("dtype")
+        if stored_dtype is not None and stored_dtype != self.dtype.name:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._reset(f"it holds {stored_dtype} vectors, not {self.dtype.name}")
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    # --- Layout helpers ---
+
+    def _meta(self, name):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (name, str(value)))
+
+    @property
+    def dim(self):
+        if self._dim is None and self._meta("dim") is not None:
+            self._dim = int(self._meta("dim"))
+        return self._dim
+
+    @property
+    def _row_bytes(self):
+        return self.dim * self.dtype.itemsize
+
+    def _vectors(self, min_slots=0):
+        """Memory map of the vectors file, remapped if another writer grew or truncated it (None if empty)."""
+        file_slots = os.path.getsize(self.vectors_path) // self._row_bytes if os.path.exists(self.vectors_path) else 0
+        if file_slots < min_slots:
+            # Grow geometrically so appends don't remap on every batch, but never past the budget
+            file_slots = max(min_slots, min(max(2 * file_slots, 1024), self.max_entries))
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(file_slots * self._row_bytes)
+        if self._mmap is None or len(self._mmap) != file_slots:
+            self._mmap = None
+            if file_slots:
+                self._mmap = np.memmap(self.vectors_path, dtype=self.dtype, mode="r+", shape=(file_slots, self.dim))
+        return self._mmap
+
+    def _reset(self, reason):
+        """Empties the cache (inside the caller's transaction)."""
+        logger.warning("embedding cache %s: cleared, %s", self.path, reason)
+        self._db.execute("DELETE FROM entries")
+        self._db.execute("DELETE FROM free_slots")
+        self._db.execute("DELETE FROM meta")
+        self._mmap, self._dim = None, None
+        if os.path.exists(self.vectors_path):
+            os.truncate(self.vectors_path, 0)
+
+    @property
+    def max_entries(self):
+        return max(1, self.max_bytes // (self.dim * self.dtype.itemsize)) if self.dim else None
+
+    # --- Public API ---
+
+    def _lookup(self, keys):
+        slots = {}
+        for i in range(0, len(keys), SQL_BATCH):
+            part = keys[i:i + SQL_BATCH]
+            marks = ",".join("?" * len(part))
+            slots.update(self._db.execute(f"SELECT key, slot FROM entries WHERE key IN ({marks})", part))
+        return slots
+
+    def get_many(self, keys):
+        """Returns {key: float32 vector} for the keys that are cached."""
+        if not keys or self.dim is None:
+            return {}
+        with self._lock:
+            vectors = self._vectors()
+            # A slot past the end of the file was moved by a compaction in another process: a miss
+            slots = {key: slot for key, slot in self._lookup(keys).items() if vectors is not None and slot < len(vectors)}
+            if not slots:
+                return {}
+            found = {key: np.asarray(vectors[slot], dtype=np.float32) for key, slot in slots.items()}
+            now = time.time()
+            # One transaction: in autocommit mode every row would be its own commit
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, k) for k in slots])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return found
+
+    def put_many(self, items):
+        """Stores {key: vector}; evicts least recently used entries so the file stays within max_bytes."""
+        if not items:
+            return
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._dim = None  # another process may have reset the cache
+                dim = len(next(iter(items.values())))
+                if self.dim is not None and self.dim != dim:
+                    self._reset(f"it holds {self.dim}-d vectors, the model now returns {dim}-d ones")
+                if self.dim is None:
+                    self._set_meta("dim", dim)
+                    self._set_meta("next_slot", 0)
+                if self._meta("dtype") is None:  # written before dtypes were recorded
+                    self._set_meta("dtype", self.dtype.name)
+                # Another process may have stored some of these in the meantime
+                present = self._lookup(list(items))
+                keys = [k for k in items if k not in present][:self.max_entries]
+                if keys:
+                    self._evict(room=len(keys))
+                    free = [s for (s,) in self._db.execute(
+                        "SELECT slot FROM free_slots ORDER BY slot LIMIT ?", (len(keys),))]
+                    self._db.executemany("DELETE FROM free_slots WHERE slot = ?", [(s,) for s in free])
+                    next_slot = int(self._meta("next_slot"))
+                    slots = free + list(range(next_slot, next_slot + len(keys) - len(free)))
+                    self._set_meta("next_slot", next_slot + len(keys) - len(free))
+
+                    # Vectors are written before the index rows that point at them
+                    vectors = self._vectors(min_slots=max(slots) + 1)
+                    vectors[slots] = np.asarray([items[k] for k in keys], dtype=self.dtype)
+                    vectors.flush()
+                    now = time.time()
+                    self._db.executemany("INSERT INTO entries VALUES (?, ?, ?)",
+                                         [(k, s, now) for k, s in zip(keys, slots)])
+                if self.size_bytes() > self.max_entries * self._row_bytes:
+                    self._compact()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _evict(self, room=0):
+        """Drops least recently used entries until `room` more fit in max_entries."""
+        overflow = len(self) + room - self.max_entries
+        if overflow <= 0:
+            return
+        victims = self._db.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (overflow,)).fetchall()
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+        self._db.executemany("INSERT OR IGNORE INTO free_slots VALUES (?)", [(s,) for _, s in victims])
+
+    def _compact(self):
+        """Moves entries out of slots past max_entries (a lowered budget) and truncates the file."""
+        self._evict()
+        limit = self.max_entries
+        moved = self._db.execute("SELECT key, slot FROM entries WHERE slot >= ?", (limit,)).fetchall()
+        targets = [s for (s,) in self._db.execute(
+            "SELECT slot FROM free_slots WHERE slot < ? ORDER BY slot LIMIT ?", (limit, len(moved)))]
+        vectors = self._vectors()
+        if moved:
+            vectors[targets] = vectors[[s for _, s in moved]]
+            vectors.flush()
+        self._db.executemany("UPDATE entries SET slot = ? WHERE key = ?", [(t, k) for (k, _), t in zip(moved, targets)])
+        self._db.executemany("DELETE FROM free_slots WHERE slot = ?", [(t,) for t in targets])
+        self._db.execute("DELETE FROM free_slots WHERE slot >= ?", (limit,))
+        next_slot = min(int(self._meta("next_slot")), limit)
+        self._set_meta("next_slot", next_slot)
+        del vectors
+        self._mmap = None  # unmapped before the file shrinks
+        os.truncate(self.vectors_path, next_slot * self._row_bytes)
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def size_bytes(self):
+        return os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only runs the model for texts it has never seen.
+
+    `embeddings_factory` is called on the first cache miss, so a fully cached
+    run never loads the transformer at all. `symmetric` models (MiniLM)
+    embed queries exactly like documents, so query batches share one
+    forward pass.
+    """
+
+    def __init__(self, embeddings_factory, model_name=EMBEDDING_MODEL_NAME, cache=None, symmetric=True):
+        self.model_name = model_name
+        self.symmetric = symmetric
+        self.cache = cache if cache is not None else EmbeddingCache(model_name)
+        self._factory = embeddings_factory
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._factory()
+        return self._model
+
+    def _embed(self, texts, kind):
+        keys = [text_key(self.model_name, t, kind) for t in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        # Duplicates inside one batch are computed once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(keys) - sum(1 for k in keys if k in missing)
+        self.misses += len(missing)
+
+        if missing:
+            if kind == "query" and not self.symmetric:
+                computed = [self.model.embed_query(t) for t in missing.values()]
+            else:
+                computed = self.model.embed_documents(list(missing.values()))
+            new = dict(zip(missing, (np.asarray(v, dtype=np.float32) for v in computed)))
+            self.cache.put_many(new)
+            found.update(new)
+
+        return [found[k].tolist() for k in keys]
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts), "doc")
+
+    def embed_query(self, text):
+        return self._embed([text], "query")[0]
+
+    def embed_queries(self, texts):
+        """Batched embed_query (one forward pass for all misses of a symmetric model)."""
+        return self._embed(list(texts), "query")
+
+    def worker_report(self):
+        """Per-worker throughput of the underlying model, if it tracks any."""
+        report = getattr(self._model, "report", None)
+        return report() if report else {}
+
+    def close(self):
+        close = getattr(self._model, "close", None)
+        if close:
+            close()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.cache),
+            "bytes": self.cache.size_bytes(),
+        }
+
+
+def load_embedding_model(model_name=EMBEDDING_MODEL_NAME, cache_dir=CACHE_DIR, workers=0, backend=EMBED_BACKEND):
+    """
+    The MiniLM embedder used by ingestion, mock ingestion and query time, behind the cache.
+    workers > 0 encodes cache misses with a ParallelEmbedder (bulk ingestion).
+    `backend` is one of inference_backends.BACKENDS; each backend has its own cache.
+    """
+    check_backend(backend)
+
+    def factory():
+        if workers > 0:
+            try:
+                from .parallel_embedding import ParallelEmbedder
+            except ImportError:
+                from parallel_embedding import ParallelEmbedder
+            return ParallelEmbedder(model_name, workers=workers, backend=backend)
+        return load_embeddings(model_name, backend)
+
+    namespace = cache_namespace(model_name, backend)
+    return CachedEmbeddings(factory, namespace, EmbeddingCache(namespace, cache_dir))
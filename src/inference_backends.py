@@ -0,0 +1,100 @@
+# src/inference_backends.py
+import os
+from langchain_core.embeddings import Embeddings
+
+# --- CONFIGURATION ---
+# One place to pick how MiniLM and Flan-T5 run on CPU:
+#   torch - fp32 PyTorch (the original setup)
+#   int8  - PyTorch with dynamically quantized int8 Linear layers
+#   onnx  - ONNX Runtime (models are exported on first load; needs `optimum[onnxruntime]`)
+BACKENDS = ("torch", "int8", "onnx")
+INFERENCE_BACKEND = os.getenv("RAG_BACKEND", "torch")
+EMBED_BACKEND = os.getenv("RAG_EMBED_BACKEND", INFERENCE_BACKEND)
+LLM_BACKEND = os.getenv("RAG_LLM_BACKEND", INFERENCE_BACKEND)
+
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; choose one of {', '.join(BACKENDS)}")
+    return backend
+
+
+def cache_namespace(model_name, backend):
+    """Embedding-cache namespace: vectors from different backends are never mixed."""
+    return model_name if backend == "torch" else f"{model_name}-{backend}"
+
+
+class EmbedderMismatch(RuntimeError):
+    """The index was embedded by another model than the one that would embed into / query it."""
+
+
+def index_embedder(model_name, backend):
+    """The index_meta.json fields that record which embedder built an index."""
+    return {"embed_model": model_name, "embed_backend": backend}
+
+
+def check_index_embedder(meta, model_name, backend):
+    """
+    Compares the embedder recorded in an index's metadata with `model_name` /
+    `backend`. Another model raises EmbedderMismatch (its vectors are in a
+    different space); another backend of the same model returns a warning,
+    since its vectors drift slightly (benchmarks/compare_backends.py).
+    Returns None if they match or the index predates the fields.
+    """
+    built_model, built_backend = meta.get("embed_model"), meta.get("embed_backend")
+    if built_model not in (None, model_name):
+        raise EmbedderMismatch(f"the index was embedded with {built_model!r}, not {model_name!r}; "
+                               "re-run the ingestion with --rebuild")
+    if built_backend not in (None, backend):
+        return f"the index was embedded with the {built_backend} backend, not {backend}"
+    return None
+
+
+def _quantize(model):
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+# --- MiniLM (sentence-transformers) ---
+
+def load_sentence_transformer(model_name, backend=EMBED_BACKEND):
+    from sentence_transformers import SentenceTransformer
+    if check_backend(backend) == "onnx":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx")
+    model = SentenceTransformer(model_name, device="cpu")
+    return _quantize(model) if backend == "int8" else model
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """LangChain wrapper around an already-built SentenceTransformer (same output as HuggingFaceEmbeddings)."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def embed_documents(self, texts):
+        return self.model.encode(list(texts), show_progress_bar=False, convert_to_numpy=True).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def load_embeddings(model_name, backend=EMBED_BACKEND):
+    """In-process embedder for `backend`."""
+    if check_backend(backend) == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name)
+    return SentenceTransformerEmbeddings(load_sentence_transformer(model_name, backend))
+
+
+# --- Flan-T5 (transformers seq2seq) ---
+
+def load_seq2seq(model_id, backend=LLM_BACKEND):
+    """(model, tokenizer) for a text2text model on `backend`."""
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    if check_backend(backend) == "onnx":
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        return ORTModelForSeq2SeqLM.from_pretrained(model_id, export=True), tokenizer
+    from transformers import AutoModelForSeq2SeqLM
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_id).eval()
+    return (_quantize(model) if backend == "int8" else model), tokenizer
@@ -1,15 +1,48 @@
 import os
-import shutil
+import time
+import uuid
+import argparse
+import threading
+from queue import Queue
+from collections import defaultdict
+from itertools import islice
+import numpy as np
 import pandas as pd
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
-from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from sklearn.model_selection import train_test_split
 
+try:
+    from .embedding_cache import EMBEDDING_MODEL_NAME, load_embedding_model
+    from .inference_backends import BACKENDS, EMBED_BACKEND, EmbedderMismatch, check_index_embedder, index_embedder
+    from .parallel_embedding import EMBED_WORKERS
+    from .chunking import CHUNK_WORKERS, TOKEN_COUNTER, ChunkDeduplicator, ComplaintRecord
+    from .chunking import default_token_counter, iter_record_chunks
+    from .scope_index import PARTITION_PREFIX, ScopeIndex, partition_name
+    from .lexical_index import LexicalIndexBuilder
+    from .telemetry import peak_rss_mb, span, telemetry
+    from .compact_store import COMPACT_DIR, COMPACT_MODE, MODES, VECTOR_BACKEND, export_compact_store, read_manifest
+    from .aggregates import AGGREGATES_FILE, AggregateBuilder, pyarrow
+    from .snapshots import (
+        collect_garbage, current_version, discard, new_snapshot, publish, read_index_meta, resolve, write_index_meta
+    )
+except ImportError:  # run as a script / from tests with src/ on sys.path
+    from embedding_cache import EMBEDDING_MODEL_NAME, load_embedding_model
+    from inference_backends import BACKENDS, EMBED_BACKEND, EmbedderMismatch, check_index_embedder, index_embedder
+    from parallel_embedding import EMBED_WORKERS
+    from chunking import CHUNK_WORKERS, TOKEN_COUNTER, ChunkDeduplicator, ComplaintRecord
+    from chunking import default_token_counter, iter_record_chunks
+    from scope_index import PARTITION_PREFIX, ScopeIndex, partition_name
+    from lexical_index import LexicalIndexBuilder
+    from telemetry import peak_rss_mb, span, telemetry
+    from compact_store import COMPACT_DIR, COMPACT_MODE, MODES, VECTOR_BACKEND, export_compact_store, read_manifest
+    from aggregates import AGGREGATES_FILE, AggregateBuilder, pyarrow
+    from snapshots import (
+        collect_garbage, current_version, discard, new_snapshot, publish, read_index_meta, resolve, write_index_meta
+    )
+
 # --- CONFIGURATION ---
 DATA_PATH = "data/raw/complaints.csv" # Make sure your file is here!
-DB_PATH = "./chroma_db"
+DB_PATH = "./chroma_db"  # each run writes a new snapshot in DB_PATH/snapshots/ and publishes it
 TARGET_PRODUCTS = [
     "Credit card",
     "Credit card or prepaid card", # Handling CFPB naming variations
@@ -20,83 +53,534 @@ TARGET_PRODUCTS = [
 ]
 SAMPLE_SIZE = 12500 # Target size per assignment
 
-def run_ingestion():
-    print("--- STARTING REAL INGESTION PIPELINE ---")
-    
-    # 1. Load Data
-    if not os.path.exists(DATA_PATH):
-        print(f"❌ Error: File not found at {DATA_PATH}. Please move your CSV there.")
-        return
+# Streaming settings: only these columns are parsed, CSV_CHUNK_SIZE rows at a time
+USECOLS = ["Product", "Consumer complaint narrative", "Complaint ID", "Issue", "Date received"]
+TEXT_DTYPES = {"Product": str, "Consumer complaint narrative": str, "Issue": str, "Date received": str}
+CSV_CHUNK_SIZE = 100_000
+EMBED_BATCH_SIZE = 5000
+RANDOM_STATE = 42
+ID_PAGE_SIZE = 50_000
+CHUNK_MODE = os.getenv("RAG_CHUNK_MODE", "tokens")  # "tokens" (MiniLM-sized) or "chars", see chunking.py
+# Per-product copies of every chunk: faster scoped search, but twice the index on disk and twice the writes
+PRODUCT_PARTITIONS = os.getenv("RAG_PRODUCT_PARTITIONS", "0") == "1"
+INDEX_VERSION_FILE = "index_version"  # rewritten on every change; versions an index served in place (no snapshots)
+
+
+# --- STAGE 1: LOAD & FILTER ---
+
+def iter_product_chunks(path=DATA_PATH, chunk_size=CSV_CHUNK_SIZE):
+    """Reads the CSV in bounded chunks and yields the rows of the relevant products (with or without text)."""
+    reader = pd.read_csv(
+        path,
+        usecols=lambda col: col in USECOLS,
+        dtype=TEXT_DTYPES,
+        chunksize=chunk_size
+    )
+    for chunk in telemetry.timed_iter("ingest.csv_load", reader):
+        with span("ingest.filter"):
+            chunk = chunk[chunk['Product'].isin(TARGET_PRODUCTS)]
+        if len(chunk):
+            yield chunk
+
+
+def drop_missing_narratives(chunks):
+    """Only the rows that have a narrative (the ones that can be embedded)."""
+    for chunk in chunks:
+        with span("ingest.filter"):
+            chunk = chunk.dropna(subset=['Consumer complaint narrative'])
+        if len(chunk):
+            yield chunk
+
+
+def iter_filtered_chunks(path=DATA_PATH, chunk_size=CSV_CHUNK_SIZE):
+    """Reads the CSV in bounded chunks and yields only relevant rows with a narrative."""
+    return drop_missing_narratives(iter_product_chunks(path, chunk_size))
+
+
+# --- STAGE 2: STRATIFIED SAMPLING ---
+
+def perform_stratified_split(df, stratify_col, test_size=None, train_size=None, random_state=RANDOM_STATE):
+    """In-memory stratified split. Returns (train_df, test_df)."""
+    return train_test_split(
+        df,
+        test_size=test_size,
+        train_size=train_size,
+        stratify=df[stratify_col],
+        random_state=random_state
+    )
+
+
+def _allocate_quotas(counts, sample_size):
+    """Proportional allocation per stratum (largest remainder), like sklearn's stratified split."""
+    exact = counts * sample_size / counts.sum()
+    quotas = np.floor(exact).astype(int)
+    leftover = int(sample_size - quotas.sum())
+    if leftover > 0:
+        remainders = (exact - quotas).sort_values(ascending=False, kind="stable")
+        quotas[remainders.index[:leftover]] += 1
+    return quotas
+
+
+def _sample_keys(chunk, random_state):
+    """Uniform [0, 1) key per row derived from a seeded hash of its Complaint ID."""
+    key_col = 'Complaint ID' if 'Complaint ID' in chunk else 'Consumer complaint narrative'
+    hashes = pd.util.hash_pandas_object(chunk[key_col], index=False, hash_key=f"{random_state:016d}")
+    return hashes.to_numpy() / float(2 ** 64)
 
+
+def stratified_reservoir_sample(chunks, sample_size=SAMPLE_SIZE, stratify_col='Product', random_state=RANDOM_STATE):
+    """
+    Streaming equivalent of perform_stratified_split(train_size=sample_size).
+
+    Every row gets a uniform pseudo-random key and each stratum keeps only the
+    `sample_size` rows with the smallest keys (a per-product reservoir), so
+    memory is bounded by sample_size * n_products + one CSV chunk. Once the
+    true product counts are known, each reservoir is cut down to its
+    proportional quota. Returns (sampled_df, product_counts).
+
+    Keys are hashed from the Complaint ID, so a complaint keeps its key across
+    runs and a daily delta only changes the sample at the margins (needed for
+    incremental re-indexing).
+    """
+    pool = None
+    counts = pd.Series(dtype="int64")
+
+    for chunk in chunks:
+        with span("ingest.sample"):
+            counts = counts.add(chunk[stratify_col].value_counts(), fill_value=0)
+            chunk = chunk.assign(_sample_key=_sample_keys(chunk, random_state))
+            pool = chunk if pool is None else pd.concat([pool, chunk])
+            pool = pool.sort_values('_sample_key', kind="stable")
+            pool = pool.groupby(stratify_col, sort=False).head(sample_size)
+
+    counts = counts.astype("int64")
+    if pool is None:
+        return pd.DataFrame(columns=USECOLS), counts
+
+    pool = pool.sort_values('_sample_key', kind="stable")
+    if counts.sum() > sample_size:
+        quotas = _allocate_quotas(counts, sample_size)
+        rank = pool.groupby(stratify_col, sort=False).cumcount()
+        pool = pool[rank < pool[stratify_col].map(quotas)]
+
+    return pool.drop(columns='_sample_key'), counts
+
+
+def load_sample_in_memory(path=DATA_PATH, aggregates=None):
+    """Original path: reads the whole CSV, then filters and samples it."""
     print("Loading CSV... (this might take a moment)...")
-    df = pd.read_csv(DATA_PATH, low_memory=False)
+    with span("ingest.csv_load"):
+        df = pd.read_csv(path, low_memory=False)
     print(f"Raw Data Loaded: {len(df)} rows")
 
-    # 2. Filter & Clean
-    # Filter for products we care about
-    df = df[df['Product'].isin(TARGET_PRODUCTS)]
-    
-    # Drop rows with no narrative (Empty text)
-    df = df.dropna(subset=['Consumer complaint narrative'])
+    # Filter for products we care about & drop rows with no narrative (Empty text)
+    with span("ingest.filter"):
+        df = df[df['Product'].isin(TARGET_PRODUCTS)]
+    if aggregates is not None:  # counts over every complaint of these products, with or without text
+        with span("ingest.aggregate"):
+            aggregates.add(df)
+    with span("ingest.filter"):
+        df = df.dropna(subset=['Consumer complaint narrative'])
     print(f"Filtered (Relevant Products + Has Text): {len(df)} rows")
 
-    # 3. Stratified Sampling
     # We want ~12,500 rows. If we have less, take them all.
     if len(df) > SAMPLE_SIZE:
         print(f"Downsampling to {SAMPLE_SIZE} rows using Stratified Sampling...")
         # Stratify by 'Product' to keep ratios
-        sampled_df, _ = train_test_split(
-            df, 
-            train_size=SAMPLE_SIZE, 
-            stratify=df['Product'], 
-            random_state=42
-        )
+        with span("ingest.sample"):
+            sampled_df, _ = perform_stratified_split(df, stratify_col='Product', train_size=SAMPLE_SIZE)
     else:
         sampled_df = df
         print("Dataset smaller than target sample. Using all available data.")
+    return sampled_df
+
+
+def load_sample_streaming(path=DATA_PATH, chunk_size=CSV_CHUNK_SIZE, aggregates=None):
+    """Streaming path: peak memory is bounded by `chunk_size`, not by the file size."""
+    print(f"Streaming CSV in chunks of {chunk_size} rows...")
+    chunks = iter_product_chunks(path, chunk_size)
+    if aggregates is not None:  # counts over every complaint of these products, with or without text
+        chunks = aggregates.observe(chunks)
+    sampled_df, counts = stratified_reservoir_sample(drop_missing_narratives(chunks))
+    print(f"Filtered (Relevant Products + Has Text): {int(counts.sum())} rows")
+    print(f"Stratified sample: {len(sampled_df)} rows")
+    return sampled_df
+
+
+# --- STAGE 3: RECORDS & CHUNKING ---
+
+def iter_records(df):
+    """Yields one ComplaintRecord per row, reading each column once (no iterrows)."""
+    n = len(df)
+    texts = df['Consumer complaint narrative'].to_numpy()
+    products = df['Product'].to_numpy()
+    # .tolist() hands back plain Python ints/strs, which is what Chroma metadata expects
+    ids = df['Complaint ID'].tolist() if 'Complaint ID' in df else ['Unknown'] * n
+    issues = df['Issue'].fillna('Unknown').tolist() if 'Issue' in df else ['Unknown'] * n
+    for record in zip(texts, products, ids, issues):
+        yield ComplaintRecord(*record)
+
+
+def iter_batches(items, batch_size):
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+# --- STAGE 4: INCREMENTAL INDEXING ---
+
+def get_existing_ids(vectorstore):
+    """All chunk ids currently stored, fetched page by page."""
+    ids, offset = set(), 0
+    while True:
+        page = vectorstore.get(include=[], limit=ID_PAGE_SIZE, offset=offset)["ids"]
+        ids.update(page)
+        if len(page) < ID_PAGE_SIZE:
+            return ids
+        offset += ID_PAGE_SIZE
+
 
-    # 4. Prepare Documents
-    print("Converting to Documents...")
-    documents = []
-    for _, row in sampled_df.iterrows():
-        # Combine relevant metadata
-        text = row['Consumer complaint narrative']
-        meta = {
-            "product": row['Product'],
-            "complaint_id": row.get('Complaint ID', 'Unknown'),
-            "issue": row.get('Issue', 'Unknown')
-        }
-        documents.append(Document(page_content=text, metadata=meta))
-
-    # 5. Chunking (Task 2 Requirement)
-    print("Chunking Documents...")
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,  # Defined in assignment
-        chunk_overlap=50
+def get_partition(vectorstore, product):
+    """The per-product collection for `product` (same client and distance metric as the main one)."""
+    return vectorstore._client.get_or_create_collection(
+        partition_name(product), metadata=vectorstore._collection.metadata
     )
-    chunks = splitter.split_documents(documents)
-    print(f"Created {len(chunks)} chunks from {len(documents)} complaints.")
-
-    # 6. Embed & Store
-    # Clear old database to start fresh
-    if os.path.exists(DB_PATH):
-        shutil.rmtree(DB_PATH)
-        
-    print("Embedding and Indexing... (This will take 5-10 minutes on CPU)...")
-    embedding_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    
-    # Process in batches to avoid crashing memory
-    batch_size = 5000
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i:i+batch_size]
-        print(f"Processing batch {i} to {i+len(batch)}...")
-        Chroma.from_documents(
-            documents=batch,
-            embedding=embedding_model,
-            persist_directory=DB_PATH
+
+
+def list_partitions(vectorstore):
+    return [c for c in vectorstore._client.list_collections() if c.name.startswith(PARTITION_PREFIX)]
+
+
+def upsert_partitioned(vectorstore, ids, embeddings, documents, metadatas, partitions=None):
+    """Upserts rows into the partition of their product (rows without a product are skipped)."""
+    partitions = {} if partitions is None else partitions
+    rows = defaultdict(list)
+    for i, meta in enumerate(metadatas):
+        if meta and meta.get("product"):
+            rows[meta["product"]].append(i)
+    for product, idx in rows.items():
+        if product not in partitions:
+            partitions[product] = get_partition(vectorstore, product)
+        partitions[product].upsert(
+            ids=[ids[i] for i in idx],
+            embeddings=[embeddings[i] for i in idx],
+            documents=[documents[i] for i in idx],
+            metadatas=[metadatas[i] for i in idx]
         )
 
-    print(f"\n✅ INGESTION COMPLETE! Database saved to {DB_PATH}")
+
+def drop_partitions(vectorstore):
+    """Deletes the per-product collections, so scoped queries use a filter on the main one. Returns how many."""
+    partitions = list_partitions(vectorstore)
+    for partition in partitions:
+        vectorstore._client.delete_collection(partition.name)
+    return len(partitions)
+
+
+def backfill_partitions(vectorstore, batch_size=EMBED_BATCH_SIZE):
+    """
+    Copies an index built before partitioning into per-product collections.
+    Vectors are read back from the main collection, nothing is re-embedded.
+    """
+    collection, offset, copied = vectorstore._collection, 0, 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            return copied
+        upsert_partitioned(vectorstore, page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+        copied += len(page["ids"])
+        offset += batch_size
+
+
+class ChromaWriter:
+    """
+    Single background writer for one long-lived collection.
+
+    The caller keeps embedding the next batch while the previous one is
+    upserted; the bounded queue stops embeddings piling up in memory.
+    With `partitioned`, each row is also written to its product's collection
+    (first, so a crash never leaves the main collection ahead of a partition).
+    """
+
+    def __init__(self, vectorstore, max_pending=2, partitioned=False):
+        # langchain's Chroma wrapper only accepts raw texts, so write precomputed vectors directly
+        self.vectorstore = vectorstore
+        self.collection = vectorstore._collection
+        self.partitions = {} if partitioned else None
+        self.error = None
+        self._queue = Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="chroma-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while (item := self._queue.get()) is not None:
+            if self.error is None:
+                batch, embeddings = item
+                rows = dict(
+                    ids=[c.id for c in batch],
+                    embeddings=embeddings,
+                    documents=[c.page_content for c in batch],
+                    metadatas=[c.metadata or None for c in batch]
+                )
+                try:
+                    with span("ingest.upsert"):
+                        if self.partitions is not None:
+                            upsert_partitioned(self.vectorstore, partitions=self.partitions, **rows)
+                        self.collection.upsert(**rows)
+                except Exception as e:
+                    self.error = e
+
+    def put(self, batch, embeddings):
+        if self.error is not None:
+            raise self.error
+        self._queue.put((batch, embeddings))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def sync_chunks(vectorstore, chunks, batch_size=EMBED_BATCH_SIZE, partitioned=False, existing=None):
+    """
+    Makes the collection contain exactly `chunks`, keyed by chunk id.
+
+    Only chunks whose id is not stored yet are embedded; ids that are no longer
+    produced (withdrawn complaints, edited narratives) are deleted afterwards,
+    so concurrent readers never see a complaint disappear mid-update.
+    Re-running on unchanged input embeds nothing. Returns (added, deleted, total).
+    With `partitioned`, the per-product collections are kept in step as well;
+    without it, partitions left by an earlier run are dropped rather than
+    left to go stale. `existing` is the set of stored ids, if the caller has already read it.
+    """
+    if existing is None:
+        existing = get_existing_ids(vectorstore)
+    if partitioned and existing and not list_partitions(vectorstore):
+        print(f"Copying {backfill_partitions(vectorstore, batch_size)} existing chunks into product partitions...")
+    elif not partitioned and (dropped := drop_partitions(vectorstore)):
+        print(f"Dropped {dropped} product partitions (RAG_PRODUCT_PARTITIONS is off).")
+    wanted = set()
+    added = 0
+
+    def new_chunks():
+        for chunk in chunks:
+            if chunk.id in wanted:
+                continue
+            wanted.add(chunk.id)
+            if chunk.id not in existing:
+                yield chunk
+
+    writer = ChromaWriter(vectorstore, partitioned=partitioned)
+    try:
+        # "ingest.chunk" is the time spent waiting for the next batch of split, not-yet-stored chunks
+        for batch in telemetry.timed_iter("ingest.chunk", iter_batches(new_chunks(), batch_size)):
+            print(f"Embedding batch {added} to {added + len(batch)}...")
+            with span("ingest.embed"):
+                embeddings = vectorstore.embeddings.embed_documents([c.page_content for c in batch])
+            writer.put(batch, embeddings)
+            added += len(batch)
+            telemetry.incr("ingest.chunks_embedded", len(batch))
+    finally:
+        writer.close()
+
+    stale = list(existing - wanted)
+    partitions = list_partitions(vectorstore) if partitioned and stale else []
+    for i in range(0, len(stale), batch_size):
+        for partition in partitions:  # partitions first, so a retry still finds the ids in the main collection
+            partition.delete(ids=stale[i:i + batch_size])
+        vectorstore.delete(ids=stale[i:i + batch_size])
+
+    telemetry.incr("ingest.chunks_deleted", len(stale))
+    return added, len(stale), len(wanted)
+
+
+def update_metadata(vectorstore, updates, batch_size=EMBED_BATCH_SIZE, partitioned=False):
+    """
+    Merges {chunk id: {field: value}} into stored chunks (and their
+    partitions) without re-embedding. Chunks that already hold these values
+    are not written. Returns how many chunks changed.
+    """
+    ids = list(updates)
+    changed = 0
+    for i in range(0, len(ids), batch_size):
+        rows = vectorstore._collection.get(ids=ids[i:i + batch_size], include=["metadatas"])
+        stale = [(chunk_id, meta or {}) for chunk_id, meta in zip(rows["ids"], rows["metadatas"])
+                 if any((meta or {}).get(field) != value for field, value in updates[chunk_id].items())]
+        if partitioned:
+            by_product = defaultdict(list)
+            for chunk_id, meta in stale:
+                by_product[meta.get("product")].append(chunk_id)
+            for product, chunk_ids in by_product.items():
+                if product is not None:
+                    get_partition(vectorstore, product).update(
+                        ids=chunk_ids, metadatas=[updates[c] for c in chunk_ids])
+        if stale:
+            vectorstore._collection.update(ids=[c for c, _ in stale], metadatas=[updates[c] for c, _ in stale])
+        changed += len(stale)
+    return changed
+
+
+def close_client(vectorstore):
+    """Lets go of the store's sqlite files (chromadb >= 1.0) before its snapshot is published or deleted."""
+    if hasattr(vectorstore._client, "close"):
+        vectorstore._client.close()
+
+
+def mark_index_updated(db_path=DB_PATH):
+    """Publishes a new index version so query-side caches know their answers are stale."""
+    os.makedirs(db_path, exist_ok=True)
+    tmp_path = os.path.join(db_path, INDEX_VERSION_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(f"{time.time():.0f}-{uuid.uuid4().hex[:8]}")
+    os.replace(tmp_path, os.path.join(db_path, INDEX_VERSION_FILE))
+
+
+# --- PIPELINE ---
+
+def run_ingestion(data_path=DATA_PATH, streaming=True, csv_chunk_size=CSV_CHUNK_SIZE, rebuild=False,
+                  workers=EMBED_WORKERS, chunk_workers=CHUNK_WORKERS, backend=EMBED_BACKEND, metrics_path=None,
+                  compact_mode=COMPACT_MODE if VECTOR_BACKEND == "compact" else None,
+                  partitioned=PRODUCT_PARTITIONS):
+    print("--- STARTING REAL INGESTION PIPELINE ---")
+
+    # 1. Load, Filter & Sample
+    if not os.path.exists(data_path):
+        print(f"❌ Error: File not found at {data_path}. Please move your CSV there.")
+        return
+
+    # New chunks must be embedded like the ones already in the published index
+    built_with = {} if rebuild else read_index_meta(resolve(DB_PATH)[1] or DB_PATH)
+    try:
+        mismatch = check_index_embedder(built_with, EMBEDDING_MODEL_NAME, backend)
+    except EmbedderMismatch as e:
+        print(f"❌ Error: {e}.")
+        return
+    if mismatch:
+        print(f"❌ Error: {mismatch}. Pass --backend {built_with['embed_backend']}, or --rebuild to re-embed everything.")
+        return
+
+    # Product / issue / month counts for aggregate questions are collected on the way through
+    aggregates = AggregateBuilder()
+    if streaming:
+        sampled_df = load_sample_streaming(data_path, csv_chunk_size, aggregates)
+    else:
+        sampled_df = load_sample_in_memory(data_path, aggregates)
+
+    # 2. Records -> Chunks (split in parallel, consumed batch by batch below). The token counter sets the
+    # chunk boundaries (and so the chunk ids): keep the one the published index was chunked with
+    token_counter = None
+    if CHUNK_MODE == "tokens":
+        token_counter = TOKEN_COUNTER or built_with.get("token_counter") or default_token_counter()
+        if built_with.get("token_counter") not in (None, token_counter):
+            print(f"⚠️ Token counter changed ({built_with['token_counter']} -> {token_counter}): "
+                  "every complaint is re-chunked and re-embedded.")
+    print(f"Converting to Records and Chunking ({CHUNK_MODE}" + (f", {token_counter} counter)..." if token_counter
+                                                                 else ")..."))
+    chunks = iter_record_chunks(iter_records(sampled_df), workers=chunk_workers, mode=CHUNK_MODE,
+                                token_counter=token_counter)
+    # Exact / near-duplicate chunks are dropped before anything is embedded; then product/issue
+    # counts for scoped retrieval and the BM25 postings are collected on the way through
+    dedup, scope, lexical = ChunkDeduplicator(), ScopeIndex(), LexicalIndexBuilder()
+    chunks = lexical.observe(scope.observe(dedup.observe(chunks)))
+
+    # 3. Embed & Store (incremental: only new/changed chunks are embedded) into a new snapshot:
+    # a copy of the published index (--rebuild starts from an empty one) that readers never see
+    # until it is complete and published, so serving processes keep running on the old one
+    version, snapshot_dir = new_snapshot(DB_PATH, rebuild=rebuild)
+    print(f"Writing snapshot {version}...")
+
+    # Everything up to the publish writes into the snapshot: a run that fails leaves no half-written
+    # copy behind (collect_garbage keeps the newest snapshots, so it could outlive the last good one)
+    vectorstore = None
+    try:
+        print(f"Embedding and Indexing new or changed chunks ({workers} worker processes, {backend} backend)...")
+        embedding_model = load_embedding_model(workers=workers, backend=backend)
+        vectorstore = Chroma(persist_directory=snapshot_dir, embedding_function=embedding_model)
+        existing = get_existing_ids(vectorstore)
+        try:
+            added, deleted, total = sync_chunks(vectorstore, chunks, existing=existing, partitioned=partitioned)
+        finally:
+            embedding_model.close()
+        # Only chunks from earlier runs (or credited with a duplicate late) can hold a stale complaint list
+        with span("ingest.dedup_metadata"):
+            merged = update_metadata(vectorstore, dedup.metadata_updates(stored=existing), partitioned=partitioned)
+
+        print(f"Index holds {total} chunks from {len(sampled_df)} complaints ({added} added, {deleted} deleted).")
+        dedup_stats = dedup.stats()
+        print(f"Deduplication: dropped {dedup_stats['dropped_exact']} exact and {dedup_stats['dropped_near']} "
+              f"near-duplicate chunks; complaint ids updated on {merged} kept chunks.")
+        write_index_meta(snapshot_dir, chunk_mode=CHUNK_MODE, token_counter=token_counter,
+                         **index_embedder(EMBEDDING_MODEL_NAME, backend))
+        scope.save(snapshot_dir)
+        lexical_index = lexical.build()
+        lexical_index.save(snapshot_dir)
+        print(f"Scope index: {len(scope.products)} products, "
+              f"{sum(len(i) for i in scope.issues.values())} product/issue pairs.")
+        print(f"Lexical index: {len(lexical_index.vocab)} terms, {len(lexical_index.doc_ids)} postings.")
+        # 4. Aggregate store for "main issues" / trend questions, see aggregates.py
+        if pyarrow is None:
+            print("⚠️ pyarrow is not installed, skipping the aggregate store (pip install pyarrow).")
+        else:
+            aggregate_store = aggregates.build()
+            aggregate_store.save(snapshot_dir)
+            print(f"Aggregate store: {int(aggregate_store.table['count'].sum())} complaints in "
+                  f"{len(aggregate_store.table)} product/issue/month cells ({AGGREGATES_FILE})")
+        # 5. Compact export for query pods (RAG_VECTOR_BACKEND=compact), see compact_store.py. It lives in the
+        # snapshot, which no reader sees before it is published, so it is written in place. It holds the
+        # texts and metadata too, so a run that only merged complaint ids (or changed the mode) re-exports
+        exported = False
+        compact = read_manifest(snapshot_dir) if compact_mode else None
+        if compact_mode and (added or deleted or merged or compact is None or compact["mode"] != compact_mode):
+            with span("ingest.compact_store"):
+                manifest = export_compact_store(vectorstore, snapshot_dir, mode=compact_mode)
+            exported = True
+            print(f"Compact store ({compact_mode}): {manifest['count']} vectors in {COMPACT_DIR}")
+        # 6. Publish: one atomic rename of DB_PATH/CURRENT; snapshots no reader uses any more are deleted
+        close_client(vectorstore)
+        if added or deleted or merged or exported or rebuild or current_version(DB_PATH) is None:
+            mark_index_updated(snapshot_dir)
+            publish(DB_PATH, version)
+            removed = collect_garbage(DB_PATH)
+            print(f"Published snapshot {version}" + (f"; removed {len(removed)} old snapshots." if removed else "."))
+        else:
+            discard(DB_PATH, version)
+            print("Index already up to date, nothing to do.")
+    except BaseException:
+        if vectorstore is not None:
+            close_client(vectorstore)
+        discard(DB_PATH, version)
+        raise
+    cache = embedding_model.stats()
+    print(f"Embedding cache: {cache['hits']} hits, {cache['misses']} misses ({cache['hit_rate']:.0%} hit rate)")
+    for pid, stats in embedding_model.worker_report().items():
+        print(f"  worker {pid}: {stats['chunks']} chunks, {stats['chunks_per_sec']:.1f} chunks/sec")
+    report = telemetry.snapshot()
+    for name, stats in report["spans"].items():
+        if name.startswith("ingest."):
+            print(f"  {name[len('ingest.'):]:>8}: {stats['total_ms'] / 1000:8.2f} s over {stats['count']} calls "
+                  f"(p95 {stats['p95_ms']:.0f} ms)")
+    print(f"Peak RSS: {peak_rss_mb():.0f} MB")
+    if metrics_path:
+        telemetry.export_jsonl(metrics_path)
+    print(f"\n✅ INGESTION COMPLETE! Database saved to {DB_PATH} (snapshot {current_version(DB_PATH)})")
 
 if __name__ == "__main__":
-    run_ingestion()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build or update the complaint vector store.")
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--in-memory", action="store_true", help="Load the whole CSV instead of streaming it")
+    parser.add_argument("--csv-chunk-size", type=int, default=CSV_CHUNK_SIZE)
+    parser.add_argument("--rebuild", action="store_true", help="Re-embed everything into an empty snapshot")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS, help="Embedding worker processes")
+    parser.add_argument("--chunk-workers", type=int, default=CHUNK_WORKERS, help="Text splitting worker processes")
+    parser.add_argument("--backend", choices=BACKENDS, default=EMBED_BACKEND, help="MiniLM inference backend")
+    parser.add_argument("--metrics-jsonl", help="Append the per-stage timings of this run to this file")
+    parser.add_argument("--compact-store", nargs="?", choices=MODES, const=COMPACT_MODE,
+                        default=COMPACT_MODE if VECTOR_BACKEND == "compact" else None,
+                        help="Also export a memory-mapped float16 / PQ copy of the index (default mode: %(const)s)")
+    parser.add_argument("--partitions", action="store_true", default=PRODUCT_PARTITIONS,
+                        help="Also keep a collection per product (faster scoped search, twice the index size)")
+    args = parser.parse_args()
+    run_ingestion(args.data_path, streaming=not args.in_memory, csv_chunk_size=args.csv_chunk_size,
+                  rebuild=args.rebuild, workers=args.workers, chunk_workers=args.chunk_workers, backend=args.backend,
+                  metrics_path=args.metrics_jsonl, compact_mode=args.compact_store, partitioned=args.partitions)
@@ -0,0 +1,174 @@
+# src/lexical_index.py
+import os
+import re
+from collections import Counter
+import numpy as np
+
+LEXICAL_INDEX_FILE = "lexical_index.npz"  # written next to the Chroma files by ingestion
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be been but by can did do does for from had has have i in is it its my me "
+    "not of on or so that the their them they this to was were what when which who why will with "
+    "you your xxxx xx".split()
+)
+
+
+def tokenize(text):
+    """Lower-cased word tokens without stopwords; a trailing plural 's' is dropped (fees -> fee)."""
+    tokens = []
+    for word in _TOKEN.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class LexicalIndexBuilder:
+    """Collects term counts while chunks flow to the vector store (see `observe`)."""
+
+    def __init__(self):
+        self.chunk_ids = []
+        self.products = []
+        self.issues = []
+        self.lengths = []
+        self.vocabulary = {}
+        self._terms = []   # per chunk: term ids
+        self._counts = []  # per chunk: term frequencies
+
+    def add(self, chunk_id, text, metadata=None):
+        metadata = metadata or {}
+        counts = Counter(tokenize(text))
+        term_ids = [self.vocabulary.setdefault(term, len(self.vocabulary)) for term in counts]
+        self.chunk_ids.append(chunk_id)
+        self.products.append(metadata.get("product") or "")
+        self.issues.append(metadata.get("issue") or "")
+        self.lengths.append(sum(counts.values()))
+        self._terms.append(np.array(term_ids, dtype=np.int32))
+        self._counts.append(np.fromiter(counts.values(), dtype=np.uint16, count=len(counts)))
+
+    def observe(self, chunks):
+        """Pass-through generator that indexes chunks on their way to the indexer."""
+        for chunk in chunks:
+            self.add(chunk.id, chunk.page_content, chunk.metadata)
+            yield chunk
+
+    def build(self):
+        """Packs the postings into CSR arrays: term t owns doc_ids[offsets[t]:offsets[t + 1]]."""
+        n_terms = len(self.vocabulary)
+        terms = np.concatenate(self._terms) if self._terms else np.zeros(0, np.int32)
+        counts = np.concatenate(self._counts) if self._counts else np.zeros(0, np.uint16)
+        docs = np.repeat(np.arange(len(self._terms), dtype=np.int32), [len(t) for t in self._terms])
+        order = np.argsort(terms, kind="stable")  # stable: postings stay sorted by doc id
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=n_terms), out=offsets[1:])
+
+        vocab = np.empty(n_terms, dtype=object)
+        for term, term_id in self.vocabulary.items():
+            vocab[term_id] = term
+        product_names, product_codes = np.unique(np.array(self.products, dtype=str), return_inverse=True)
+        issue_names, issue_codes = np.unique(np.array(self.issues, dtype=str), return_inverse=True)
+        return LexicalIndex(
+            vocab=vocab.astype(str), offsets=offsets, doc_ids=docs[order], tfs=counts[order],
+            lengths=np.array(self.lengths, dtype=np.int32), chunk_ids=np.array(self.chunk_ids, dtype=str),
+            product_names=product_names, product_codes=product_codes.astype(np.int32),
+            issue_names=issue_names, issue_codes=issue_codes.astype(np.int32),
+        )
+
+
+class LexicalIndex:
+    """
+    BM25 over array-backed postings (CSR offsets + doc ids + term frequencies).
+
+    Scoring a query touches only the postings of its terms, so exact terms
+    that embeddings blur ("Zelle", "APY", "prepayment penalty") are found
+    without scanning the collection.
+    """
+
+    def __init__(self, vocab, offsets, doc_ids, tfs, lengths, chunk_ids,
+                 product_names, product_codes, issue_names, issue_codes):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.lengths = lengths
+        self.chunk_ids = chunk_ids
+        self.product_names = product_names
+        self.product_codes = product_codes
+        self.issue_names = issue_names
+        self.issue_codes = issue_codes
+        self.term_ids = {term: i for i, term in enumerate(vocab.tolist())}
+        n = len(lengths)
+        avg_len = lengths.mean() if n else 1.0
+        # Per-document part of the BM25 denominator, computed once
+        self._norm = (BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(avg_len, 1e-9))).astype(np.float32)
+        df = np.diff(offsets)
+        self._idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def _mask(self, products=None, issue=None):
+        mask = None
+        if products:
+            codes = np.flatnonzero(np.isin(self.product_names, products))
+            mask = np.isin(self.product_codes, codes)
+        if issue:
+            codes = np.flatnonzero(self.issue_names == issue)
+            issue_mask = np.isin(self.issue_codes, codes)
+            mask = issue_mask if mask is None else mask & issue_mask
+        return mask
+
+    def search(self, query, k=20, products=None, issue=None):
+        """[(chunk_id, bm25 score)] best first, optionally restricted to products / issue."""
+        terms = [self.term_ids[t] for t in set(tokenize(query)) if t in self.term_ids]
+        if not terms or not len(self):
+            return []
+        scores = np.zeros(len(self), dtype=np.float32)
+        for t in terms:
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs, tf = self.doc_ids[start:end], self.tfs[start:end].astype(np.float32)
+            scores[docs] += self._idf[t] * tf * (BM25_K1 + 1) / (tf + self._norm[docs])
+        mask = self._mask(products, issue)
+        if mask is not None:
+            scores[~mask] = 0
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(str(self.chunk_ids[i]), float(scores[i])) for i in top]
+
+    # --- Persistence ---
+
+    def save(self, db_path):
+        os.makedirs(db_path, exist_ok=True)
+        tmp_path = os.path.join(db_path, LEXICAL_INDEX_FILE + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, vocab=self.vocab, offsets=self.offsets, doc_ids=self.doc_ids, tfs=self.tfs,
+                     lengths=self.lengths, chunk_ids=self.chunk_ids,
+                     product_names=self.product_names, product_codes=self.product_codes,
+                     issue_names=self.issue_names, issue_codes=self.issue_codes)
+        os.replace(tmp_path, os.path.join(db_path, LEXICAL_INDEX_FILE))
+
+    @classmethod
+    def load(cls, db_path):
+        """The saved index, or None if ingestion has not written one yet."""
+        path = os.path.join(db_path, LEXICAL_INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+
+def reciprocal_rank_fusion(*rankings, k=60):
+    """Fuses ranked id lists: score(id) = sum of 1 / (k + rank). Best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
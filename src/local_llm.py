@@ -0,0 +1,100 @@
+# src/local_llm.py
+import time
+import logging
+from threading import Thread
+from langchain_huggingface import HuggingFacePipeline
+from langchain_core.outputs import GenerationChunk
+
+try:
+    from .inference_backends import LLM_BACKEND, check_backend, load_seq2seq
+    from .telemetry import telemetry
+except ImportError:
+    from inference_backends import LLM_BACKEND, check_backend, load_seq2seq
+    from telemetry import telemetry
+
+LLM_MODEL_ID = "google/flan-t5-base"
+GENERATION_BATCH_SIZE = 8  # prompts per padded forward pass in llm.batch()
+PIPELINE_KWARGS = {
+    "max_new_tokens": 200,  # How long the answer can be
+    "temperature": 0.1      # Keep it factual
+}
+
+logger = logging.getLogger("CreditRAG")
+
+
+class Seq2SeqPipelineLLM(HuggingFacePipeline):
+    """
+    HuggingFacePipeline whose .stream() works for text2text models.
+
+    The stock _stream hands the prompt to the pipeline as `text_inputs`,
+    which only the text-generation pipeline accepts; here the encoder input
+    is built directly and model.generate() feeds a TextIteratorStreamer.
+    The time to the first token goes to the query.llm_first_token metric;
+    an exception in generate() ends the stream and is raised to the caller.
+    """
+
+    def _make_streamer(self, tokenizer):
+        from transformers import TextIteratorStreamer
+        return TextIteratorStreamer(tokenizer, timeout=60.0, skip_prompt=True, skip_special_tokens=True)
+
+    def _stream(self, prompt, stop=None, run_manager=None, **kwargs):
+        tokenizer = self.pipeline.tokenizer
+        streamer = self._make_streamer(tokenizer)
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True).to(self.pipeline.model.device)
+        generation_kwargs = {**self.pipeline_kwargs, **kwargs.get("pipeline_kwargs", {}), **inputs, "streamer": streamer}
+
+        errors = []
+
+        def generate():
+            try:
+                self.pipeline.model.generate(**generation_kwargs)
+            except BaseException as e:  # otherwise lost in the thread: the consumer would wait out the timeout
+                errors.append(e)
+                streamer.end()
+
+        start = time.perf_counter()
+        first_token_at = None
+        Thread(target=generate, daemon=True).start()
+        generated = []
+        for text in streamer:
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                telemetry.observe("query.llm_first_token", 1000 * (first_token_at - start))
+            generated.append(text)
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        if errors:
+            raise errors[0]
+
+        elapsed = time.perf_counter() - start
+        n_tokens = len(tokenizer("".join(generated), add_special_tokens=False).input_ids)
+        logger.info(
+            "generation: first token %.2fs, %d tokens in %.2fs (%.1f tokens/s)",
+            (first_token_at or time.perf_counter()) - start, n_tokens, elapsed, n_tokens / elapsed if elapsed else 0.0
+        )
+
+
+def load_llm(backend=LLM_BACKEND):
+    # 2. SETUP LLM (Free & Local - Google Flan-T5)
+    # The first time you run this, it will download ~900MB. That is normal.
+    print(f"Loading local AI model (Flan-T5, {check_backend(backend)} backend)... please wait...")
+
+    if backend == "torch":
+        return Seq2SeqPipelineLLM.from_model_id(
+            model_id=LLM_MODEL_ID,
+            task="text2text-generation",
+            batch_size=GENERATION_BATCH_SIZE,
+            pipeline_kwargs=PIPELINE_KWARGS
+        )
+
+    # int8 / ONNX models are built first and handed to the same pipeline
+    from transformers import pipeline
+    model, tokenizer = load_seq2seq(LLM_MODEL_ID, backend)
+    pipe = pipeline("text2text-generation", model=model, tokenizer=tokenizer, device="cpu",
+                    batch_size=GENERATION_BATCH_SIZE)
+    return Seq2SeqPipelineLLM(pipeline=pipe, model_id=LLM_MODEL_ID, batch_size=GENERATION_BATCH_SIZE,
+                              pipeline_kwargs=PIPELINE_KWARGS)
@@ -0,0 +1,72 @@
+# src/model_registry.py
+import time
+import logging
+import threading
+
+logger = logging.getLogger("CreditRAG")
+
+
+class ModelRegistry:
+    """
+    Process-wide home for expensive objects (models, vector store clients).
+
+    Factories are registered up front and only run on the first get(); every
+    thread (e.g. each Streamlit session) then shares the same instance.
+    Concurrent first calls for the same name wait for a single build.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.load_seconds = {}
+
+    def register(self, name, factory):
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._locks[name]:
+            instance = self._instances.get(name)
+            if instance is None:
+                start = time.perf_counter()
+                instance = self._factories[name]()
+                self.load_seconds[name] = time.perf_counter() - start
+                logger.info("Loaded %s in %.2fs", name, self.load_seconds[name])
+                # A factory may return None (e.g. no index yet); try again next time
+                if instance is not None:
+                    self._instances[name] = instance
+        return instance
+
+    def is_loaded(self, name):
+        return name in self._instances
+
+    def reset(self, name):
+        """Drops a cached instance so the next get() rebuilds it."""
+        with self._locks[name]:
+            self._instances.pop(name, None)
+
+    def warm_up(self, names, background=True):
+        """Builds `names` now; in a daemon thread if `background` (returns the thread)."""
+        def load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    logger.warning("Warm-up of %s failed: %s", name, e)
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+
+# One registry per process
+registry = ModelRegistry()
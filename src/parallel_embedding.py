@@ -0,0 +1,118 @@
+# src/parallel_embedding.py
+import os
+import time
+import multiprocessing as mp
+from collections import defaultdict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    from .embedding_cache import EMBEDDING_MODEL_NAME
+    from .inference_backends import EMBED_BACKEND, load_sentence_transformer
+except ImportError:
+    from embedding_cache import EMBEDDING_MODEL_NAME
+    from inference_backends import EMBED_BACKEND, load_sentence_transformer
+
+# --- CONFIGURATION ---
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", max(1, (os.cpu_count() or 1) // 4)))
+ENCODE_BATCH_SIZE = 64  # Texts per forward pass (length-sorted, so padding stays small)
+
+# Per-process models, keyed by (model_name, backend): loaded once per process by _get_model
+_models = {}
+
+
+def _get_model(model_name, backend):
+    key = (model_name, backend)
+    if key not in _models:
+        _models[key] = load_sentence_transformer(model_name, backend)
+    return _models[key]
+
+
+def _init_worker(model_name, torch_threads, backend=EMBED_BACKEND):
+    """Pool initializer: pins BLAS/torch threads before torch is imported, then loads the model once."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(torch_threads)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    import torch
+    torch.set_num_threads(torch_threads)
+    _get_model(model_name, backend)
+
+
+def _encode_batch(task):
+    batch_id, texts, model_name, backend = task
+    start = time.perf_counter()
+    model = _get_model(model_name, backend)
+    vectors = model.encode(texts, batch_size=len(texts), show_progress_bar=False, convert_to_numpy=True)
+    return batch_id, vectors.astype(np.float32), os.getpid(), time.perf_counter() - start
+
+
+class ParallelEmbedder(Embeddings):
+    """
+    Multi-process MiniLM encoder (same vectors as HuggingFaceEmbeddings).
+
+    Texts are sorted by length and cut into ENCODE_BATCH_SIZE batches so
+    each forward pass pads to a similar length; batches are fanned out to
+    `workers` processes, each owning one model copy and
+    cpu_count // workers torch threads. With workers=1 everything runs in
+    the calling process, whose thread settings are left alone.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, workers=EMBED_WORKERS,
+                 batch_size=ENCODE_BATCH_SIZE, torch_threads=None, sort_by_length=True, backend=EMBED_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.sort_by_length = sort_by_length
+        self.worker_stats = defaultdict(lambda: {"chunks": 0, "seconds": 0.0})
+        self._pool = None
+
+    def _map(self, tasks):
+        if self.workers == 1:
+            return map(_encode_batch, tasks)
+        if self._pool is None:
+            # spawn: torch and fork don't mix, and it is the only option on Windows
+            self._pool = mp.get_context("spawn").Pool(
+                self.workers, initializer=_init_worker, initargs=(self.model_name, self.torch_threads, self.backend)
+            )
+        return self._pool.imap_unordered(_encode_batch, tasks)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        order = list(range(len(texts)))
+        if self.sort_by_length:
+            order.sort(key=lambda i: len(texts[i]))
+        batches = [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+        tasks = ((b, [texts[i] for i in idx], self.model_name, self.backend) for b, idx in enumerate(batches))
+
+        out = [None] * len(texts)
+        for batch_id, vectors, pid, seconds in self._map(tasks):
+            for i, vector in zip(batches[batch_id], vectors):
+                out[i] = vector.tolist()
+            self.worker_stats[pid]["chunks"] += len(vectors)
+            self.worker_stats[pid]["seconds"] += seconds
+        return out
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def report(self):
+        """Chunks per second for each worker process (busy time only)."""
+        return {
+            pid: {**s, "chunks_per_sec": s["chunks"] / s["seconds"] if s["seconds"] else 0.0}
+            for pid, s in self.worker_stats.items()
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
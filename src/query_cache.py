@@ -0,0 +1,144 @@
+# src/query_cache.py
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+try:
+    from .embedding_cache import normalize_text
+except ImportError:
+    from embedding_cache import normalize_text
+
+# --- CONFIGURATION ---
+QUERY_CACHE_TTL = 60 * 60          # seconds an answer stays valid
+QUERY_CACHE_MAX_ENTRIES = 512
+SIMILARITY_THRESHOLD = 0.95        # cosine between MiniLM query embeddings
+
+
+class QueryCache:
+    """
+    Answer cache for the RAG chain, shared by every session in the process.
+
+    Lookups try the exact tier first (normalized, case-folded question) and
+    then the semantic tier: the cached question whose embedding is closest
+    to the new one, if the cosine is at least `similarity_threshold`.
+    Both tiers only match within the same `scope` (e.g. a product filter).
+    Entries expire after `ttl` seconds, the least recently used entry is
+    dropped past `max_entries`, and everything is invalidated as soon as
+    `version_fn()` (the index version being served) changes.
+
+    Callers that read a pinned snapshot pass its `version`: a request still
+    on an older snapshot gets no cached answers, and its answer is not
+    stored, since it could outlive the swap under the new version.
+    """
+
+    def __init__(self, embed_query, ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES,
+                 similarity_threshold=SIMILARITY_THRESHOLD, version_fn=None, clock=time.monotonic):
+        self.embed_query = embed_query
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.version_fn = version_fn or (lambda: None)
+        self.clock = clock
+        self._entries = OrderedDict()  # (scope, key) -> (vector, value, created_at)
+        self._matrix = None            # stacked vectors, rebuilt lazily
+        self._lock = threading.Lock()
+        self._version = self.version_fn()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stale_puts = 0
+
+    @staticmethod
+    def _key(question):
+        return normalize_text(question).casefold()
+
+    def _check_version(self):
+        version = self.version_fn()
+        if version != self._version:
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _drop_expired(self):
+        now = self.clock()
+        expired = [k for k, (_, _, created) in self._entries.items() if now - created > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _nearest(self, vector, scope):
+        if not self._entries:
+            return None
+        if self._matrix is None:
+            keys = list(self._entries)
+            self._matrix = (keys, [s for s, _ in keys], np.stack([v for v, _, _ in self._entries.values()]))
+        keys, scopes, matrix = self._matrix
+        same_scope = np.fromiter((s == scope for s in scopes), dtype=bool, count=len(scopes))  # scopes are tuples
+        scores = np.where(same_scope, matrix @ vector, -1.0)
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity_threshold else None
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, question, scope=None, version=None):
+        """Cached value for `question` (or a close paraphrase), else None."""
+        key = (scope, self._key(question))
+        with self._lock:
+            self._check_version()
+            if version is not None and version != self._version:  # answers are for the served snapshot
+                self.misses += 1
+                return None
+            self._drop_expired()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return self._entries[key][1]
+
+        vector = self._unit(self.embed_query(question))
+        with self._lock:
+            match = self._nearest(vector, scope)
+            if match is not None and match in self._entries:
+                self._entries.move_to_end(match)
+                self.semantic_hits += 1
+                return self._entries[match][1]
+            self.misses += 1
+        return None
+
+    def put(self, question, value, scope=None, version=None):
+        """Stores `value`; skipped (False) if it was answered from another snapshot than the one served."""
+        vector = self._unit(self.embed_query(question))  # served by the embedding cache after get()
+        key = (scope, self._key(question))
+        with self._lock:
+            self._check_version()
+            if version is not None and version != self._version:  # swapped while this was answered
+                self.stale_puts += 1
+                return False
+            self._entries[key] = (vector, value, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+        return True
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "stale_puts": self.stale_puts,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
@@ -1,31 +1,305 @@
 # src/rag_engine.py
+import time
+import asyncio
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from openai import APIError, RateLimitError
+import threading
+from collections import Counter
+from tenacity import (
+    AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, stop_before_delay,
+    wait_random_exponential
+)
+
+try:
+    from .telemetry import telemetry
+except ImportError:  # run with src/ on sys.path
+    from telemetry import telemetry
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("CreditRAG")
 
 # --- CODE 3: ROBUST ERROR HANDLING ---
+# Backend-agnostic: the same policy wraps local Flan-T5 and a hosted API.
+
+MAX_ATTEMPTS = 3
+BACKOFF_MULTIPLIER_S = 0.5    # full-jitter exponential backoff: random(0, min(max, m * 2^n))
+BACKOFF_MAX_S = 8.0
+FAILURE_THRESHOLD = 5         # consecutive failures that open the circuit
+RESET_TIMEOUT_S = 30.0        # open -> half-open (one probe call)
+MAX_CONCURRENT_GENERATIONS = 5  # saturation limit; extra calls fail fast instead of queueing
+                                # (each RAGService builds its own breaker: its stream workers + the batch worker)
+
+try:  # only needed when a hosted OpenAI model is used
+    from openai import APIConnectionError, APIError, APITimeoutError, RateLimitError
+    _PROVIDER_TRANSIENT = (RateLimitError, APIConnectionError, APITimeoutError, APIError)
+except ImportError:
+    _PROVIDER_TRANSIENT = ()
+
+TRANSIENT_ERRORS = (TimeoutError, ConnectionError) + _PROVIDER_TRANSIENT
+
 
 class GenerationError(Exception):
     """Custom error for when the LLM fails"""
     pass
 
-@retry(
-    retry=retry_if_exception_type((RateLimitError, APIError)), 
-    stop=stop_after_attempt(3), 
-    wait=wait_exponential(multiplier=1, min=2, max=10)
-)
-def generate_answer_safe(chain, query):
+
+class ServiceOverloaded(RuntimeError):
+    """Too much work is already admitted; retry later."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request could not be answered before its deadline."""
+
+
+class CircuitOpen(GenerationError):
+    """The generator is failing or saturated; the call was not attempted."""
+
+
+class BudgetExhausted(GenerationError):
+    """No (further) attempt fits in the caller's deadline."""
+
+
+def is_transient(error):
+    """Errors worth retrying. A deadline or overload signal is never retried."""
+    if isinstance(error, (GenerationError, DeadlineExceeded, ServiceOverloaded)):
+        return False
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class GenerationMetrics:
+    """Outcome counters for generation calls (read with snapshot())."""
+
+    OUTCOMES = ("success", "retry", "failure", "rejected_open", "rejected_saturated", "budget_exhausted", "fallback")
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def incr(self, outcome, n=1):
+        with self._lock:
+            self._counts[outcome] += n
+        telemetry.incr(f"generation.{outcome}", n)
+
+    def snapshot(self):
+        with self._lock:
+            return {outcome: self._counts[outcome] for outcome in self.OUTCOMES}
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures; open -> half-open
+    after `reset_timeout_s`, where a single probe decides. Only timeouts and
+    transient backend errors count as failures: a bad input says nothing
+    about the backend. Independently of the state, at most `max_concurrent`
+    calls run at once; the rest fail fast.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout_s=RESET_TIMEOUT_S,
+                 max_concurrent=MAX_CONCURRENT_GENERATIONS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.max_concurrent = max_concurrent
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.in_flight = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.clock() - self.opened_at >= self.reset_timeout_s else "open"
+
+    def acquire(self):
+        """Reserves a slot or raises CircuitOpen; True if this call is the half-open probe."""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._probing):
+                raise CircuitOpen("generator circuit is open after repeated failures")
+            if self.in_flight >= self.max_concurrent:
+                raise CircuitOpen(f"generator saturated ({self.in_flight} calls in flight)")
+            probe = state == "half-open"
+            if probe:
+                self._probing = True
+            self.in_flight += 1
+            return probe
+
+    def release(self, error=None, probe=False):
+        """Frees the slot; `error` is what the call raised (None on success)."""
+        with self._lock:
+            self.in_flight -= 1
+            if probe:  # calls admitted before the circuit opened do not end the probe
+                self._probing = False
+            if error is None:
+                self.failures, self.opened_at = 0, None
+            elif is_transient(error):
+                self.failures += 1
+                if self.failures >= self.failure_threshold or self.opened_at is not None:
+                    self.opened_at = self.clock()  # (re)open; a failed probe restarts the timer
+
+
+class ResilientGenerator:
+    """
+    Runs a generation callable with jittered retries, a circuit breaker and
+    the caller's deadline (an absolute time.monotonic() value).
+
+    Only transient errors are retried, and never past the deadline:
+    tenacity stops before a backoff that would overrun it. `acall` is the
+    asyncio variant: it waits with asyncio.sleep, so no thread sleeps
+    through the backoff. Raises GenerationError subclasses; use
+    `call_with_fallback` to degrade to evidence-only answers instead.
+    """
+
+    def __init__(self, breaker=None, metrics=None, max_attempts=MAX_ATTEMPTS,
+                 backoff_multiplier_s=BACKOFF_MULTIPLIER_S, backoff_max_s=BACKOFF_MAX_S):
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics or GenerationMetrics()
+        self.max_attempts = max_attempts
+        self.wait = wait_random_exponential(multiplier=backoff_multiplier_s, max=backoff_max_s)
+
+    def _policy(self, deadline):
+        stop = stop_after_attempt(self.max_attempts)
+        if deadline is not None:
+            stop = stop | stop_before_delay(max(0.0, deadline - time.monotonic()))
+        return dict(stop=stop, wait=self.wait, retry=retry_if_exception(is_transient),
+                    before_sleep=lambda state: self.metrics.incr("retry"))
+
+    def _check_budget(self, deadline):
+        if deadline is not None and time.monotonic() >= deadline:
+            self.metrics.incr("budget_exhausted")
+            raise BudgetExhausted("deadline reached before generation")
+
+    def _acquire(self):
+        try:
+            return self.breaker.acquire()
+        except CircuitOpen as e:
+            self.metrics.incr("rejected_saturated" if "saturated" in str(e) else "rejected_open")
+            raise
+
+    def _failed(self, error):
+        if isinstance(error, (CircuitOpen, BudgetExhausted)):
+            return error  # shed, already counted
+        self.metrics.incr("failure")
+        if isinstance(error, GenerationError):
+            return error
+        return GenerationError(f"System is busy, please try again. Error: {error}")
+
+    def call(self, fn, *args, deadline=None, **kwargs):
+        """fn(*args, **kwargs) with retries; blocking."""
+        def attempt():
+            self._check_budget(deadline)
+            probe = self._acquire()
+            error = None
+            try:
+                return fn(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self.breaker.release(error, probe)
+
+        try:
+            result = Retrying(reraise=True, **self._policy(deadline))(attempt)
+        except Exception as e:
+            raise self._failed(e) from e
+        self.metrics.incr("success")
+        return result
+
+    async def acall(self, fn, *args, deadline=None, **kwargs):
+        """Async variant; a plain callable runs in the default executor, a coroutine function is awaited."""
+        loop = asyncio.get_running_loop()
+        try:
+            async for attempt in AsyncRetrying(reraise=True, **self._policy(deadline)):
+                with attempt:
+                    self._check_budget(deadline)
+                    probe = self._acquire()
+                    error = None
+                    try:
+                        if asyncio.iscoroutinefunction(fn):
+                            result = await fn(*args, **kwargs)
+                        else:
+                            result = await loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+                    except BaseException as e:
+                        error = e
+                        raise
+                    finally:
+                        self.breaker.release(error, probe)
+        except Exception as e:
+            raise self._failed(e) from e
+        self.metrics.incr("success")
+        return result
+
+    def stream(self, fn, *args, deadline=None, **kwargs):
+        """
+        Iterates fn(*args, **kwargs) (a token generator). Failures before the
+        first token are retried like `call`; once tokens have been shown the
+        error is raised as is.
+        """
+        def first_token():
+            self._check_budget(deadline)
+            probe = self._acquire()
+            try:
+                iterator = iter(fn(*args, **kwargs))
+                return iterator, next(iterator, None), probe
+            except BaseException as e:
+                self.breaker.release(e, probe)
+                raise
+
+        try:
+            iterator, token, probe = Retrying(reraise=True, **self._policy(deadline))(first_token)
+        except Exception as e:
+            raise self._failed(e) from e
+        error = None
+        try:
+            while token is not None:
+                yield token
+                token = next(iterator, None)
+        except Exception as e:
+            error = e
+            raise
+        finally:  # a consumer that stops early (GeneratorExit) is not a backend failure
+            self.breaker.release(error, probe)
+            self.metrics.incr("success" if error is None else "failure")
+
+    def call_with_fallback(self, fn, *args, deadline=None, fallback=None, **kwargs):
+        """(result, None) on success, else (fallback, reason) when generation is shed or fails."""
+        try:
+            return self.call(fn, *args, deadline=deadline, **kwargs), None
+        except GenerationError as e:
+            self.metrics.incr("fallback")
+            logger.warning("generation: falling back to evidence only (%s)", e)
+            return fallback, str(e)
+
+
+def evidence_only_answer(docs, max_chars=240):
+    """Answer text used when no summary could be generated: the retrieved complaints themselves."""
+    if not docs:
+        return "The answer generator is busy and no matching complaints were found. Please try again."
+    lines = ["The answer generator is busy right now. These are the most relevant complaints:"]
+    for doc in docs:
+        text = " ".join(doc.page_content.split())
+        lines.append(f"- ({doc.metadata.get('product', 'Unknown product')}) "
+                     f"{text[:max_chars]}{'…' if len(text) > max_chars else ''}")
+    return "\n".join(lines)
+
+
+_default_generator = ResilientGenerator()
+
+
+def get_generator():
+    """The process-wide generator policy (shared breaker and metrics)."""
+    return _default_generator
+
+
+def generate_answer_safe(chain, query, deadline=None):
     """
     Safely invokes the LLM chain with auto-retries on failure.
     """
+    logger.debug("Processing query (%d chars)", len(query))  # the text itself may hold customer data
     try:
-        logger.info(f"Processing query: {query}")
-        result = chain.invoke(query)
-        return result
-    except Exception as e:
+        return _default_generator.call(chain.invoke, query, deadline=deadline)
+    except GenerationError as e:
         logger.error(f"LLM Generation failed: {e}")
-        raise GenerationError(f"System is busy, please try again. Error: {e}")
\ No newline at end of file
+        raise
@@ -1,69 +1,509 @@
 # src/rag_pipeline.py
 import os
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 import dotenv
-from langchain_huggingface import HuggingFaceEmbeddings, HuggingFacePipeline
-from langchain_chroma import Chroma
 from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableGenerator, RunnableLambda, RunnablePassthrough
+from langchain_core.runnables.utils import AddableDict
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.retrievers import BaseRetriever
+
+try:
+    from .embedding_cache import EMBEDDING_MODEL_NAME, load_embedding_model
+    from .inference_backends import EMBED_BACKEND, LLM_BACKEND, check_index_embedder
+    from .model_registry import registry
+    from .query_cache import QueryCache
+    from .scope_index import ScopeIndex, build_filter, partition_name
+    from .lexical_index import LexicalIndex, reciprocal_rank_fusion
+    from .reranker import RERANK_CANDIDATES, RERANK_ENABLED, CrossEncoderReranker, load_cross_encoder
+    from .telemetry import span, telemetry
+    from .compact_store import VECTOR_BACKEND, CompactVectorStore
+    from .context_builder import CONTEXT_BUDGET_TOKENS, ENCODER_MAX_TOKENS, ContextBuilder
+    from .aggregates import AGGREGATE_ROUTING, AggregateStore, format_summary, is_aggregate_question
+    from .snapshots import SnapshotManager, read_index_meta, resolve
+except ImportError:  # run with src/ on sys.path
+    from embedding_cache import EMBEDDING_MODEL_NAME, load_embedding_model
+    from inference_backends import EMBED_BACKEND, LLM_BACKEND, check_index_embedder
+    from model_registry import registry
+    from query_cache import QueryCache
+    from scope_index import ScopeIndex, build_filter, partition_name
+    from lexical_index import LexicalIndex, reciprocal_rank_fusion
+    from reranker import RERANK_CANDIDATES, RERANK_ENABLED, CrossEncoderReranker, load_cross_encoder
+    from telemetry import span, telemetry
+    from compact_store import VECTOR_BACKEND, CompactVectorStore
+    from context_builder import CONTEXT_BUDGET_TOKENS, ENCODER_MAX_TOKENS, ContextBuilder
+    from aggregates import AGGREGATE_ROUTING, AggregateStore, format_summary, is_aggregate_question
+    from snapshots import SnapshotManager, read_index_meta, resolve
 
 # Load env (not strictly needed for local, but good practice)
 dotenv.load_dotenv()
 
 # Configuration
-VECTOR_STORE_PATH = "./chroma_db"
+VECTOR_STORE_PATH = "./chroma_db"  # ingestion publishes immutable snapshots here, see snapshots.py
+TOP_K = 3
+HYBRID_CANDIDATES = 20     # per retriever (dense and BM25), before fusion
+LEXICAL_TIMEOUT_S = 0.05   # BM25 is dropped if still running this long after the dense search
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("CreditRAG")
+
+# 1. SETUP MODELS (Free & Local)
+# Nothing heavy happens at import time: torch, the models and the Chroma client
+# are created on first use and shared by every thread in the process.
 
-# 1. SETUP EMBEDDINGS (Free & Local)
-EMBEDDING_MODEL = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+def _load_llm():
+    try:
+        from .local_llm import load_llm
+    except ImportError:
+        from local_llm import load_llm
+    return load_llm(backend=LLM_BACKEND)
 
-def get_retriever():
-    if not os.path.exists(VECTOR_STORE_PATH):
+def _load_vectorstore(path=None):
+    path = path or resolve(VECTOR_STORE_PATH)[1]
+    if path is None or not os.path.exists(path):
         print(f"⚠️ Vector store not found at {VECTOR_STORE_PATH}.")
         return None
-        
-    vectorstore = Chroma(
-        persist_directory=VECTOR_STORE_PATH, 
-        embedding_function=EMBEDDING_MODEL
-    )
-    return vectorstore.as_retriever(search_kwargs={"k": 3})
-
-def get_rag_chain():
-    # 2. SETUP LLM (Free & Local - Google Flan-T5)
-    # The first time you run this, it will download ~900MB. That is normal.
-    print("Loading local AI model (Flan-T5)... please wait...")
-    
-    llm = HuggingFacePipeline.from_model_id(
-        model_id="google/flan-t5-base",
-        task="text2text-generation",
-        pipeline_kwargs={
-            "max_new_tokens": 200,  # How long the answer can be
-            "temperature": 0.1      # Keep it factual
-        }
+    if VECTOR_BACKEND == "compact":  # memory-mapped float16 / PQ export of the Chroma store
+        store = CompactVectorStore.load(path, get_embeddings())
+        if store is None:
+            print(f"⚠️ No compact store in {path}; run ingestion with --compact-store.")
+        return store
+    from langchain_chroma import Chroma
+    return Chroma(
+        persist_directory=path,
+        embedding_function=get_embeddings()
     )
 
-    # 3. SETUP PROMPT (Simpler prompt for smaller models)
-    template = """
+def _open_snapshot(path):
+    """Everything queries read from one index version, loaded (and warmed up) before it is served."""
+    # Queries must be embedded like the index was: another model is refused, another backend logged
+    mismatch = check_index_embedder(read_index_meta(path), EMBEDDING_MODEL_NAME, EMBED_BACKEND)
+    if mismatch:
+        logger.warning("index: %s; set RAG_EMBED_BACKEND to match or re-ingest with --rebuild", mismatch)
+    vectorstore = _load_vectorstore(path)
+    if vectorstore is not None and registry.is_loaded("embeddings"):
+        # The first search loads Chroma's HNSW index (or pages in the compact store)
+        vectorstore.similarity_search_by_vector(get_embeddings().embed_query("warm up"), k=1)
+    return {"vectorstore": vectorstore, "scope_index": ScopeIndex.load(path),
+            "lexical_index": LexicalIndex.load(path), "aggregates": AggregateStore.load(path),
+            "partitions": {}}
+
+def _close_snapshot(resources):
+    vectorstore = resources["vectorstore"]
+    if isinstance(vectorstore, CompactVectorStore):  # unmapped, so the snapshot can be deleted
+        vectorstore.close()
+    client = getattr(vectorstore, "_client", None)  # partitions share it
+    if client is not None and hasattr(client, "close"):
+        client.close()
+
+# Inference backends (torch / int8 / onnx) come from RAG_BACKEND, see inference_backends.py
+registry.register("embeddings", lambda: load_embedding_model(backend=EMBED_BACKEND))  # cached on disk - repeated queries skip the model
+registry.register("embedding_model", lambda: get_embeddings().model)  # the transformer behind the cache
+registry.register("llm", _load_llm)
+# The index being served; a newly published snapshot is warmed up and swapped in by a watcher thread
+registry.register("snapshots", lambda: SnapshotManager(VECTOR_STORE_PATH, _open_snapshot, _close_snapshot).start())
+registry.register("query_cache", lambda: QueryCache(get_embeddings().embed_query, version_fn=get_served_version))
+registry.register("reranker", lambda: CrossEncoderReranker(load_cross_encoder()))
+registry.register("context_builder", ContextBuilder)  # Flan-T5 tokenizer from the local cache, if present
+
+def get_embeddings():
+    return registry.get("embeddings")
+
+def get_llm():
+    return registry.get("llm")
+
+def get_snapshots():
+    return registry.get("snapshots")
+
+_pinned_snapshot = contextvars.ContextVar("pinned_snapshot", default=None)
+
+def current_snapshot():
+    """The snapshot this request is pinned to (see pinned_snapshot), else the one being served."""
+    return _pinned_snapshot.get() or get_snapshots().current()
+
+@contextmanager
+def pinned_snapshot(snapshot=None):
+    """
+    Serves everything inside the block from one snapshot, which is not
+    closed or deleted until the block ends, even if a newer one is swapped in.
+    Pass `snapshot` to serve the block from one the caller already pinned
+    (e.g. in another thread); it stays the caller's to release.
+    """
+    manager = None
+    if snapshot is None:
+        snapshot = _pinned_snapshot.get()
+        if snapshot is not None:  # already pinned further up
+            yield snapshot
+            return
+        manager = get_snapshots()
+        snapshot = manager.acquire()
+    token = _pinned_snapshot.set(snapshot)
+    try:
+        yield snapshot
+    finally:
+        _pinned_snapshot.reset(token)
+        if manager is not None:
+            manager.release(snapshot)
+
+def _snapshot_resource(name):
+    snapshot = current_snapshot()
+    return snapshot.resources[name] if snapshot is not None else None
+
+def get_vectorstore():
+    return _snapshot_resource("vectorstore")
+
+def get_query_cache():
+    return registry.get("query_cache")
+
+def get_reranker():
+    return registry.get("reranker")
+
+def get_context_builder():
+    return registry.get("context_builder")
+
+def get_index_version():
+    """Version of the snapshot this request reads (the pinned one, else the one being served)."""
+    snapshot = current_snapshot()
+    return snapshot.version if snapshot is not None else None
+
+def get_served_version():
+    """Version of the snapshot new requests are served from, pins aside (the answer cache follows it)."""
+    snapshot = get_snapshots().current()
+    return snapshot.version if snapshot is not None else None
+
+def get_scope_index():
+    """Product/issue counts of the current snapshot (empty if there is no index)."""
+    scope_index = _snapshot_resource("scope_index")
+    return scope_index if scope_index is not None else ScopeIndex()
+
+def get_lexical_index():
+    """BM25 index of the current snapshot (None if ingestion did not write one)."""
+    return _snapshot_resource("lexical_index")
+
+def get_aggregate_store():
+    """Product/issue/month counts of the current snapshot (None if ingestion did not write them)."""
+    return _snapshot_resource("aggregates")
+
+def __getattr__(name):
+    # EMBEDDING_MODEL used to be built at import time; keep it importable
+    if name == "EMBEDDING_MODEL":
+        return get_embeddings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up(background=True, include_llm=True, include_reranker=RERANK_ENABLED):
+    """Loads the models ahead of the first question (in a daemon thread by default)."""
+    names = ["embeddings", "embedding_model", "snapshots"] + (["llm"] if include_llm else [])
+    names += ["reranker"] if include_reranker else []
+    return registry.warm_up(names, background=background)
+
+class SnapshotRetriever(BaseRetriever):
+    """
+    Searches the snapshot each call is pinned to, never a vector store held
+    from an earlier one (which is closed once a newer snapshot is swapped in).
+    """
+    products: list = []
+    issue: str | None = None
+    k: int = TOP_K
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        with pinned_snapshot():
+            vectorstore = get_vectorstore()
+            if vectorstore is None:
+                return []
+            return vectorstore.similarity_search(query, k=self.k, filter=build_filter(self.products, self.issue))
+
+def get_retriever(products=None, issue=None, k=TOP_K):
+    """Retriever over the whole index, or only the given products / issue."""
+    if get_vectorstore() is None:
+        return None
+    return SnapshotRetriever(products=list(products or []), issue=issue, k=k)
+
+def resolve_scope(question, product=None, issue=None, infer=True, snapshot=None):
+    """
+    The partition a question is searched in: {"products": [...], "issue": ...}.
+    An explicit product/issue wins; otherwise both are inferred from the question
+    (with the scope index of `snapshot`, else of the pinned / current one).
+    """
+    products = [product] if product else []
+    if infer and not (product and issue):
+        with pinned_snapshot(snapshot):
+            inferred_products, inferred_issue = get_scope_index().infer(question)
+        products = products or inferred_products
+        issue = issue or inferred_issue
+    return {"products": products, "issue": issue}
+
+def scope_key(scope, rerank=False):
+    """Answer-cache key of a scope; re-ranked answers come from other chunks, so they are kept apart."""
+    return (tuple(scope["products"]), scope["issue"], bool(rerank))
+
+def get_partition(product):
+    """Chroma store over one product's partition, or None if ingestion did not write it."""
+    if VECTOR_BACKEND == "compact":
+        return None  # the compact store filters on its per-row product codes instead
+    snapshot = current_snapshot()
+    if snapshot is None:
+        return None
+    partitions, vectorstore = snapshot.resources["partitions"], snapshot.resources["vectorstore"]
+    if product not in partitions:
+        try:
+            vectorstore._client.get_collection(partition_name(product))
+        except Exception:  # NotFoundError / ValueError depending on the chromadb version
+            partitions[product] = None
+        else:
+            from langchain_chroma import Chroma
+            partitions[product] = Chroma(client=vectorstore._client, collection_name=partition_name(product),
+                                         embedding_function=get_embeddings())
+    return partitions[product]
+
+_search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+
+def search_scope(question, scope, k=TOP_K, hybrid=True, vector=None):
+    """
+    Top-k chunks inside the scope, by reciprocal rank fusion of the dense
+    (Chroma) and BM25 rankings. BM25 runs in a worker thread while the dense
+    search runs here; if it overruns LEXICAL_TIMEOUT_S the dense ranking is
+    used alone, which keeps the p95 within the budget in
+    benchmarks/bench_hybrid_retrieval.py.
+    """
+    lexical_index = get_lexical_index() if hybrid else None
+    if lexical_index is None:
+        return dense_search(question, scope, k, vector=vector)
+
+    candidates = max(HYBRID_CANDIDATES, k)
+
+    def lexical_search():
+        with span("query.bm25_search"):
+            return lexical_index.search(question, candidates, scope["products"], scope["issue"])
+
+    lexical_future = _search_pool.submit(lexical_search)
+    dense = dense_search(question, scope, candidates, vector=vector)
+    try:
+        lexical = lexical_future.result(timeout=LEXICAL_TIMEOUT_S)
+    except FutureTimeout:
+        logger.warning("retrieval: BM25 over budget, using dense results only")
+        telemetry.incr("query.bm25_timeouts")
+        return dense[:k]
+
+    docs = {d.id: d for d in dense}
+    fused = reciprocal_rank_fusion([d.id for d in dense], [chunk_id for chunk_id, _ in lexical])[:k]
+    missing = [chunk_id for chunk_id in fused if chunk_id not in docs]
+    if missing:  # keyword-only hits: fetch their text from the main collection
+        docs.update((d.id, d) for d in get_vectorstore().get_by_ids(missing))
+    return [docs[chunk_id] for chunk_id in fused if chunk_id in docs]
+
+def retrieve(question, scope, hybrid=True, rerank=False, k=TOP_K, vector=None, snapshot=None):
+    """
+    The k chunks that go into the prompt, plus per-stage timings in ms.
+    With `rerank`, RERANK_CANDIDATES first-stage hits are re-ordered by the
+    cross-encoder (which falls back to first-stage order over its budget).
+    `vector` is the question's embedding, if the caller already has it.
+    Everything is read from one index snapshot (`snapshot`, else the pinned
+    / current one), even if a new one is swapped in meanwhile (see
+    pinned_snapshot); resolve the scope from the same one.
+    """
+    start = time.perf_counter()
+    with pinned_snapshot(snapshot):
+        docs = search_scope(question, scope, k=RERANK_CANDIDATES if rerank else k, hybrid=hybrid, vector=vector)
+    timings = {"retrieve_ms": 1000 * (time.perf_counter() - start)}
+    if rerank and docs:
+        with span("query.rerank"):
+            docs, rerank_timings = get_reranker().rerank(question, docs, k)
+        timings.update(rerank_timings)
+    return {"docs": docs[:k], "timings": timings}
+
+def dense_search(question, scope, k=TOP_K, vector=None):
+    """
+    Top-k chunks inside the scope by embedding similarity. Each product is
+    searched in its own partition if ingestion wrote them
+    (RAG_PRODUCT_PARTITIONS), otherwise through a product filter on the main
+    collection; the issue is a metadata filter. Widens to the whole index if
+    the scope is empty.
+    """
+    if vector is None:
+        with span("query.embed"):
+            vector = get_embeddings().embed_query(question)
+    with span("query.vector_search"):
+        return _dense_search_by_vector(vector, scope, k)
+
+def _dense_search_by_vector(vector, scope, k):
+    products, issue = scope["products"], scope["issue"]
+    partitions = [get_partition(p) for p in products]
+    docs = []
+    if products and all(partitions):
+        where = build_filter(issue=issue)
+        if len(partitions) == 1:
+            docs = partitions[0].similarity_search_by_vector(vector, k=k, filter=where)
+        else:
+            hits = [hit for partition in partitions
+                    for hit in partition.similarity_search_by_vector_with_relevance_scores(vector, k=k, filter=where)]
+            docs = [doc for doc, _ in sorted(hits, key=lambda hit: hit[1])[:k]]  # scores are distances
+    elif products or issue:
+        docs = get_vectorstore().similarity_search_by_vector(vector, k=k, filter=build_filter(products, issue))
+    if not docs:
+        docs = get_vectorstore().similarity_search_by_vector(vector, k=k)
+    return docs
+
+# 2. SETUP PROMPT (Simpler prompt for smaller models)
+RAG_PROMPT = PromptTemplate.from_template("""
     Use the context below to answer the question. If you don't know, say "I don't know".
-    
+
     Context: {context}
-    
+
     Question: {question}
-    
+
     Answer:
+    """)
+
+def answer_aggregate(question, product=None, issue=None, infer_scope=True):
+    """
+    Answers a counting / ranking / trend question ("What are the main issues
+    with Student Loans?") from the aggregate store, without retrieval or
+    Flan-T5. Returns None when routing is off (RAG_AGGREGATE_ROUTING=0), the
+    question asks about a specific case or cause (see
+    aggregates.is_aggregate_question) or ingestion wrote no store; the
+    caller then goes through the RAG chain as usual.
+    """
+    if not AGGREGATE_ROUTING or not is_aggregate_question(question):
+        return None
+    store = get_aggregate_store()
+    if store is None:
+        return None
+    start = time.perf_counter()
+    with span("query.aggregate"):
+        scope = resolve_scope(question, product, issue, infer=infer_scope)
+        summary = store.summarize(scope["products"], scope["issue"])
+        answer = format_summary(summary)
+    elapsed_ms = 1000 * (time.perf_counter() - start)
+    telemetry.incr("query.aggregate_answers")
+    return {"question": question, "scope": scope, "docs": [], "answer": answer, "summary": summary,
+            "timings": {"aggregate_ms": elapsed_ms, "total_ms": elapsed_ms}}
+
+def format_docs(docs):
+    return "\n\n".join([d.page_content for d in docs])
+
+def build_context(question, docs, budget=CONTEXT_BUDGET_TOKENS):
+    """
+    The prompt context: the best sentences of `docs`, tagged with their
+    complaint ids, within `budget` tokens and whatever the template and the
+    question leave of the encoder window (see context_builder.py). A budget
+    of 0 joins the chunks whole, as before.
+    """
+    if not budget:
+        return format_docs(docs)
+    builder = get_context_builder()
+    with span("query.context_build"):
+        overhead = builder.count(RAG_PROMPT.format(context="", question=question))
+        return builder.build(question, docs, budget=max(0, min(budget, ENCODER_MAX_TOKENS - overhead))).text
+
+def build_prompt(question, docs):
+    with span("query.prompt_build"):
+        return RAG_PROMPT.format(context=build_context(question, docs), question=question)
+
+def with_query_cache(chain, cache, scope_fn=None, rerank=False):
+    """
+    Wraps a `with_sources` chain with the answer cache. Hits are returned
+    (or streamed) as one chunk; misses stream through and are stored once done.
+    Answers are only reused within the same scope (see `resolve_scope`) and
+    re-ranking setting.
+    """
+    def transform(inputs):
+        question = "".join(inputs)
+        with pinned_snapshot():  # the key's scope, the lookup and the answer all come from one index version
+            scope = scope_key(scope_fn(question), rerank) if scope_fn else None
+            version = get_index_version()
+            cached = cache.get(question, scope=scope, version=version)
+            if cached is not None:
+                yield AddableDict({**cached, "timings": {"cache_hit": True}})
+                return
+            final = None
+            for chunk in chain.stream(question):
+                final = chunk if final is None else final + chunk
+                yield chunk
+            if final is not None:
+                cache.put(question, dict(final), scope=scope, version=version)
+
+    return RunnableGenerator(transform)
+
+def get_rag_chain(with_sources=False, use_cache=True, product=None, issue=None, infer_scope=True, hybrid=True,
+                  rerank=RERANK_ENABLED):
+    """
+    Builds the RAG chain. With `with_sources=True` the chain returns
+    {"question", "scope", "docs", "timings", "answer"}: the documents are the
+    exact ones that were put into the prompt, so callers don't need a second
+    retrieval. Retrieval is restricted to `product` / `issue`, or to the scope
+    inferred from the question when `infer_scope` is on. With `hybrid`, dense
+    and BM25 candidates are fused (see `search_scope`); with `rerank`, a
+    cross-encoder picks the prompt chunks from a wider pool (see `retrieve`).
+    With `use_cache`, repeated (or near-identical) questions are answered
+    from the process-wide QueryCache.
     """
-    prompt = PromptTemplate.from_template(template)
+    if get_vectorstore() is None:  # no index: don't load Flan-T5 for nothing
+        return None
+    llm = get_llm()
 
-    # 4. BUILD CHAIN
-    retriever = get_retriever()
-    
-    def format_docs(docs):
-        return "\n\n".join([d.page_content for d in docs])
+    # 3. BUILD CHAIN
+    def scope_fn(question):
+        return resolve_scope(question, product, issue, infer=infer_scope)
 
-    chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt
+    answer_from_docs = (
+        RunnablePassthrough.assign(context=lambda x: build_context(x["question"], x["docs"]))
+        | RAG_PROMPT
         | llm
         | StrOutputParser()
     )
-    
-    return chain
\ No newline at end of file
+
+    # Resolve the scope, retrieve (and re-rank) once inside it, then generate from those same docs
+    def scope_and_retrieve(question):
+        with pinned_snapshot() as snapshot:  # one index version for the scope and the search
+            scope = resolve_scope(question, product, issue, infer=infer_scope, snapshot=snapshot)
+            return {"question": question, "scope": scope,
+                    **retrieve(question, scope, hybrid=hybrid, rerank=rerank, snapshot=snapshot)}
+
+    chain_with_sources = RunnableLambda(scope_and_retrieve).assign(answer=answer_from_docs)
+    if use_cache:
+        chain_with_sources = with_query_cache(chain_with_sources, get_query_cache(), scope_fn, rerank)
+
+    if with_sources:
+        return chain_with_sources
+    return chain_with_sources | (lambda x: x["answer"])
+
+
+def stream_answer(chain, question):
+    """
+    Streams a `with_sources` chain as it runs: yields ("scope", scope) and
+    ("docs", docs) once the retrieval is done, then ("token", text) pieces as
+    Flan-T5 generates them, and finally ("timings", {stage: ms}).
+    The time-to-first-token as seen by the user (retrieval included) is
+    logged and kept as timings["first_token_ms"] / query.first_token.
+    """
+    start = time.perf_counter()
+    first_token_at = docs_at = None
+    timings = {}
+    for chunk in chain.stream(question):
+        if "scope" in chunk:
+            yield "scope", chunk["scope"]
+        if "timings" in chunk:
+            timings.update(chunk["timings"])
+        if "docs" in chunk:
+            docs_at = time.perf_counter()
+            yield "docs", chunk["docs"]
+        if chunk.get("answer"):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                timings["first_token_ms"] = 1000 * (first_token_at - start)
+                telemetry.observe("query.first_token", timings["first_token_ms"])
+                logger.info("request: first token after %.2fs", first_token_at - start)
+            yield "token", chunk["answer"]
+    end = time.perf_counter()
+    if docs_at is not None and not timings.get("cache_hit"):
+        timings["generate_ms"] = 1000 * (end - docs_at)
+        telemetry.observe("query.generate", timings["generate_ms"])
+    timings["total_ms"] = 1000 * (end - start)
+    telemetry.observe("query.total", timings["total_ms"])
+    logger.info("request: answered in %.2fs (%s)", end - start,
+                ", ".join(f"{name} {value:.0f}" for name, value in timings.items() if name.endswith("_ms")))
+    yield "timings", timings
@@ -0,0 +1,477 @@
+# src/rag_service.py
+import os
+import time
+import queue
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from . import rag_pipeline as rp
+    from .model_registry import registry
+    from .rag_engine import (
+        CircuitBreaker, DeadlineExceeded, GenerationError, ResilientGenerator, ServiceOverloaded,
+        evidence_only_answer
+    )
+    from .telemetry import span, telemetry
+except ImportError:  # run with src/ on sys.path
+    import rag_pipeline as rp
+    from model_registry import registry
+    from rag_engine import (
+        CircuitBreaker, DeadlineExceeded, GenerationError, ResilientGenerator, ServiceOverloaded,
+        evidence_only_answer
+    )
+    from telemetry import span, telemetry
+
+# --- CONFIGURATION ---
+MAX_BATCH_SIZE = 8          # one padded Flan-T5 pass (GENERATION_BATCH_SIZE)
+BATCH_WINDOW_MS = 5         # after the first request, wait this long for more
+MAX_PENDING = 64            # admission control: requests queued or in flight
+DEFAULT_DEADLINE_S = 60.0   # per request, from admission to the last token
+SEARCH_WORKERS = 8          # concurrent retrievals inside one batch
+STREAM_WORKERS = 4          # token streams generated at the same time
+STREAM_ANSWERS = os.getenv("RAG_STREAM", "1") != "0"  # app default: stream tokens (0: batched answers only)
+
+
+class PipelineStages:
+    """The blocking calls the service batches; by default the rag_pipeline components."""
+
+    def pin(self):
+        """Context manager: the stages inside it read one index snapshot (see rag_pipeline.pinned_snapshot)."""
+        return rp.pinned_snapshot()
+
+    def embed(self, questions):
+        return rp.get_embeddings().embed_queries(questions)
+
+    def aggregate(self, question, product=None, issue=None):
+        return rp.answer_aggregate(question, product, issue)
+
+    def scope(self, question, product=None, issue=None):
+        return rp.resolve_scope(question, product, issue)
+
+    def version(self):
+        """The index version the stages read (inside pin(), the pinned one)."""
+        return rp.get_index_version()
+
+    def cached(self, question, scope, rerank=False):
+        return rp.get_query_cache().get(question, scope=rp.scope_key(scope, rerank), version=self.version())
+
+    def store(self, question, scope, result, rerank=False, version=None):
+        """`version`: the snapshot the answer came from (the cache skips it if that is no longer served)."""
+        rp.get_query_cache().put(question, result, scope=rp.scope_key(scope, rerank), version=version)
+
+    def retrieve(self, question, scope, vector, rerank=False, k=rp.TOP_K):
+        result = rp.retrieve(question, scope, rerank=rerank, k=k, vector=vector)
+        return result["docs"], result["timings"]
+
+    def generate(self, prompts):
+        return rp.get_llm().batch(prompts)
+
+    def stream(self, prompt):
+        return rp.get_llm().stream(prompt)
+
+
+class _Request:
+    __slots__ = ("question", "product", "issue", "rerank", "k", "use_cache", "generate",
+                 "deadline", "admitted_at", "future", "loop", "scope", "version")
+
+    def __init__(self, question, product, issue, rerank, k, use_cache, generate, deadline_s, loop):
+        self.question = question
+        self.product = product
+        self.issue = issue
+        self.rerank = rerank
+        self.k = k
+        self.use_cache = use_cache
+        self.generate = generate
+        self.admitted_at = time.monotonic()
+        self.deadline = self.admitted_at + deadline_s
+        self.loop = loop
+        self.future = loop.create_future()
+        self.scope = None
+        self.version = None  # index snapshot the batch read
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    def resolve(self, result=None, error=None):
+        """Completes the future from any thread (ignored if the caller already gave up)."""
+        def complete():
+            if not self.future.done():
+                if error is not None:
+                    self.future.set_exception(error)
+                else:
+                    self.future.set_result(result)
+        try:
+            self.loop.call_soon_threadsafe(complete)
+        except RuntimeError:  # loop already closed: nobody is waiting any more
+            pass
+
+
+class RAGService:
+    """
+    Asyncio front end for the RAG pipeline, shared by every caller in the process.
+
+    Requests that arrive within `batch_window_ms` of each other (or that
+    queue up while a batch is running) are answered together: one
+    embed_queries() call, concurrent retrievals, one batched Flan-T5
+    generation. At most `max_pending` requests are admitted at a time;
+    beyond that `ask` raises ServiceOverloaded instead of queueing without
+    bound. Every request has a deadline: expired requests are dropped
+    before the expensive stages and the caller gets DeadlineExceeded.
+    Counting / trend questions are answered from the aggregate store before
+    admission (no batching, retrieval or generation); pass aggregates=False
+    to always go through retrieval.
+    Generation goes through `generator` (rag_engine.ResilientGenerator):
+    when it is failing, saturated or out of time the answer degrades to
+    the retrieved evidence and the result carries "fallback": True. By
+    default each service gets its own, whose concurrency limit is
+    `stream_workers` + 1 (the batched pass); streams beyond that are shed
+    by the breaker rather than queued behind it.
+
+    `ask` / `ask_stream` are coroutines; `ask_sync` / `stream_sync` run them
+    on the service's own event loop thread for synchronous callers.
+    """
+
+    def __init__(self, stages=None, max_batch_size=MAX_BATCH_SIZE, batch_window_ms=BATCH_WINDOW_MS,
+                 max_pending=MAX_PENDING, default_deadline_s=DEFAULT_DEADLINE_S,
+                 search_workers=SEARCH_WORKERS, stream_workers=STREAM_WORKERS, generator=None):
+        self.stages = stages or PipelineStages()
+        self.generator = generator or ResilientGenerator(CircuitBreaker(max_concurrent=stream_workers + 1))
+        self.max_batch_size = max_batch_size
+        self.batch_window_ms = batch_window_ms
+        self.max_pending = max_pending
+        self.default_deadline_s = default_deadline_s
+        self.pending = 0
+        self.counters = {"admitted": 0, "rejected": 0, "expired": 0, "cache_hits": 0, "batches": 0,
+                         "fallbacks": 0, "aggregate_answers": 0}
+        self._batch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-batch")
+        self._search_pool = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="rag-search")
+        # a thread per admitted stream, so extra streams reach the breaker and fail fast
+        self._stream_pool = ThreadPoolExecutor(max_workers=max_pending, thread_name_prefix="rag-stream")
+        self._counter_lock = threading.Lock()
+        self._queue = None
+        self._batcher = None
+        self._thread_loop = None
+        self._thread_lock = threading.Lock()
+
+    # --- Async API ---
+
+    async def ask(self, question, product=None, issue=None, rerank=False, k=rp.TOP_K,
+                  use_cache=True, deadline_s=None, aggregates=True):
+        """{"question", "scope", "docs", "answer", "timings"} for one question."""
+        if aggregates and (result := await self._aggregate(question, product, issue)) is not None:
+            return result
+        request = self._admit(question, product, issue, rerank, k, use_cache, True, deadline_s)
+        try:
+            return await self._wait(request)
+        finally:
+            self._release()
+
+    async def ask_stream(self, question, product=None, issue=None, rerank=False, k=rp.TOP_K,
+                         use_cache=True, deadline_s=None, aggregates=True):
+        """
+        Yields ("scope", scope), ("docs", docs), ("token", text)... and finally
+        ("timings", {stage: ms}), which include first_token_ms. Retrieval is batched with other requests;
+        the answer is streamed on its own (one unbatched generation per
+        request) so tokens show up as they are made: use `ask` when
+        throughput matters more than the first token. An aggregate answer
+        comes as one token, after ("aggregate", summary).
+        """
+        if aggregates and (result := await self._aggregate(question, product, issue)) is not None:
+            yield "scope", result["scope"]
+            yield "docs", result["docs"]
+            yield "aggregate", result["summary"]
+            yield "token", result["answer"]
+            yield "timings", result["timings"]
+            return
+        request = self._admit(question, product, issue, rerank, k, use_cache, False, deadline_s)
+        try:
+            result = await self._wait(request)
+            yield "scope", result["scope"]
+            yield "docs", result["docs"]
+            timings = result["timings"]
+            if "answer" in result:  # answer cache hit
+                yield "token", result["answer"]
+                yield "timings", timings
+                return
+
+            loop = asyncio.get_running_loop()
+            tokens = asyncio.Queue()
+            # context packing tokenizes every sentence: off the loop, which also runs the batcher
+            prompt = await loop.run_in_executor(self._search_pool, rp.build_prompt, question, result["docs"])
+            start = time.perf_counter()
+            self._stream_pool.submit(self._produce_tokens, request, prompt, result["docs"], loop, tokens)
+            answer, fallback = [], False
+            while True:
+                try:
+                    kind, value = await asyncio.wait_for(tokens.get(), timeout=request.remaining())
+                except asyncio.TimeoutError:
+                    request.deadline = 0  # tells the producer to stop
+                    raise DeadlineExceeded(f"no answer within the deadline for {question!r}") from None
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    break
+                if kind == "fallback":
+                    fallback = True
+                    timings["fallback_reason"] = value
+                    continue
+                if not answer:  # as seen by the caller: queue and retrieval included
+                    timings["first_token_ms"] = 1000 * (time.monotonic() - request.admitted_at)
+                    telemetry.observe("query.first_token", timings["first_token_ms"])
+                answer.append(value)
+                yield "token", value
+            if request.expired():  # the producer stopped early
+                raise DeadlineExceeded(f"answer not finished within the deadline for {question!r}")
+
+            timings["generate_ms"] = 1000 * (time.perf_counter() - start)
+            timings["total_ms"] = 1000 * (time.monotonic() - request.admitted_at)
+            telemetry.observe("query.generate", timings["generate_ms"])
+            telemetry.observe("query.total", timings["total_ms"])
+            if use_cache and not fallback:
+                final = {"question": question, "scope": result["scope"], "docs": result["docs"],
+                         "answer": "".join(answer)}
+                await loop.run_in_executor(self._search_pool, self.stages.store, question, result["scope"], final,
+                                           rerank, request.version)
+            yield "timings", timings
+        finally:
+            self._release()
+
+    def stats(self):
+        with self._counter_lock:
+            counters = {**self.counters, "pending": self.pending}
+        return {**counters, "circuit": self.generator.breaker.state,
+                "generation": self.generator.metrics.snapshot()}
+
+    # --- Sync bridges (Streamlit, scripts) ---
+
+    def _ensure_thread_loop(self):
+        with self._thread_lock:
+            if self._thread_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="rag-service", daemon=True).start()
+                self._thread_loop = loop
+        return self._thread_loop
+
+    def ask_sync(self, question, **kwargs):
+        loop = self._ensure_thread_loop()
+        return asyncio.run_coroutine_threadsafe(self.ask(question, **kwargs), loop).result()
+
+    def stream_sync(self, question, **kwargs):
+        """Blocking iterator over the ask_stream events."""
+        loop = self._ensure_thread_loop()
+        events = queue.Queue()
+
+        async def pump():
+            try:
+                async for event in self.ask_stream(question, **kwargs):
+                    events.put(event)
+            except BaseException as e:
+                events.put(("error", e))
+            finally:
+                events.put(None)
+
+        asyncio.run_coroutine_threadsafe(pump(), loop)
+        while (event := events.get()) is not None:
+            if event[0] == "error":
+                raise event[1]
+            yield event
+
+    def close(self):
+        """Stops the batcher, the background loop (if started) and the worker threads."""
+        loop, self._thread_loop = self._thread_loop, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self._stop_batcher(), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
+        for pool in (self._batch_executor, self._search_pool, self._stream_pool):
+            pool.shutdown(wait=False)
+
+    # --- Internals ---
+
+    def _count(self, name, n=1):
+        """Counters are bumped from callers' loops, the batch thread and the stream threads."""
+        with self._counter_lock:
+            self.counters[name] += n
+
+    async def _stop_batcher(self):
+        if self._batcher is not None and not self._batcher.done():
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+
+    async def _aggregate(self, question, product, issue):
+        """The aggregate-store answer, or None if the question needs retrieval."""
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._search_pool, self.stages.aggregate, question, product, issue)
+        if result is not None:
+            self._count("aggregate_answers")
+        return result
+
+    def _admit(self, question, product, issue, rerank, k, use_cache, generate, deadline_s):
+        with self._counter_lock:  # check and reserve in one step
+            pending = self.pending
+            if pending < self.max_pending:
+                self.pending += 1
+                self.counters["admitted"] += 1
+            else:
+                self.counters["rejected"] += 1
+        if pending >= self.max_pending:
+            telemetry.incr("query.rejected")
+            raise ServiceOverloaded(f"{pending} requests in flight (limit {self.max_pending})")
+        loop = asyncio.get_running_loop()
+        if self._batcher is None or self._batcher.get_loop() is not loop or self._batcher.done():
+            self._queue = asyncio.Queue()
+            self._batcher = loop.create_task(self._batch_loop())
+        request = _Request(question, product, issue, rerank, k, use_cache, generate,
+                           deadline_s or self.default_deadline_s, loop)
+        self._queue.put_nowait(request)
+        return request
+
+    def _release(self):
+        with self._counter_lock:
+            self.pending -= 1
+
+    async def _wait(self, request):
+        try:
+            return await asyncio.wait_for(asyncio.shield(request.future), timeout=request.remaining())
+        except asyncio.TimeoutError:
+            request.deadline = 0  # the batch worker skips it if it has not got to it yet
+            self._count("expired")
+            telemetry.incr("query.expired")
+            raise DeadlineExceeded(f"no answer within the deadline for {request.question!r}") from None
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            window_end = loop.time() + self.batch_window_ms / 1000
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())  # queued while the last batch ran
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = window_end - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            live = [r for r in batch if not r.future.done() and not r.expired()]
+            if live:
+                self._count("batches")
+                await loop.run_in_executor(self._batch_executor, self._run_batch, live)
+
+    def _run_batch(self, batch):
+        """Embed -> cache lookup -> retrieve -> generate for one batch (runs in the batch thread)."""
+        try:
+            batch_started = time.monotonic()
+            start = time.perf_counter()
+            with span("query.embed"):
+                vectors = self.stages.embed([r.question for r in batch])
+            embed_ms = 1000 * (time.perf_counter() - start)
+            telemetry.incr("query.batches")
+            telemetry.incr("query.batched_requests", len(batch))  # / query.batches = mean batch size
+
+            with self.stages.pin():  # scope, cache and retrieval of the whole batch from one index version
+                self._answer_batch(batch, vectors, batch_started, embed_ms)
+        except Exception as e:
+            for request in batch:
+                request.resolve(error=e)
+
+    def _answer_batch(self, batch, vectors, batch_started, embed_ms):
+        """Everything after the embedding, inside the batch's pinned snapshot."""
+        todo = []
+        version = self.stages.version()
+        for request, vector in zip(batch, vectors):
+            request.version = version
+            request.scope = self.stages.scope(request.question, request.product, request.issue)
+            cached = self.stages.cached(request.question, request.scope, request.rerank) if request.use_cache else None
+            if cached is not None:
+                self._count("cache_hits")
+                telemetry.incr("query.cache_hits")
+                timings = {"cache_hit": True, "total_ms": 1000 * (time.monotonic() - request.admitted_at)}
+                request.resolve({**cached, "timings": timings})
+            else:
+                todo.append((request, vector))
+
+        def search(item):
+            request, vector = item
+            return self.stages.retrieve(request.question, request.scope, vector, request.rerank, request.k)
+
+        # each search thread runs in a copy of this context, so it reads the snapshot pinned above
+        contexts = [contextvars.copy_context() for _ in todo]
+        retrieved = list(self._search_pool.map(lambda item, context: context.run(search, item), todo, contexts))
+        to_generate = []
+        for (request, _), (docs, stage_timings) in zip(todo, retrieved):
+            timings = {"queue_ms": 1000 * (batch_started - request.admitted_at), "embed_ms": embed_ms,
+                       **stage_timings, "batch_size": len(batch)}
+            telemetry.observe("query.queue", timings["queue_ms"])
+            if "retrieve_ms" in stage_timings:
+                telemetry.observe("query.retrieve", stage_timings["retrieve_ms"])
+            result = {"question": request.question, "scope": request.scope, "docs": docs, "timings": timings}
+            if request.expired() or request.future.done():
+                request.resolve(error=DeadlineExceeded(f"deadline passed before generation: {request.question!r}"))
+            elif request.generate:
+                to_generate.append((request, result))
+            else:
+                request.resolve(result)  # streamed by ask_stream
+
+        if to_generate:
+            start = time.perf_counter()
+            prompts = [rp.build_prompt(r.question, res["docs"]) for r, res in to_generate]
+            answers, reason = self.generator.call_with_fallback(
+                self.stages.generate, prompts, deadline=min(r.deadline for r, _ in to_generate))
+            generate_ms = 1000 * (time.perf_counter() - start)
+            telemetry.observe("query.generate", generate_ms, ok=reason is None)
+            for i, (request, result) in enumerate(to_generate):
+                if reason is None:
+                    result["answer"] = answers[i].strip()
+                else:  # shed: answer with the evidence alone
+                    self._count("fallbacks")
+                    result.update(answer=evidence_only_answer(result["docs"]), fallback=True)
+                    result["timings"]["fallback_reason"] = reason
+                result["timings"].update(generate_ms=generate_ms, generate_batch_size=len(to_generate),
+                                         total_ms=1000 * (time.monotonic() - request.admitted_at))
+                telemetry.observe("query.total", result["timings"]["total_ms"])
+                if request.use_cache and reason is None:
+                    self.stages.store(request.question, request.scope,
+                                      {k: v for k, v in result.items() if k != "timings"}, request.rerank,
+                                      request.version)
+                request.resolve(result)
+
+    def _produce_tokens(self, request, prompt, docs, loop, tokens):
+        emitted = False
+        try:
+            for token in self.generator.stream(self.stages.stream, prompt, deadline=request.deadline):
+                if request.expired():
+                    break
+                emitted = True
+                loop.call_soon_threadsafe(tokens.put_nowait, ("token", token))
+        except GenerationError as e:
+            if emitted:  # part of the answer is already on screen
+                loop.call_soon_threadsafe(tokens.put_nowait, ("error", e))
+            else:
+                self._count("fallbacks")
+                self.generator.metrics.incr("fallback")
+                loop.call_soon_threadsafe(tokens.put_nowait, ("fallback", str(e)))
+                loop.call_soon_threadsafe(tokens.put_nowait, ("token", evidence_only_answer(docs)))
+        except Exception as e:
+            loop.call_soon_threadsafe(tokens.put_nowait, ("error", e))
+        finally:
+            loop.call_soon_threadsafe(tokens.put_nowait, ("done", None))
+
+
+registry.register("rag_service", RAGService)
+
+
+def get_service():
+    """The process-wide service (every Streamlit session shares it)."""
+    return registry.get("rag_service")
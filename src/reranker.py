@@ -0,0 +1,89 @@
+# src/reranker.py
+import os
+import time
+import threading
+from collections import OrderedDict
+
+try:
+    from .embedding_cache import normalize_text
+except ImportError:
+    from embedding_cache import normalize_text
+
+# --- CONFIGURATION ---
+RERANK_MODEL_ID = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_ENABLED = os.getenv("RAG_RERANK", "0") == "1"
+RERANK_CANDIDATES = 50        # dense/hybrid hits scored by the cross-encoder
+RERANK_BUDGET_MS = float(os.getenv("RAG_RERANK_BUDGET_MS", "500"))
+RERANK_MIN_PAIRS = 2          # scored even over budget, so the cost estimate follows a model that got faster
+RERANK_MAX_LENGTH = 256       # tokens per (question, chunk) pair; chunks are ~500 chars
+SCORE_CACHE_SIZE = 20_000     # memoized (question, chunk id) scores
+
+
+def load_cross_encoder(model_id=RERANK_MODEL_ID):
+    """Batched scoring function backed by a sentence-transformers CrossEncoder."""
+    from sentence_transformers import CrossEncoder
+    model = CrossEncoder(model_id, max_length=RERANK_MAX_LENGTH, device="cpu")
+    # One padded forward pass for the whole candidate pool
+    return lambda pairs: model.predict(pairs, batch_size=len(pairs), show_progress_bar=False).tolist()
+
+
+class CrossEncoderReranker:
+    """
+    Second retrieval stage: re-orders a wide candidate pool by cross-encoder
+    score and keeps the top k.
+
+    Scores are memoized per (normalized question, chunk id), so a repeated or
+    refined question only scores chunks it has not seen. The cost per pair is
+    tracked; when scoring every uncached pair is expected to exceed
+    `budget_ms`, only the best first-stage candidates that fit the budget
+    (at least `min_pairs`) are scored and re-ordered, and the rest follow
+    in first-stage (dense) order. Every pass re-measures the cost, so a
+    slow first pass (cold model) does not turn re-ranking off for good.
+    """
+
+    def __init__(self, score_fn, budget_ms=RERANK_BUDGET_MS, cache_size=SCORE_CACHE_SIZE, min_pairs=RERANK_MIN_PAIRS,
+                 clock=time.perf_counter):
+        self.score_fn = score_fn
+        self.budget_ms = budget_ms
+        self.min_pairs = min_pairs
+        self.cache_size = cache_size
+        self.clock = clock
+        self.ms_per_pair = None  # moving average, unknown until the first pass
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _doc_key(doc):
+        return doc.id or hash(doc.page_content)
+
+    def rerank(self, question, docs, k):
+        """(top-k docs, timings) where timings has rerank_ms, scored, cached, unscored and fallback."""
+        start = self.clock()
+        query_key = normalize_text(question).casefold()
+        keys = [(query_key, self._doc_key(d)) for d in docs]
+        with self._lock:
+            scores = {key: self._scores[key] for key in keys if key in self._scores}
+        todo = [(key, doc) for key, doc in zip(keys, docs) if key not in scores]
+        todo = list({key: (key, doc) for key, doc in todo}.values())  # duplicates are scored once
+        if todo and self.ms_per_pair is not None and self.ms_per_pair * len(todo) > self.budget_ms:
+            todo = todo[:max(self.min_pairs, int(self.budget_ms / self.ms_per_pair))]  # best first-stage hits first
+        timings = {"scored": len(todo), "cached": len(scores)}
+
+        if todo:
+            scoring_start = self.clock()
+            new_scores = self.score_fn([(question, doc.page_content) for _, doc in todo])
+            per_pair = 1000 * (self.clock() - scoring_start) / len(todo)
+            self.ms_per_pair = per_pair if self.ms_per_pair is None else 0.8 * self.ms_per_pair + 0.2 * per_pair
+            with self._lock:
+                for (key, _), score in zip(todo, new_scores):
+                    self._scores[key] = scores[key] = float(score)
+                    self._scores.move_to_end(key)
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+
+        unscored = sum(1 for key in keys if key not in scores)
+        timings.update(unscored=unscored, fallback=unscored > 0)
+        # Scored candidates by score, then the unscored ones; stable, so ties keep the first-stage order
+        order = sorted(range(len(docs)), key=lambda i: (keys[i] not in scores, -scores.get(keys[i], 0.0)))
+        timings["rerank_ms"] = 1000 * (self.clock() - start)
+        return [docs[i] for i in order[:k]], timings
@@ -0,0 +1,108 @@
+# src/scope_index.py
+import os
+import re
+import json
+from collections import Counter, defaultdict
+
+SCOPE_INDEX_FILE = "scope_index.json"  # written next to the Chroma files by ingestion
+PARTITION_PREFIX = "product-"          # one Chroma collection per product, next to the main one
+
+# Words in a question -> CFPB product names they refer to
+PRODUCT_ALIASES = {
+    "credit card": ["Credit card", "Credit card or prepaid card"],
+    "prepaid card": ["Credit card or prepaid card"],
+    "personal loan": ["Personal loan"],
+    "student loan": ["Student loan"],
+    "money transfer": ["Money transfer, virtual currency, or money service"],
+    "wire transfer": ["Money transfer, virtual currency, or money service"],
+    "virtual currency": ["Money transfer, virtual currency, or money service"],
+    "money service": ["Money transfer, virtual currency, or money service"],
+    "checking": ["Checking or savings account"],
+    "savings": ["Checking or savings account"],
+    "bank account": ["Checking or savings account"],
+}
+_ALIAS_PATTERNS = [
+    (re.compile(r"\b" + r"\s+".join(map(re.escape, alias.split())) + r"s?\b", re.IGNORECASE), products)
+    for alias, products in PRODUCT_ALIASES.items()
+]
+_STOPWORDS = {"with", "your", "from", "that", "this", "when", "were", "have", "about", "problem", "issue", "other"}
+
+
+class ScopeIndex:
+    """
+    Chunk counts per product and per (product, issue), built during ingestion.
+
+    Used to turn a question into a scope ("What are the main issues with
+    Student Loans?" -> product = "Student loan") and to populate the scope
+    pickers in the app. A scoped query searches only the product's partition
+    collection (see `partition_name`), with the issue as a metadata filter.
+    """
+
+    def __init__(self, products=None, issues=None):
+        self.products = Counter(products or {})
+        self.issues = defaultdict(Counter, {p: Counter(i) for p, i in (issues or {}).items()})
+
+    # --- Building ---
+
+    def observe(self, chunks):
+        """Pass-through generator that counts chunks while they flow to the indexer."""
+        for chunk in chunks:
+            product = chunk.metadata.get("product")
+            if product:
+                self.products[product] += 1
+                self.issues[product][chunk.metadata.get("issue", "Unknown")] += 1
+            yield chunk
+
+    def save(self, db_path):
+        os.makedirs(db_path, exist_ok=True)
+        tmp_path = os.path.join(db_path, SCOPE_INDEX_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"products": self.products, "issues": self.issues}, f, indent=1)
+        os.replace(tmp_path, os.path.join(db_path, SCOPE_INDEX_FILE))
+
+    @classmethod
+    def load(cls, db_path):
+        path = os.path.join(db_path, SCOPE_INDEX_FILE)
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data.get("products"), data.get("issues"))
+
+    # --- Querying ---
+
+    def infer(self, question):
+        """(products, issue) mentioned in the question, restricted to what is indexed."""
+        products = []
+        for pattern, names in _ALIAS_PATTERNS:
+            if pattern.search(question):
+                products += [p for p in names if p in self.products and p not in products]
+
+        words = set(re.findall(r"[a-z]+", question.lower()))
+        issue = None
+        for product in products or list(self.products):
+            for name in self.issues[product]:
+                content = {w for w in re.findall(r"[a-z]+", name.lower()) if len(w) > 3 and w not in _STOPWORDS}
+                if content and content <= words:
+                    issue = name
+                    break
+            if issue:
+                break
+        return products, issue
+
+
+def partition_name(product):
+    """Name of the Chroma collection holding one product's chunks."""
+    return PARTITION_PREFIX + re.sub(r"[^a-z0-9]+", "-", product.lower()).strip("-")
+
+
+def build_filter(products=None, issue=None):
+    """Chroma `where` clause for a scope (None when unscoped)."""
+    clauses = []
+    if products:
+        clauses.append({"product": products[0]} if len(products) == 1 else {"product": {"$in": list(products)}})
+    if issue:
+        clauses.append({"issue": issue})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
@@ -0,0 +1,374 @@
+# src/snapshots.py
+import os
+import json
+import time
+import uuid
+import socket
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger("CreditRAG")
+
+# --- CONFIGURATION ---
+SNAPSHOTS_DIR = "snapshots"   # chroma_db/snapshots/<version>/ holds one complete, immutable index
+CURRENT_FILE = "CURRENT"      # chroma_db/CURRENT names the published snapshot (replaced atomically)
+LEASES_DIR = "leases"         # chroma_db/leases/<version>/<reader>: snapshots that readers still use
+LEGACY_VERSION_FILE = "index_version"  # pre-snapshot indexes were rewritten in place, versioned by this file
+LEGACY_LEASE = "legacy"       # chroma_db/leases/legacy/<reader>: readers of such an index
+INDEX_META_FILE = "index_meta.json"    # how an index was built (token counter, ...), written by ingestion
+POLL_INTERVAL_S = float(os.getenv("RAG_SNAPSHOT_POLL_S", "2"))
+LEASE_TTL_S = 60.0            # a lease not refreshed for this long belongs to a reader that is gone
+KEEP_SNAPSHOTS = 2            # the published snapshot and the one before it are never collected
+
+
+# --- LAYOUT ---
+
+def snapshot_path(root, version):
+    return os.path.join(root, SNAPSHOTS_DIR, version)
+
+
+def current_version(root):
+    """Name of the published snapshot, or None before the first publish."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def resolve(root):
+    """
+    (version, path) of the index to serve: the published snapshot, else an
+    index written in place in `root` by an older ingestion (its version is
+    the index_version file), else (None, None).
+    """
+    version = current_version(root)
+    if version is not None:
+        return version, snapshot_path(root, version)
+    if not os.path.isdir(root):
+        return None, None
+    try:
+        with open(os.path.join(root, LEGACY_VERSION_FILE)) as f:
+            return f.read().strip(), root
+    except OSError:
+        return "", root
+
+
+def read_index_meta(path):
+    """The build settings recorded in an index directory ({} if there are none, e.g. an older index)."""
+    try:
+        with open(os.path.join(path, INDEX_META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_index_meta(path, **fields):
+    """Merges `fields` into the index's build settings (kept in the snapshot, so copies carry them)."""
+    meta = {**read_index_meta(path), **fields}
+    tmp_path = os.path.join(path, INDEX_META_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(path, INDEX_META_FILE))
+    return meta
+
+
+def list_snapshots(root):
+    """Snapshot versions on disk, oldest first (names sort by creation time)."""
+    try:
+        return sorted(os.listdir(os.path.join(root, SNAPSHOTS_DIR)))
+    except OSError:
+        return []
+
+
+# --- WRITING (ingestion) ---
+
+def new_snapshot(root, rebuild=False):
+    """
+    Creates the directory of the next snapshot and returns (version, path).
+    It starts as a copy of the index being served (empty with `rebuild`),
+    so an incremental ingestion only writes the changes; readers never see
+    it until publish().
+    """
+    version = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}"  # sorts by creation time
+    path = snapshot_path(root, version)
+    _, base = resolve(root)
+    if base is not None and not rebuild:
+        shutil.copytree(base, path, ignore=shutil.ignore_patterns(SNAPSHOTS_DIR, LEASES_DIR, CURRENT_FILE)
+                        if base == root else None)
+    else:
+        os.makedirs(path)
+    return version, path
+
+
+def publish(root, version):
+    """Points CURRENT at `version` in one rename; serving processes pick it up on their next poll."""
+    if not os.path.isdir(snapshot_path(root, version)):
+        raise FileNotFoundError(f"no snapshot {version!r} in {root}")
+    tmp_path = os.path.join(root, f"{CURRENT_FILE}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def discard(root, version):
+    """Deletes an unpublished snapshot (e.g. an ingestion that changed nothing)."""
+    if version != current_version(root):
+        shutil.rmtree(snapshot_path(root, version), ignore_errors=True)
+
+
+def collect_garbage(root, keep=KEEP_SNAPSHOTS, lease_ttl=LEASE_TTL_S):
+    """
+    Deletes snapshots older than the published one that are neither among
+    the `keep` newest nor leased by a live reader. Snapshots newer than
+    CURRENT are left alone (an ingestion may still be writing them).
+    Returns the deleted versions.
+    """
+    published = current_version(root)
+    if published is None:
+        return []
+    older = [v for v in list_snapshots(root) if v < published]
+    removed = []
+    for version in older[:max(0, len(older) - (keep - 1))]:
+        if active_leases(root, version, lease_ttl):
+            continue
+        shutil.rmtree(snapshot_path(root, version), ignore_errors=True)
+        shutil.rmtree(os.path.join(root, LEASES_DIR, version), ignore_errors=True)
+        removed.append(version)
+    if removed:
+        logger.info("snapshots: collected %s", ", ".join(removed))
+    remove_legacy_index(root, lease_ttl)
+    return removed
+
+
+def remove_legacy_index(root, lease_ttl=LEASE_TTL_S):
+    """
+    Deletes the index an older ingestion wrote in place in `root` once a
+    snapshot is published and no reader leases it any more (the first
+    snapshot was copied from it). Returns the deleted names.
+    """
+    if current_version(root) is None or active_leases(root, LEGACY_LEASE, lease_ttl):
+        return []
+    names = [name for name in os.listdir(root)
+             if name not in (SNAPSHOTS_DIR, LEASES_DIR) and not name.startswith(CURRENT_FILE)]
+    for name in names:
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+    shutil.rmtree(os.path.join(root, LEASES_DIR, LEGACY_LEASE), ignore_errors=True)
+    if names:
+        logger.info("snapshots: removed the in-place index (%d files)", len(names))
+    return names
+
+
+# --- LEASES (readers, across processes) ---
+
+def active_leases(root, version, lease_ttl=LEASE_TTL_S):
+    """Readers of `version` whose lease was refreshed within `lease_ttl`; stale leases are removed."""
+    lease_dir = os.path.join(root, LEASES_DIR, version)
+    try:
+        names = os.listdir(lease_dir)
+    except OSError:
+        return []
+    live, now = [], time.time()
+    for name in names:
+        path = os.path.join(lease_dir, name)
+        try:
+            if now - os.path.getmtime(path) <= lease_ttl:
+                live.append(name)
+            else:
+                os.remove(path)
+        except OSError:  # released meanwhile
+            pass
+    return live
+
+
+class Lease:
+    """A reader's claim on one snapshot: a file whose mtime is refreshed while it is in use."""
+
+    def __init__(self, root, version):
+        lease_dir = os.path.join(root, LEASES_DIR, version)
+        os.makedirs(lease_dir, exist_ok=True)
+        self.path = os.path.join(lease_dir, f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        open(self.path, "w").close()
+
+    def refresh(self):
+        try:
+            os.utime(self.path)
+        except OSError:  # collected as stale (e.g. the process was suspended): claim it again
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            open(self.path, "w").close()
+
+    def release(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+# --- SERVING ---
+
+class Snapshot:
+    """One opened index version. `resources` is whatever the manager's open_fn returned for it."""
+    __slots__ = ("version", "path", "resources", "refs", "retired", "lease")
+
+    def __init__(self, version, path, resources, lease=None):
+        self.version = version
+        self.path = path
+        self.resources = resources
+        self.refs = 0          # requests currently pinned to it
+        self.retired = False   # replaced by a newer version; closed once refs drops to 0
+        self.lease = lease
+
+
+class SnapshotManager:
+    """
+    Serves the published snapshot of `root` and swaps in new ones without a restart.
+
+    A watcher thread polls CURRENT every `poll_interval_s`. When a new
+    version is published it is opened and warmed up (`open_fn(path)`) in
+    that thread while requests keep using the old one, then becomes current
+    in a single assignment. Requests pin the snapshot they started on
+    (`pin()`), so a swap only affects the requests that start after it; the
+    old snapshot is closed (`close_fn(resources)`) when its last request
+    finishes, and deleted from disk by collect_garbage() once no process
+    holds a lease on it.
+    """
+
+    def __init__(self, root, open_fn, close_fn=None, poll_interval_s=POLL_INTERVAL_S, lease_ttl=LEASE_TTL_S,
+                 keep=KEEP_SNAPSHOTS):
+        self.root = root
+        self.open_fn = open_fn
+        self.close_fn = close_fn
+        self.poll_interval_s = poll_interval_s
+        self.lease_ttl = lease_ttl
+        self.keep = keep
+        self.swaps = 0
+        self._current = None
+        self._retired = []
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def current(self):
+        """The snapshot new requests are served from (opened on first use; None if there is no index)."""
+        if self._current is None:
+            self.check()
+        return self._current
+
+    def acquire(self):
+        """current(), pinned until release(): it is not closed or collected meanwhile."""
+        self.current()
+        with self._lock:
+            snapshot = self._current
+            if snapshot is not None:
+                snapshot.refs += 1
+        return snapshot
+
+    def release(self, snapshot):
+        if snapshot is None:
+            return
+        with self._lock:
+            snapshot.refs -= 1
+            done = snapshot.retired and snapshot.refs == 0
+        if done:
+            self._close(snapshot)
+
+    @contextmanager
+    def pin(self):
+        snapshot = self.acquire()
+        try:
+            yield snapshot
+        finally:
+            self.release(snapshot)
+
+    def check(self):
+        """Opens and swaps in the published version if it changed; True if it did."""
+        with self._check_lock:  # one open at a time (watcher thread vs first request)
+            version, path = resolve(self.root)
+            active = self._current
+            if path is None or (active is not None and (active.version, active.path) == (version, path)):
+                return False
+            lease = Lease(self.root, version if path != self.root else LEGACY_LEASE)
+            try:
+                start = time.perf_counter()
+                resources = self.open_fn(path)
+            except Exception:
+                if lease is not None:
+                    lease.release()
+                raise
+            snapshot = Snapshot(version, path, resources, lease)
+            with self._lock:
+                old, self._current = self._current, snapshot
+                if old is not None:
+                    old.retired = True
+                    self._retired.append(old)
+                    self.swaps += 1
+                idle = old is not None and old.refs == 0
+            logger.info("snapshots: serving %s (opened in %.2fs)", version or path, time.perf_counter() - start)
+        if idle:
+            self._close(old)
+        return True
+
+    def _close(self, snapshot):
+        with self._lock:
+            if snapshot not in self._retired:
+                return  # closed by another thread
+            self._retired.remove(snapshot)
+        try:
+            if self.close_fn is not None:
+                self.close_fn(snapshot.resources)
+        finally:
+            if snapshot.lease is not None:
+                snapshot.lease.release()
+        collect_garbage(self.root, self.keep, self.lease_ttl)
+
+    def refresh_leases(self):
+        with self._lock:
+            snapshots = [s for s in [self._current] + self._retired if s is not None and s.lease is not None]
+        for snapshot in snapshots:
+            snapshot.lease.refresh()
+
+    def start(self):
+        """Starts the watcher thread (idempotent); returns self."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="snapshot-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval_s):
+            try:
+                self.refresh_leases()
+                self.check()
+            except Exception as e:  # keep serving the old snapshot; try again next poll
+                logger.warning("snapshots: could not switch to the published index: %s", e)
+
+    def stop(self):
+        """Stops watching and closes every snapshot (tests, shutdown)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval_s + 1)
+        with self._lock:
+            snapshots = [s for s in [self._current] + self._retired if s is not None]
+            self._current, self._retired = None, []
+        for snapshot in snapshots:
+            if self.close_fn is not None:
+                self.close_fn(snapshot.resources)
+            if snapshot.lease is not None:
+                snapshot.lease.release()
+
+    def stats(self):
+        with self._lock:
+            current = self._current
+            return {"version": current.version if current else None, "path": current.path if current else None,
+                    "in_flight": current.refs if current else 0, "retired": len(self._retired),
+                    "swaps": self.swaps}
@@ -0,0 +1,238 @@
+# src/telemetry.py
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# --- CONFIGURATION ---
+TELEMETRY_ENABLED = os.getenv("RAG_TELEMETRY", "1") != "0"
+TELEMETRY_JSONL = os.getenv("RAG_TELEMETRY_JSONL")      # append one line per span to this file
+METRICS_PORT = int(os.getenv("RAG_METRICS_PORT", "0"))   # the app serves /metrics (Prometheus text) when set
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10_000,
+                      30_000, 60_000)  # sub-ms buckets: cache lookups and BM25 spans are often well under 1 ms
+METRIC_PREFIX = "creditrag"
+
+_NOOP = nullcontext()
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far (current RSS where no peak is reported, 0 if neither is)."""
+    info = psutil.Process().memory_info() if psutil is not None else None
+    if getattr(info, "peak_wset", None):  # Windows
+        return info.peak_wset / 2**20
+    if resource is not None:  # psutil has no peak on Linux / macOS; getrusage does
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 1024  # bytes on macOS, KiB on Linux
+    return info.rss / 2**20 if info is not None else 0.0
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (ms); quantiles are interpolated within a bucket."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= target:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, low + (high - low) * (target - seen) / n)
+            seen += n
+        return self.max
+
+
+class Telemetry:
+    """
+    Span timers, latency histograms and counters for the ingestion and query stages.
+
+        with telemetry.span("query.embed"):
+            vectors = embedder.embed_queries(questions)
+
+    Every span adds its latency to the histogram of that name and bumps
+    `<name>.calls` (and `<name>.errors` if it raised). When disabled, span()
+    returns a shared no-op context manager and incr()/observe() return at
+    once, so instrumented code pays one attribute check per call.
+    """
+
+    def __init__(self, enabled=TELEMETRY_ENABLED, jsonl_path=TELEMETRY_JSONL):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.histograms = {}
+        self.counters = Counter()
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def span(self, name):
+        if not self.enabled:
+            return _NOOP
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.observe(name, 1000 * (time.perf_counter() - start), ok)
+
+    def timed_iter(self, name, iterable):
+        """Yields from `iterable`, timing each next() call as a `name` span (for lazy pipelines)."""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            with self.span(name):
+                item = next(iterator, _NOOP)
+            if item is _NOOP:
+                return
+            yield item
+
+    def observe(self, name, ms, ok=True):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(ms)
+            self.counters[f"{name}.calls"] += 1
+            if not ok:
+                self.counters[f"{name}.errors"] += 1
+        if self.jsonl_path:
+            self._append({"ts": time.time(), "span": name, "ms": round(ms, 3), "ok": ok})
+
+    def incr(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += n
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    # --- Export ---
+
+    def snapshot(self):
+        """{"spans": {name: {count, total_ms, mean_ms, p50/p95/p99_ms, max_ms}}, "counters", "peak_rss_mb"}."""
+        with self._lock:
+            spans = {
+                name: {
+                    "count": h.count,
+                    "total_ms": h.sum,
+                    "mean_ms": h.sum / h.count if h.count else 0.0,
+                    "p50_ms": h.quantile(0.50),
+                    "p95_ms": h.quantile(0.95),
+                    "p99_ms": h.quantile(0.99),
+                    "max_ms": h.max,
+                }
+                for name, h in sorted(self.histograms.items())
+            }
+            counters = dict(sorted(self.counters.items()))
+        return {"spans": spans, "counters": counters, "peak_rss_mb": peak_rss_mb(),
+                "uptime_s": time.time() - self.started_at}
+
+    def to_prometheus(self):
+        """The metrics in Prometheus text exposition format."""
+        lines = [f"# TYPE {METRIC_PREFIX}_stage_latency_ms histogram"]
+        with self._lock:
+            for name, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for le, n in zip([*h.buckets, "+Inf"], h.counts):
+                    cumulative += n
+                    lines.append(f'{METRIC_PREFIX}_stage_latency_ms_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}_stage_latency_ms_sum{{stage="{name}"}} {h.sum:.3f}')
+                lines.append(f'{METRIC_PREFIX}_stage_latency_ms_count{{stage="{name}"}} {h.count}')
+            lines.append(f"# TYPE {METRIC_PREFIX}_events_total counter")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'{METRIC_PREFIX}_events_total{{name="{name}"}} {value}')
+        lines.append(f"# TYPE {METRIC_PREFIX}_peak_rss_mb gauge")
+        lines.append(f"{METRIC_PREFIX}_peak_rss_mb {peak_rss_mb():.1f}")
+        return "\n".join(lines) + "\n"
+
+    def export_jsonl(self, path):
+        """Appends the current snapshot as one JSON line (e.g. at the end of an ingestion run)."""
+        self._append({"ts": time.time(), **self.snapshot()}, path)
+
+    def _append(self, record, path=None):
+        with self._lock, open(path or self.jsonl_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def serve(self, port=METRICS_PORT, host="127.0.0.1"):
+        """Serves GET /metrics on a daemon thread (once per process). Returns the bound port."""
+        if self._server is None:
+            telemetry = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.rstrip("/") not in ("", "/metrics"):
+                        self.send_error(404)
+                        return
+                    body = telemetry.to_prometheus().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer((host, port), Handler)
+            threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        return self._server.server_address[1]
+
+    def start_exporter(self, port=METRICS_PORT):
+        """
+        serve() for the long-running process (the app), called explicitly so
+        scripts that import this module never bind the port. Returns the
+        port, or None if it is unset, telemetry is off or the port is taken.
+        """
+        if not port or not self.enabled:
+            return None
+        try:
+            return self.serve(port)
+        except OSError as e:  # e.g. a second app process on the same host
+            print(f"⚠️ Not serving /metrics on port {port}: {e}")
+            return None
+
+
+telemetry = Telemetry()
+span = telemetry.span
+
+
+def get_telemetry():
+    """The process-wide collector (shared by ingestion, the pipeline and the app)."""
+    return telemetry
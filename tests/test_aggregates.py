@@ -0,0 +1,136 @@
+import sys
+import os
+import pandas as pd
+import pytest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from aggregates import AggregateBuilder, AggregateStore, format_summary, is_aggregate_question
+from chunking import ChunkRecord
+from scope_index import ScopeIndex
+
+
+def complaints():
+    """12 Student loan complaints over 2023 (8 servicer, 4 fees) and 2 Credit card ones."""
+    months = [f"2023-{m:02d}-15" for m in range(1, 13)]
+    return pd.DataFrame({
+        "Product": ["Student loan"] * 12 + ["Credit card"] * 2,
+        "Issue": ["Dealing with your lender or servicer"] * 8 + ["Fees or interest"] * 4 + [None, "Fees or interest"],
+        "Date received": months + ["01/03/2024", "not a date"],
+        "Complaint ID": list(range(1000, 1014)),
+        "Consumer complaint narrative": ["text"] * 14,
+    })
+
+
+def test_builder_counts_by_product_issue_and_month():
+    """Test 1: Counts add up across CSV chunks; summaries rank issues, compare windows and keep exemplars."""
+    df = complaints()
+    builder = AggregateBuilder(exemplars=2)
+    assert sum(len(chunk) for chunk in builder.observe([df.iloc[:5], df.iloc[5:]])) == 14
+    store = builder.build()
+    assert int(store.table["count"].sum()) == 14
+    assert set(store.table["month"]) >= {"2023-01", "2023-12", "2024-01", "unknown"}
+    assert store.table.loc[store.table["product"] == "Credit card", "issue"].tolist() == [
+        "Fees or interest", "Unknown"]
+
+    summary = store.summarize(["Student loan"])
+    assert summary["total"] == 12 and (summary["first_month"], summary["last_month"]) == ("2023-01", "2023-12")
+    assert [(name, n) for name, n, _ in summary["top_issues"]] == [
+        ("Dealing with your lender or servicer", 8), ("Fees or interest", 4)]
+    assert (summary["recent"], summary["previous"]) == (6, 6)
+    assert summary["exemplar_ids"] == ["1007", "1011"]  # the latest complaint of each top issue
+    text = format_summary(summary)
+    assert "**12 complaints** about Student loan" in text and "1. Dealing with your lender or servicer: 8 (67%)" in text
+
+    fees = store.summarize(["Student loan"], "Fees or interest")
+    assert fees["issue_total"] == 4 and fees["exemplar_ids"] == ["1011", "1010", "1009"]
+    assert format_summary(store.summarize(["Mortgage"])) == "No complaints are recorded for Mortgage."
+
+    assert is_aggregate_question("What are the main issues with Student Loans?")
+    assert not is_aggregate_question("Are there delays in Money Transfers?")  # evidence from the narratives
+    assert is_aggregate_question("How many complaints about Zelle were filed per month?")
+    assert not is_aggregate_question("Why are customers complaining about overdraft fees?")
+    assert not is_aggregate_question("What happens if I pay off my personal loan early?")
+
+
+def test_service_answers_aggregate_questions_without_retrieval(monkeypatch):
+    """Test 2: Aggregate questions skip embedding, retrieval and generation; drill-downs do not."""
+    import asyncio
+    import rag_pipeline as rp
+    from langchain_core.documents import Document
+    from rag_service import PipelineStages, RAGService
+
+    builder = AggregateBuilder()
+    builder.add(complaints())
+    scope = ScopeIndex()
+    list(scope.observe([ChunkRecord("a", "text", {"product": "Student loan", "issue": "Fees or interest"})]))
+    monkeypatch.setattr(rp, "get_aggregate_store", builder.build)
+    monkeypatch.setattr(rp, "get_scope_index", lambda: scope)
+
+    class Stages(PipelineStages):
+        """Real aggregate routing; the retrieval path only records that it ran."""
+
+        def __init__(self):
+            self.embed_calls, self.generate_calls = [], []
+
+        def embed(self, questions):
+            self.embed_calls.append(len(questions))
+            return [[1.0] for _ in questions]
+
+        def cached(self, question, scope, rerank=False):
+            return None
+
+        def store(self, question, scope, result, rerank=False, version=None):
+            pass
+
+        def retrieve(self, question, scope, vector, rerank=False, k=3):
+            return [Document(page_content="evidence", id="c1")], {"retrieve_ms": 0.1}
+
+        def generate(self, prompts):
+            self.generate_calls.append(len(prompts))
+            return [f" answer {i}" for i in range(len(prompts))]
+
+    stages = Stages()
+    service = RAGService(stages, batch_window_ms=1)
+    result = service.ask_sync("What are the main issues with Student Loans?")
+    assert result["scope"] == {"products": ["Student loan"], "issue": None} and result["docs"] == []
+    assert result["summary"]["total"] == 12 and "aggregate_ms" in result["timings"]
+    assert stages.embed_calls == [] and stages.generate_calls == []
+
+    events = dict(service.stream_sync("Is the volume of student loan complaints rising?"))
+    assert events["aggregate"]["total"] == 12 and events["token"].startswith("**12 complaints**")
+    assert asyncio.run(service.ask("How many student loan complaints?", aggregates=False))["answer"] == "answer 0"
+    service.ask_sync("Why was my student loan payment misapplied?")
+    assert stages.embed_calls == [1, 1] and service.stats()["aggregate_answers"] == 2
+    service.close()
+
+    monkeypatch.setattr(rp, "AGGREGATE_ROUTING", False)
+    assert rp.answer_aggregate("What are the main issues with Student Loans?") is None
+
+
+def test_parquet_round_trip(tmp_path):
+    """Test 3: The store is saved as Parquet next to the index and loads back unchanged."""
+    pytest.importorskip("pyarrow")
+    builder = AggregateBuilder()
+    builder.add(complaints())
+    store = builder.build()
+    store.save(str(tmp_path))
+    loaded = AggregateStore.load(str(tmp_path))
+    pd.testing.assert_frame_equal(loaded.table, store.table)
+    assert loaded.summarize(["Credit card"]) == store.summarize(["Credit card"])
+    assert AggregateStore.load(str(tmp_path / "missing")) is None
+
+
+def test_loaders_count_complaints_without_narrative(tmp_path):
+    """Test 4: Both CSV loaders feed the builder every complaint of the target products, with or without text."""
+    from ingestion import load_sample_in_memory, load_sample_streaming
+
+    df = complaints()
+    df.loc[::2, "Consumer complaint narrative"] = None
+    df.loc[len(df)] = ["Mortgage", "Fees or interest", "2023-05-01", 2000, "text"]  # not a target product
+    csv_path = tmp_path / "complaints.csv"
+    df.to_csv(csv_path, index=False)
+
+    for load in (load_sample_streaming, load_sample_in_memory):
+        builder = AggregateBuilder()
+        assert len(load(csv_path, aggregates=builder)) == 7
+        assert int(builder.build().table["count"].sum()) == 14
@@ -0,0 +1,80 @@
+import sys
+import os
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from compact_store import CompactVectorStore, export_compact_store
+from scope_index import build_filter
+
+PRODUCTS = ["Credit card", "Student loan", "Personal loan"]
+
+
+def clustered_store(path, n=3000, dim=32, seed=0):
+    """Chroma collection of unit vectors around 20 centres, with product / issue metadata."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(20, dim))
+    vectors = centres[rng.integers(20, size=n)] + 0.6 * rng.normal(size=(n, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    store = Chroma(collection_name="test_compact", embedding_function=DeterministicFakeEmbedding(size=dim),
+                   persist_directory=path)
+    for start in range(0, n, 1000):
+        rows = range(start, min(start + 1000, n))
+        store._collection.upsert(
+            ids=[f"c{i}" for i in rows], embeddings=vectors[start:start + 1000].tolist(),
+            documents=[f"chunk {i}" for i in rows],
+            metadatas=[{"product": PRODUCTS[i % 3], "issue": "Fees" if i % 2 else "Billing"} for i in rows])
+    return store, vectors, rng
+
+
+def test_pq_and_float16_stores_match_exact_search(tmp_path):
+    """Test 1: PQ shortlist + re-score and the float16 scan find the exact neighbours, scoped or not."""
+    store, vectors, rng = clustered_store(str(tmp_path / "db"))
+    queries = vectors[rng.integers(len(vectors), size=30)] + 0.3 * rng.normal(size=(30, vectors.shape[1]))
+    exact = [set(np.argsort(-(vectors @ q))[:5]) for q in queries]
+
+    for mode, min_recall in (("float16", 0.99), ("pq", 0.95)):
+        manifest = export_compact_store(store, str(tmp_path / "db"), mode=mode, subvectors=8)
+        assert manifest["count"] == 3000 and manifest["mode"] == mode
+        compact = CompactVectorStore.load(str(tmp_path / "db"))
+        found = [{row for row, _ in compact.search_vector(q, k=5)} for q in queries]
+        recall = np.mean([len(f & e) / 5 for f, e in zip(found, exact)])
+        assert recall >= min_recall, (mode, recall)
+
+        where = build_filter(["Student loan"], "Fees")
+        docs = compact.similarity_search_by_vector(queries[0].tolist(), k=4, filter=where)
+        assert len(docs) == 4 and all(d.metadata == {"product": "Student loan", "issue": "Fees"} for d in docs)
+        assert compact.similarity_search_by_vector(queries[0].tolist(), k=4, filter=build_filter(["Mortgage"])) == []
+
+    report = compact.memory_report()
+    assert report["scan_bytes"] == 8 * 3000 and report["vector_bytes"] * 2 == report["float32_bytes"]
+    assert [d.page_content for d in compact.get_by_ids(["c7", "missing", "c2999"])] == ["chunk 7", "chunk 2999"]
+
+
+def test_pipeline_serves_the_compact_store_and_picks_up_new_exports(tmp_path, monkeypatch):
+    """Test 2: RAG_VECTOR_BACKEND=compact loads the mmap store; a re-export is seen without a restart."""
+    import rag_pipeline as rp
+    db = str(tmp_path / "db")
+    embeddings = DeterministicFakeEmbedding(size=32)
+    store = Chroma(collection_name="test_pipeline", embedding_function=embeddings, persist_directory=db)
+    store.add_texts(["late fee charged twice", "loan servicer lost my payment"], ids=["a", "b"],
+                    metadatas=[{"product": "Credit card"}, {"product": "Student loan"}])
+    monkeypatch.setattr(rp, "VECTOR_BACKEND", "compact")
+    monkeypatch.setattr(rp, "VECTOR_STORE_PATH", db)
+    monkeypatch.setattr(rp, "get_embeddings", lambda: embeddings)
+
+    assert rp._load_vectorstore() is None  # nothing exported yet
+    export_compact_store(store, db, subvectors=8)
+    compact = rp._load_vectorstore()
+    assert rp.get_partition("Student loan") is None
+    retriever = compact.as_retriever(search_kwargs={"k": 2, "filter": build_filter(["Student loan"])})
+    assert [d.id for d in retriever.invoke("late fee charged twice")] == ["b"]
+    assert compact.similarity_search("late fee charged twice", k=1)[0].id == "a"
+
+    store.add_texts(["zelle transfer never arrived"], ids=["c"], metadatas=[{"product": "Money transfer"}])
+    export_compact_store(store, db, subvectors=8)
+    assert len(compact.similarity_search("zelle transfer never arrived", k=5)) == 3
+    assert compact.get_by_ids(["c"])[0].page_content == "zelle transfer never arrived"
+    compact.close()
+    assert len(compact) == 0 and compact.similarity_search("late fee", k=1) == []
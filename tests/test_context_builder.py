@@ -0,0 +1,51 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langchain_core.documents import Document
+from context_builder import ContextBuilder, split_sentences
+
+
+def words(text):
+    return len(text.split())
+
+
+DOCS = [
+    Document(id="c1", page_content="I was charged a late fee on my credit card. The payment posted on time. "
+                                   "I called three times.", metadata={"complaint_id": 101, "complaint_ids": "101,105"}),
+    Document(id="c2", page_content="They charged a late fee on my credit card again!\nMy dog was sick that week.",
+             metadata={"complaint_id": 202}),
+    Document(id="c3", page_content="The bank refused to waive the late fee charged on my credit card.",
+             metadata={"complaint_id": 303}),
+]
+
+
+def test_budget_keeps_the_most_relevant_sentences_tagged_by_complaint():
+    """Test 1: Packing respects the budget, prefers question terms, drops repeats and cites complaints."""
+    assert split_sentences(DOCS[1].page_content) == ["They charged a late fee on my credit card again!",
+                                                     "My dog was sick that week."]
+    builder = ContextBuilder(token_counter=words)
+    packed = builder.build("Why was a late fee charged on my credit card?", DOCS, budget=None)
+    kept = [s for _, s in packed.sentences]
+    assert "They charged a late fee on my credit card again!" not in kept  # repeat of complaint 101's sentence
+    assert packed.redundant == 1 and packed.over_budget == 0
+    assert packed.text.splitlines()[0] == ("[#101] I was charged a late fee on my credit card. "
+                                           "The payment posted on time. I called three times.")
+    assert packed.citations["101"] == ["101", "105"]
+
+    small = builder.build("Why was a late fee charged on my credit card?", DOCS, budget=13)
+    assert small.tokens <= 13 and small.over_budget > 0
+    assert small.text == "[#101] I was charged a late fee on my credit card."
+
+
+def test_prompt_fits_the_encoder_window(monkeypatch):
+    """Test 2: build_prompt packs long contexts under 512 tokens; a budget of 0 keeps the old join."""
+    import rag_pipeline as rp
+    builder = ContextBuilder(token_counter=words)
+    monkeypatch.setattr(rp, "get_context_builder", lambda: builder)
+    vocabulary = "fee card bank late charge refund branch agent statement interest account payment".split()
+    long_docs = [Document(page_content=" ".join(f"The {vocabulary[j % 12]} {j} {vocabulary[(i + j) % 12]} {i * j}."
+                                                for j in range(60)), metadata={"complaint_id": i}) for i in range(5)]
+    prompt = rp.build_prompt("Why so many card fees?", long_docs)
+    assert words(prompt) <= rp.ENCODER_MAX_TOKENS and "[#0]" in prompt
+    assert rp.build_context("q", long_docs, budget=0) == rp.format_docs(long_docs)
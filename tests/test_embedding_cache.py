@@ -0,0 +1,69 @@
+import sys
+import os
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Fix path to allow importing from src
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache, text_key
+
+
+class CountingEmbeddings(Embeddings):
+    """Deterministic embedder that records how many texts it actually embedded."""
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(t)), float(sum(map(ord, t)) % 97), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_cache_skips_seen_texts_across_instances(tmp_path):
+    """Test 1: Re-embedding the same (normalized) text is served from disk, even in a new process."""
+    model = CountingEmbeddings()
+    first = CachedEmbeddings(lambda: model, "fake", EmbeddingCache("fake", str(tmp_path)))
+    vectors = first.embed_documents(["late fee", "late   fee ", "wire delayed"])
+    assert model.calls == 2  # whitespace variants share one key
+    assert vectors[0] == vectors[1]
+
+    second = CachedEmbeddings(lambda: model, "fake", EmbeddingCache("fake", str(tmp_path)))
+    again = second.embed_documents(["wire delayed", "late fee"])
+    assert model.calls == 2
+    assert np.allclose(again, [vectors[2], vectors[0]], atol=1e-2)
+    assert second.stats()["hits"] == 2 and second.stats()["misses"] == 0
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    """Test 2: The vectors file stays within its byte budget."""
+    cache = EmbeddingCache("fake", str(tmp_path), dtype="float32", max_bytes=3 * 4 * 4)  # 4 vectors of dim 3
+    keys = [text_key("fake", f"text {i}") for i in range(6)]
+    for i, key in enumerate(keys[:4]):
+        cache.put_many({key: [i, i, i]})
+    cache.get_many([keys[0]])  # touch -> most recently used
+    cache.put_many({keys[4]: [4, 4, 4], keys[5]: [5, 5, 5]})
+
+    assert len(cache) == 4 and cache.size_bytes() <= 3 * 4 * 4
+    assert set(cache.get_many(keys)) == {keys[0], keys[3], keys[4], keys[5]}
+    assert cache.get_many([keys[5]])[keys[5]].tolist() == [5, 5, 5]
+
+    # A lower budget compacts the survivors into the first slots and shrinks the file
+    smaller = EmbeddingCache("fake", str(tmp_path), dtype="float32", max_bytes=3 * 4 * 2)
+    smaller.put_many({keys[1]: [1, 1, 1]})
+    assert len(smaller) == 2 and smaller.size_bytes() == 3 * 4 * 2
+    assert {k: v.tolist() for k, v in smaller.get_many(keys).items()} == {keys[5]: [5, 5, 5], keys[1]: [1, 1, 1]}
+
+
+def test_cache_written_with_another_dtype_or_dim_is_cleared(tmp_path):
+    """Test 3: Reopening with another dtype, or storing vectors of another size, never reads the old bytes."""
+    keys = [text_key("fake", f"text {i}") for i in range(2)]
+    EmbeddingCache("fake", str(tmp_path), dtype="float32").put_many({keys[0]: [1.0, 2.0, 3.0]})
+
+    as_float16 = EmbeddingCache("fake", str(tmp_path), dtype="float16")
+    assert len(as_float16) == 0 and as_float16.get_many(keys) == {}
+    as_float16.put_many({keys[0]: [1.0, 2.0, 3.0]})
+    as_float16.put_many({keys[1]: [1.0, 2.0, 3.0, 4.0]})  # a model with a bigger output under the same name
+    assert set(as_float16.get_many(keys)) == {keys[1]} and as_float16.dim == 4
@@ -0,0 +1,47 @@
+import sys
+import os
+import pytest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from evaluate_rag import _amortized, hit_at_k, load_gold_set, retrieved_complaint_ids, token_f1
+
+
+def test_answer_f1_and_hit_at_k():
+    """Test 1: Token F1 and hit@k on hand-checked cases; rows without labels are not scored."""
+    assert token_f1("late fees were charged", "late fees were charged") == 1.0
+    assert token_f1("Fees charged twice", "fees were charged") == pytest.approx(2 / 3)  # P 2/3, R 2/3
+    assert token_f1("", "fees") == 0.0 and token_f1("refund", "fees") == 0.0
+
+    assert hit_at_k(["11", "12", "13"], ["13", "99"]) is True
+    assert hit_at_k(["11", "12"], ["99"]) is False
+    assert hit_at_k(["11"], []) is None
+
+
+def test_gold_set_and_amortized_latency(tmp_path):
+    """Test 2: The gold CSV parses ';'-separated IDs; batch-wide stage times are split over the batch."""
+    path = tmp_path / "gold.csv"
+    path.write_text("question,reference_answer,expected_complaint_ids\n"
+                    "Why the fee?,Late fees.,101; 102\n"
+                    "Why the delay?,,\n")
+    gold = load_gold_set(str(path))
+    assert gold["expected_complaint_ids"].tolist() == [["101", "102"], []]
+    assert gold["reference_answer"].tolist() == ["Late fees.", ""]
+
+    shipped = load_gold_set(os.path.join(os.path.dirname(__file__), '..', 'data', 'gold_questions.csv'))
+    assert (shipped["reference_answer"] != "").all()
+
+    timings = {"embed_ms": 40.0, "generate_ms": 900.0, "batch_size": 4, "generate_batch_size": 3}
+    assert _amortized(timings, "embed_ms") == 10.0
+    assert _amortized(timings, "generate_ms", "generate_batch_size") == 300.0
+    assert _amortized({}, "generate_ms") is None
+
+
+def test_hit_at_k_counts_complaints_merged_into_a_kept_chunk():
+    """Test 3: A retrieved duplicate chunk stands for every complaint in its complaint_ids."""
+    from langchain_core.documents import Document
+
+    docs = [Document(page_content="late fee", metadata={"complaint_id": "11", "complaint_ids": "11,42,43"}),
+            Document(page_content="delay", metadata={"complaint_id": "12"}),  # indexed before dedup
+            Document(page_content="late fee again", metadata={"complaint_id": "43", "complaint_ids": "43"})]
+    assert retrieved_complaint_ids(docs) == ["11", "42", "43", "12"]
+    assert hit_at_k(retrieved_complaint_ids(docs), ["42"]) is True
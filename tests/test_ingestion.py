@@ -7,7 +7,12 @@ from langchain_core.documents import Document
 # Fix path to allow importing from src
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from ingestion import perform_stratified_split, chunk_documents
+from ingestion import (
+    perform_stratified_split, iter_filtered_chunks, stratified_reservoir_sample, sync_chunks, iter_records,
+    list_partitions
+)
+from chunking import chunk_documents, iter_chunks, iter_record_chunks
+from scope_index import partition_name
 
 def test_stratified_sampling_logic():
     """Test 1: Ensure the split maintains the right ratios."""
@@ -42,4 +47,165 @@ def test_chunking_constraints():
     # Assertions
     assert len(chunks) > 1  # Should be split into multiple parts
     for chunk in chunks:
-        assert len(chunk.page_content) <= 1200 # Max size + overlap buffer
\ No newline at end of file
+        assert len(chunk.page_content) <= 1200 # Max size + overlap buffer
+
+def _write_complaints_csv(path):
+    """Writes a small CFPB-shaped CSV (600/300/100 split + rows that must be filtered out)."""
+    products = (["Credit card"] * 600 + ["Student loan"] * 300 +
+                ["Personal loan"] * 100 + ["Mortgage"] * 50)
+    df = pd.DataFrame({
+        "Date received": ["2024-01-01"] * len(products),
+        "Product": products,
+        "Issue": ["Fees"] * len(products),
+        "Consumer complaint narrative": [f"complaint {i}" for i in range(len(products))],
+        "Complaint ID": range(len(products)),
+    })
+    df.loc[::10, "Consumer complaint narrative"] = None  # 10% without text
+    df.to_csv(path, index=False)
+
+def test_streaming_sample_matches_stratified_split(tmp_path):
+    """Test 3: The streaming reservoir sample keeps the same per-product counts as train_test_split."""
+    csv_path = tmp_path / "complaints.csv"
+    _write_complaints_csv(csv_path)
+
+    full = pd.concat(iter_filtered_chunks(csv_path, chunk_size=10_000))
+    assert set(full["Product"]) == {"Credit card", "Student loan", "Personal loan"}
+    assert full["Consumer complaint narrative"].notna().all()
+
+    sampled, counts = stratified_reservoir_sample(iter_filtered_chunks(csv_path, chunk_size=97), sample_size=90)
+    expected, _ = perform_stratified_split(full, stratify_col="Product", train_size=90)
+
+    assert counts.sum() == len(full)
+    assert len(sampled) == 90
+    assert sampled["Complaint ID"].is_unique
+    assert sampled["Product"].value_counts().to_dict() == expected["Product"].value_counts().to_dict()
+
+def test_streaming_sample_is_independent_of_chunk_size(tmp_path):
+    """Test 4: Peak-memory knob (chunk size) must not change which rows are sampled."""
+    csv_path = tmp_path / "complaints.csv"
+    _write_complaints_csv(csv_path)
+
+    small, _ = stratified_reservoir_sample(iter_filtered_chunks(csv_path, chunk_size=50), sample_size=90)
+    large, _ = stratified_reservoir_sample(iter_filtered_chunks(csv_path, chunk_size=5_000), sample_size=90)
+    assert sorted(small["Complaint ID"]) == sorted(large["Complaint ID"])
+
+def test_incremental_sync_is_idempotent(tmp_path):
+    """Test 5: Re-indexing only touches new/changed chunks and drops withdrawn complaints."""
+    from langchain_chroma import Chroma
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    store = Chroma(
+        collection_name="test_sync",
+        embedding_function=DeterministicFakeEmbedding(size=8),
+        persist_directory=str(tmp_path / "db")
+    )
+    products = ["Credit card", "Student loan"]
+    docs = [
+        Document(page_content=f"complaint number {i} " * 5, metadata={"complaint_id": i, "product": products[i % 2]})
+        for i in range(5)
+    ]
+
+    assert sync_chunks(store, iter_chunks(docs), partitioned=True) == (5, 0, 5)
+    assert sync_chunks(store, iter_chunks(docs), partitioned=True) == (0, 0, 5)  # unchanged input -> no-op
+
+    # Complaint 0 was edited, complaint 4 was withdrawn
+    docs[0] = Document(page_content="an updated narrative", metadata={"complaint_id": 0, "product": "Credit card"})
+    assert sync_chunks(store, iter_chunks(docs[:4]), partitioned=True) == (1, 2, 4)
+    stored = store.get(include=["metadatas"])
+    assert sorted(m["complaint_id"] for m in stored["metadatas"]) == [0, 1, 2, 3]
+
+    # The per-product partitions hold the same chunks, split by product
+    partitions = {c.name: c.get(include=["metadatas"]) for c in list_partitions(store)}
+    assert {name: sorted(m["complaint_id"] for m in p["metadatas"]) for name, p in partitions.items()} == {
+        partition_name("Credit card"): [0, 2], partition_name("Student loan"): [1, 3]
+    }
+    assert sorted(i for p in partitions.values() for i in p["ids"]) == sorted(stored["ids"])
+
+    # Partitions are opt-in: an unpartitioned run drops them instead of letting them go stale
+    assert sync_chunks(store, iter_chunks(docs[:4])) == (0, 0, 4) and list_partitions(store) == []
+
+def test_record_chunking_matches_split_documents():
+    """Test 6: Column-wise records + (parallel) splitting give the same chunks as the Document path."""
+    df = pd.DataFrame({
+        "Product": ["Credit card", "Student loan", "Personal loan"] * 4,
+        "Consumer complaint narrative": [("I was charged a fee. " * (i * 9 + 1)).strip() for i in range(12)],
+        "Complaint ID": range(100, 112),
+        "Issue": ["Fees", None, "Billing"] * 4,
+    })
+    documents = [
+        Document(page_content=r.text, metadata=r.metadata) for r in iter_records(df)
+    ]
+    expected = [(c.id, c.page_content, c.metadata) for c in iter_chunks(documents)]
+
+    serial = [(c.id, c.page_content, c.metadata) for c in iter_record_chunks(iter_records(df), workers=1)]
+    parallel = [(c.id, c.page_content, c.metadata)
+                for c in iter_record_chunks(iter_records(df), workers=2, min_parallel=0)]
+
+    assert [c.page_content for c in chunk_documents(documents)] == [text for _, text, _ in expected]
+    assert serial == expected
+    assert parallel == expected
+    assert expected[0][2] == {"product": "Credit card", "complaint_id": 100, "issue": "Fees"}
+
+def test_token_aware_chunks_fit_the_embedding_window(monkeypatch, tmp_path):
+    """Test 7: Chunks are sized in tokens, stay inside MiniLM's window and don't end in tiny fragments."""
+    import chunking
+    from chunking import EMBED_MAX_TOKENS, MIN_CHUNK_TOKENS, approximate_token_count, get_text_splitter
+
+    text = ("On XX/XX/XXXX I disputed a charge of {$120.00} with my credit card company. " * 40
+            + "Still waiting.")
+    chunks = get_text_splitter(mode="tokens").split_text(text)
+    counts = [approximate_token_count(c) for c in chunks]
+    assert len(chunks) > 1 and max(counts) <= EMBED_MAX_TOKENS
+    assert counts[-1] >= MIN_CHUNK_TOKENS and chunks[-1].endswith("Still waiting.")
+    assert all(len(c) <= 500 for c in get_text_splitter(mode="chars").split_text(text))
+
+    # The estimate stays above MiniLM's WordPiece count (14 pieces: xx ##xx, { $ 500 . 00 }, ze ##lle, ...)
+    assert approximate_token_count("I sent XXXX {$500.00} by Zelle.") >= 14
+    # An index chunked with the real tokenizer is never re-chunked with the estimate behind our back
+    monkeypatch.setattr(chunking, "TOKENIZER_PATH", str(tmp_path / "missing" / "tokenizer.json"))
+    assert chunking.default_token_counter() == "approx"
+    assert chunking.get_token_counter("approx") is approximate_token_count
+    with pytest.raises(RuntimeError):
+        get_text_splitter(mode="tokens", token_counter="minilm")
+
+
+def test_duplicate_chunks_are_dropped_and_credited(tmp_path):
+    """Test 8: Exact and near-duplicate chunks are dropped; the kept chunk lists every complaint id."""
+    from langchain_chroma import Chroma
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from chunking import ChunkDeduplicator, get_text_splitter
+    from ingestion import get_existing_ids, update_metadata
+
+    base = ("I was charged a late fee of {$35.00} on XX/XX/XXXX even though my payment posted on time. "
+            + " ".join(f"{w}{i}" for i, w in enumerate(["called", "bank", "refund", "agent", "statement"] * 22))
+            + " I called customer service three times about the account and nobody helped.")
+    texts = [
+        (1, "Credit card", base),
+        (2, "Credit card", base.replace("{$35.00}", "{$40.00}").replace("XX/XX/XXXX", "XX/XX/2023")),  # exact
+        (3, "Credit card", base.replace("helped.", "helps.")),                                          # near
+        (4, "Student loan", base),                                    # other product: kept for its partition
+        (5, "Credit card", "My transfer to Kenya has been pending for five days and nobody can explain why"),
+    ]
+    docs = [Document(page_content=t, metadata={"complaint_id": i, "product": p, "issue": "Fees"})
+            for i, p, t in texts]
+    splitter = get_text_splitter(mode="tokens", token_counter="approx")  # as run_ingestion chunks them
+    dedup = ChunkDeduplicator()
+    store = Chroma(collection_name="test_dedup", embedding_function=DeterministicFakeEmbedding(size=8),
+                   persist_directory=str(tmp_path / "db"))
+    # complaints 1 and 4 are two chunks each; 2 and 3 are absorbed chunk by chunk
+    assert sync_chunks(store, dedup.observe(iter_chunks(docs, splitter)), partitioned=True)[2] == 5
+    assert dedup.stats() == {"kept": 5, "dropped_exact": 3, "dropped_near": 1}
+
+    assert len(dedup.metadata_updates(stored=set())) == 2  # fresh chunks for one complaint already hold it
+    assert update_metadata(store, dedup.metadata_updates(), partitioned=True) == 2
+    stored = sorted((m["complaint_id"], m["complaint_ids"]) for m in store.get(include=["metadatas"])["metadatas"])
+    assert stored == [(1, "1,2,3"), (1, "1,2,3"), (4, "4"), (4, "4"), (5, "5")]
+    partition = {c.name: c for c in list_partitions(store)}[partition_name("Credit card")]
+    assert sorted(m["complaint_ids"] for m in partition.get(include=["metadatas"])["metadatas"]) == ["1,2,3", "1,2,3", "5"]
+    assert update_metadata(store, dedup.metadata_updates(), partitioned=True) == 0  # nothing left to write
+
+    # Complaints 2 and 3 withdrawn: the kept chunks stand for complaint 1 alone again
+    dedup = ChunkDeduplicator()
+    sync_chunks(store, dedup.observe(iter_chunks([docs[0], docs[3], docs[4]], splitter)), partitioned=True)
+    assert update_metadata(store, dedup.metadata_updates(stored=get_existing_ids(store)), partitioned=True) == 2
+    assert sorted(m["complaint_ids"] for m in partition.get(include=["metadatas"])["metadatas"]) == ["1", "1", "5"]
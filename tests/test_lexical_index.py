@@ -0,0 +1,31 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from lexical_index import LexicalIndex, LexicalIndexBuilder, reciprocal_rank_fusion, tokenize
+from chunking import ChunkRecord
+
+
+def test_bm25_finds_exact_terms(tmp_path):
+    chunks = [
+        ChunkRecord("a", "I sent money with Zelle and it never arrived", {"product": "Money transfer", "issue": "Fraud"}),
+        ChunkRecord("b", "My bank transfer was delayed for a week", {"product": "Money transfer", "issue": "Delay"}),
+        ChunkRecord("c", "Overdraft fees were charged twice on my account", {"product": "Checking", "issue": "Fees"}),
+        ChunkRecord("d", "The overdraft fee was refunded", {"product": "Credit card", "issue": "Fees"}),
+    ]
+    builder = LexicalIndexBuilder()
+    assert len(list(builder.observe(chunks))) == 4
+    builder.build().save(str(tmp_path))
+    index = LexicalIndex.load(str(tmp_path))
+
+    assert [cid for cid, _ in index.search("Zelle payment problems")] == ["a"]
+    assert {cid for cid, _ in index.search("overdraft fees")} == {"c", "d"}
+    assert [cid for cid, _ in index.search("overdraft fees", products=["Credit card"])] == ["d"]
+    assert index.search("overdraft", issue="Delay") == []
+    assert tokenize("Why are the FEES so high?") == ["fee", "high"]
+    assert LexicalIndex.load(str(tmp_path / "missing")) is None
+
+
+def test_reciprocal_rank_fusion():
+    # "b" is second in both rankings and beats items that are first in only one
+    assert reciprocal_rank_fusion(["a", "b", "c"], ["d", "b"], k=1) == ["b", "a", "d", "c"]
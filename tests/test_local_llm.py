@@ -0,0 +1,103 @@
+import sys
+import os
+import queue
+import pytest
+import threading
+
+# Fix path to allow importing from src
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from local_llm import Seq2SeqPipelineLLM
+from telemetry import telemetry
+
+
+class FakeEncoding(dict):
+    def __init__(self, ids):
+        super().__init__(input_ids=ids)
+        self.input_ids = ids
+
+    def to(self, device):
+        return self
+
+
+class FakeTokenizer:
+    def __call__(self, text, return_tensors=None, truncation=False, add_special_tokens=True):
+        return FakeEncoding(text.split())
+
+
+class FakeStreamer:
+    """Same protocol as TextIteratorStreamer: generate() puts text, the caller iterates."""
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def put(self, text):
+        self.queue.put(text)
+
+    def end(self):
+        self.queue.put(None)
+
+    def __iter__(self):
+        while (text := self.queue.get(timeout=5)) is not None:
+            yield text
+
+
+class FakeModel:
+    """Emits the next piece only once the previous one has been consumed."""
+    device = "cpu"
+
+    def __init__(self, pieces):
+        self.pieces, self.produced, self.kwargs = pieces, 0, None
+        self.gate = threading.Semaphore(1)
+
+    def generate(self, streamer, **kwargs):
+        self.kwargs = kwargs
+        for piece in self.pieces:
+            self.gate.acquire()
+            self.produced += 1
+            streamer.put(piece)
+        streamer.end()
+
+
+class FakePipeline:
+    def __init__(self, model):
+        self.model, self.tokenizer = model, FakeTokenizer()
+
+
+class FakeStreamingLLM(Seq2SeqPipelineLLM):
+    def _make_streamer(self, tokenizer):
+        return FakeStreamer()
+
+
+def test_stream_yields_tokens_as_generated():
+    """Test 1: _stream yields each piece as soon as generate() makes it and records the first-token time."""
+    model = FakeModel(["Late", " fees", ""])
+    llm = FakeStreamingLLM(pipeline=FakePipeline(model), model_id="fake-t5", pipeline_kwargs={"max_new_tokens": 5})
+    telemetry.reset()
+
+    received = []
+    for token in llm.stream("Why the late fees?"):
+        received.append(token)
+        assert model.produced == len(received)  # nothing is generated ahead of the consumer
+        model.gate.release()
+    assert received == ["Late", " fees"]  # empty pieces are skipped
+    assert model.kwargs["max_new_tokens"] == 5 and model.kwargs["input_ids"] == ["Why", "the", "late", "fees?"]
+    assert telemetry.snapshot()["spans"]["query.llm_first_token"]["count"] == 1
+
+
+class FailingModel:
+    """Emits one piece, then fails the way a real generate() can (OOM, bad kwargs)."""
+    device = "cpu"
+
+    def generate(self, streamer, **kwargs):
+        streamer.put("Late")
+        raise RuntimeError("CUDA out of memory")
+
+
+def test_stream_raises_generation_errors():
+    """Test 2: An exception in generate() ends the stream at once and reaches the caller."""
+    llm = FakeStreamingLLM(pipeline=FakePipeline(FailingModel()), model_id="fake-t5", pipeline_kwargs={})
+    received = []
+    with pytest.raises(RuntimeError, match="out of memory"):
+        for token in llm.stream("Why the late fees?"):
+            received.append(token)
+    assert received == ["Late"]
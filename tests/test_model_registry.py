@@ -0,0 +1,43 @@
+import sys
+import os
+import time
+import threading
+
+# Fix path to allow importing from src
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from model_registry import ModelRegistry
+
+
+def test_factory_runs_once_under_concurrent_first_use():
+    """Test 1: Many sessions asking for the model at once trigger a single load."""
+    registry = ModelRegistry()
+    calls = []
+
+    def slow_factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+
+    registry.register("llm", slow_factory)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("llm"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len({id(r) for r in results}) == 1
+
+
+def test_missing_resource_is_retried_and_warm_up_runs_in_background():
+    """Test 2: A factory returning None is not cached; warm_up() loads lazily in a thread."""
+    registry = ModelRegistry()
+    available = []
+    registry.register("vectorstore", lambda: "store" if available else None)
+
+    assert registry.get("vectorstore") is None
+    available.append(True)
+    registry.warm_up(["vectorstore"]).join()
+    assert registry.is_loaded("vectorstore")
@@ -0,0 +1,56 @@
+import sys
+import os
+import time
+import numpy as np
+
+# Fix path to allow importing from src
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import parallel_embedding
+from parallel_embedding import ParallelEmbedder
+
+
+class StubEncoder:
+    """Stands in for SentenceTransformer: one-dimensional vectors holding the text length."""
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=None, show_progress_bar=False, convert_to_numpy=True):
+        self.batches.append([len(t) for t in texts])
+        time.sleep(0.001)
+        return np.array([[float(len(t))] for t in texts])
+
+
+def test_length_sorted_batches_keep_input_order(monkeypatch):
+    """Test 1: Batches are encoded shortest first, yet vectors come back in input order with per-worker stats."""
+    encoder = StubEncoder()
+    # workers=1 encodes in this process
+    monkeypatch.setattr(parallel_embedding, "_models", {("stub", "torch"): encoder})
+    texts = ["x" * n for n in (9, 2, 7, 1, 8, 3, 6, 4, 5)]
+
+    embedder = ParallelEmbedder(model_name="stub", workers=1, batch_size=4, sort_by_length=True, backend="torch")
+    assert embedder.embed_documents(texts) == [[float(len(t))] for t in texts]
+    assert encoder.batches == [[1, 2, 3, 4], [5, 6, 7, 8], [9]]
+
+    assert dict(embedder.worker_stats)[os.getpid()]["chunks"] == len(texts)
+    report = embedder.report()[os.getpid()]
+    assert report["chunks"] == len(texts) and report["seconds"] > 0 and report["chunks_per_sec"] > 0
+    assert embedder.embed_query("abc") == [3.0]
+    embedder.close()
+
+
+def test_in_process_models_are_kept_per_model_and_backend(monkeypatch):
+    """Test 2: workers=1 loads one model per (model, backend) and leaves the thread settings alone."""
+    loaded = []
+
+    def load(model_name, backend):
+        loaded.append((model_name, backend))
+        return StubEncoder()
+
+    monkeypatch.setattr(parallel_embedding, "_models", {})
+    monkeypatch.setattr(parallel_embedding, "load_sentence_transformer", load)
+    monkeypatch.delenv("OMP_NUM_THREADS", raising=False)
+    for backend in ("torch", "int8", "torch"):
+        ParallelEmbedder(model_name="stub", workers=1, backend=backend).embed_documents(["a", "bb"])
+    assert loaded == [("stub", "torch"), ("stub", "int8")]
+    assert "OMP_NUM_THREADS" not in os.environ
@@ -0,0 +1,72 @@
+import sys
+import os
+
+# Fix path to allow importing from src
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from query_cache import QueryCache
+
+VOCAB = ["overdraft", "fees", "fee", "student", "loans", "why", "customers", "complaining", "about", "are"]
+
+
+def bag_of_words(text):
+    """Tiny stand-in for MiniLM: word counts over a fixed vocabulary."""
+    words = text.lower().replace("?", "").replace(",", "").split()
+    return [float(words.count(w)) for w in VOCAB]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_exact_and_semantic_tiers():
+    """Test 1: Case/whitespace variants hit the exact tier, paraphrases the semantic tier."""
+    cache = QueryCache(bag_of_words, similarity_threshold=0.9)
+    cache.put("Why are customers complaining about overdraft fees?", "answer-1")
+
+    assert cache.get("why are customers  complaining about OVERDRAFT fees?") == "answer-1"
+    assert cache.get("Customers are complaining about the overdraft fees, why?") == "answer-1"
+    assert cache.get("Student loans?") is None
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_ttl_lru_and_reingest_invalidation():
+    """Test 2: Entries expire, the cache stays bounded and a new index version clears it."""
+    clock, version = FakeClock(), ["v1"]
+    cache = QueryCache(bag_of_words, ttl=10, max_entries=2, version_fn=lambda: version[0], clock=clock)
+
+    cache.put("overdraft", "a")
+    cache.put("student", "b")
+    cache.get("overdraft")          # most recently used
+    cache.put("loans", "c")         # evicts "student"
+    assert cache.get("student") is None
+    assert cache.get("overdraft") == "a"
+
+    clock.now = 11
+    assert cache.get("overdraft") is None
+
+    cache.put("fees", "d")
+    version[0] = "v2"               # ingestion published a new index
+    assert cache.get("fees") is None
+
+
+def test_answer_from_a_swapped_out_snapshot_is_not_stored():
+    """Test 3: A request pinned to v1 that finishes after v2 is published neither reads nor writes v2 answers."""
+    served = ["v1"]
+    cache = QueryCache(bag_of_words, version_fn=lambda: served[0])
+
+    assert cache.get("overdraft fees", version="v1") is None   # request pinned to v1 misses...
+    served[0] = "v2"                                           # ...v2 is swapped in while it generates
+    assert cache.put("overdraft fees", "v1 answer", version="v1") is False
+    assert cache.get("overdraft fees", version="v2") is None
+    assert cache.stats()["stale_puts"] == 1
+
+    assert cache.put("overdraft fees", "v2 answer", version="v2") is True
+    assert cache.get("overdraft fees", version="v1") is None   # still on v1: no v2 answers either
+    assert cache.get("overdraft fees", version="v2") == "v2 answer"
+    assert cache.get("overdraft fees") == "v2 answer"          # unpinned callers read the served version
@@ -0,0 +1,103 @@
+import sys
+import os
+import time
+import asyncio
+import pytest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langchain_core.documents import Document
+from rag_engine import (
+    BudgetExhausted, CircuitBreaker, CircuitOpen, GenerationError, ResilientGenerator, evidence_only_answer
+)
+
+
+class Flaky:
+    """Raises `error` for the first `failures` calls, then answers."""
+
+    def __init__(self, failures, error=ConnectionError("reset by peer")):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self, prompt):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return f"answer to {prompt}"
+
+
+def fast_generator(**breaker_kwargs):
+    return ResilientGenerator(CircuitBreaker(**breaker_kwargs), backoff_multiplier_s=0.001, backoff_max_s=0.002)
+
+
+def test_transient_errors_are_retried_and_permanent_ones_are_not():
+    """Test 1: Jittered retries (sync and async) recover transient errors; a ValueError fails at once."""
+    generator = fast_generator()
+    flaky = Flaky(failures=2)
+    assert generator.call(flaky, "q") == "answer to q" and flaky.calls == 3
+
+    assert asyncio.run(generator.acall(Flaky(failures=1), "q")) == "answer to q"
+
+    broken = Flaky(failures=10, error=ValueError("bad prompt"))
+    with pytest.raises(GenerationError):
+        generator.call(broken, "q")
+    assert broken.calls == 1
+
+    metrics = generator.metrics.snapshot()
+    assert metrics["retry"] == 3 and metrics["success"] == 2 and metrics["failure"] == 1
+
+
+def test_circuit_breaker_deadline_and_fallback():
+    """Test 2: The circuit opens and sheds load; an exhausted deadline falls back to the evidence."""
+    clock = [0.0]
+    generator = fast_generator(failure_threshold=2, reset_timeout_s=10, clock=lambda: clock[0])
+    generator.max_attempts = 1
+    for _ in range(2):
+        with pytest.raises(GenerationError):
+            generator.call(Flaky(failures=1), "q")
+    assert generator.breaker.state == "open"
+
+    never_called = Flaky(failures=0)
+    with pytest.raises(CircuitOpen):
+        generator.call(never_called, "q")
+    assert never_called.calls == 0
+
+    clock[0] = 11  # half-open: one probe closes it again
+    assert generator.call(never_called, "q") == "answer to q" and generator.breaker.state == "closed"
+
+    docs = [Document(page_content="Late fee charged twice.", metadata={"product": "Credit Card"})]
+    answer, reason = generator.call_with_fallback(never_called, "q", deadline=time.monotonic() - 1,
+                                                  fallback=evidence_only_answer(docs))
+    assert "Late fee charged twice." in answer and "deadline" in reason
+    with pytest.raises(BudgetExhausted):
+        generator.call(never_called, "q", deadline=time.monotonic() - 1)
+
+    saturated = fast_generator(max_concurrent=0)
+    with pytest.raises(CircuitOpen):
+        saturated.call(never_called, "q")
+    assert saturated.metrics.snapshot()["rejected_saturated"] == 1
+    metrics = generator.metrics.snapshot()
+    assert metrics["rejected_open"] == 1 and metrics["fallback"] == 1 and metrics["budget_exhausted"] == 2
+
+
+def test_only_transient_errors_open_the_circuit_and_only_the_probe_ends_probing():
+    """Test 3: Bad input never opens the circuit; a straggler's release leaves the half-open probe in place."""
+    generator = fast_generator(failure_threshold=2)
+    generator.max_attempts = 1
+    for _ in range(3):
+        with pytest.raises(GenerationError):
+            generator.call(Flaky(failures=1, error=ValueError("bad prompt")), "q")
+    assert generator.breaker.state == "closed" and generator.breaker.failures == 0
+
+    clock = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_s=10, clock=lambda: clock[0])
+    first, straggler = breaker.acquire(), breaker.acquire()  # both admitted while closed
+    breaker.release(TimeoutError("backend timed out"), first)
+    assert breaker.state == "open" and straggler is False
+    clock[0] = 11
+    assert breaker.acquire() is True  # the probe
+    breaker.release(ValueError("bad input"), straggler)
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+    breaker.release(None, probe=True)
+    assert breaker.state == "closed" and breaker.in_flight == 0
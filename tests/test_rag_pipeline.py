@@ -0,0 +1,84 @@
+import sys
+import os
+from langchain_core.documents import Document
+from langchain_core.language_models.fake import FakeListLLM, FakeStreamingListLLM
+
+# Fix path to allow importing from src
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import rag_pipeline as rp
+from query_cache import QueryCache
+from telemetry import telemetry
+
+DOCS = [Document(page_content="I was charged a late fee although I paid on time.", id="c1",
+                 metadata={"product": "Credit card", "complaint_id": 1})]
+
+
+class Snapshot:
+    version, resources = "v1", {}
+
+
+class OneSnapshot:
+    """Snapshot manager that always serves the same version."""
+    def current(self):
+        return Snapshot()
+
+    def acquire(self):
+        return Snapshot()
+
+    def release(self, snapshot):
+        pass
+
+
+def fake_index(monkeypatch, llm):
+    """Chain components without models or Chroma: `llm` answers, retrieval returns DOCS."""
+    calls = {"retrieve": 0}
+
+    def retrieve(question, scope, hybrid=True, rerank=False, k=rp.TOP_K, vector=None, snapshot=None):
+        calls["retrieve"] += 1
+        return {"docs": DOCS, "timings": {"retrieve_ms": 1.0}}
+
+    cache = QueryCache(lambda text: [float(len(text)), 1.0], version_fn=lambda: "v1")
+    monkeypatch.setattr(rp, "get_llm", lambda: llm)
+    monkeypatch.setattr(rp, "get_vectorstore", lambda: object())
+    monkeypatch.setattr(rp, "get_snapshots", lambda: OneSnapshot())
+    monkeypatch.setattr(rp, "resolve_scope", lambda question, product=None, issue=None, infer=True, snapshot=None:
+                        {"products": [product] if product else [], "issue": issue})
+    monkeypatch.setattr(rp, "retrieve", retrieve)
+    monkeypatch.setattr(rp, "get_query_cache", lambda: cache)
+    return calls, cache
+
+
+def test_chain_returns_answer_with_sources_and_caches_it(monkeypatch):
+    """Test 1: with_sources returns the answer with the prompt's docs; a repeated question is a cache hit."""
+    calls, cache = fake_index(monkeypatch, FakeListLLM(responses=["Late fees are the main complaint."]))
+    chain = rp.get_rag_chain(with_sources=True, product="Credit card")
+
+    result = chain.invoke("Why am I charged late fees?")
+    assert result["answer"] == "Late fees are the main complaint."
+    assert result["docs"] == DOCS and result["scope"] == {"products": ["Credit card"], "issue": None}
+
+    again = chain.invoke("why am I charged  late fees?")
+    assert again["answer"] == result["answer"] and again["timings"] == {"cache_hit": True}
+    assert calls["retrieve"] == 1 and cache.stats()["exact_hits"] == 1
+
+    answer_only = rp.get_rag_chain(use_cache=False)
+    assert answer_only.invoke("Why am I charged late fees?") == "Late fees are the main complaint."
+
+    # No index: no chain, and Flan-T5 is never loaded for it
+    monkeypatch.setattr(rp, "get_vectorstore", lambda: None)
+    monkeypatch.setattr(rp, "get_llm", lambda: (_ for _ in ()).throw(AssertionError("LLM loaded without an index")))
+    assert rp.get_rag_chain() is None
+
+
+def test_stream_answer_yields_tokens_and_first_token_time(monkeypatch):
+    """Test 2: stream_answer passes tokens on one at a time and records the time to the first one."""
+    fake_index(monkeypatch, FakeStreamingListLLM(responses=["Fees"]))
+    telemetry.reset()
+    events = list(rp.stream_answer(rp.get_rag_chain(with_sources=True, use_cache=False), "Why the fees?"))
+
+    assert [kind for kind, _ in events[:2]] == ["scope", "docs"] and events[1][1] == DOCS
+    assert [value for kind, value in events if kind == "token"] == ["F", "e", "e", "s"]
+    kind, timings = events[-1]
+    assert kind == "timings" and 0 <= timings["first_token_ms"] <= timings["total_ms"]
+    assert telemetry.snapshot()["spans"]["query.first_token"]["count"] == 1
@@ -0,0 +1,200 @@
+import sys
+import os
+import time
+import asyncio
+import pytest
+from contextlib import nullcontext
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langchain_core.documents import Document
+from rag_service import RAGService, PipelineStages, ServiceOverloaded, DeadlineExceeded
+
+
+class FakeStages(PipelineStages):
+    """Records the batch sizes the service hands to each stage."""
+
+    def __init__(self, generate_s=0.0):
+        self.generate_s = generate_s
+        self.embed_calls = []
+        self.generate_calls = []
+        self.store_calls = 0
+
+    def pin(self):
+        return nullcontext()  # no index behind these stages
+
+    def version(self):
+        return None
+
+    def embed(self, questions):
+        self.embed_calls.append(len(questions))
+        return [[1.0, 0.0] for _ in questions]
+
+    def aggregate(self, question, product=None, issue=None):
+        return None  # every question goes through retrieval and generation
+
+    def scope(self, question, product=None, issue=None):
+        return {"products": [product] if product else [], "issue": issue}
+
+    def cached(self, question, scope, rerank=False):
+        return None
+
+    def store(self, question, scope, result, rerank=False, version=None):
+        self.store_calls += 1
+
+    def retrieve(self, question, scope, vector, rerank=False, k=3):
+        return [Document(page_content=f"evidence for {question}", id="c1")], {"retrieve_ms": 0.1}
+
+    def generate(self, prompts):
+        self.generate_calls.append(len(prompts))
+        time.sleep(self.generate_s)
+        return [f" answer {i}" for i in range(len(prompts))]
+
+    def stream(self, prompt):
+        yield from ["stream", "ed"]
+
+
+def test_concurrent_requests_are_micro_batched():
+    """Test 1: Requests arriving together share one embedding call and one generation."""
+    stages = FakeStages()
+    service = RAGService(stages, max_batch_size=8, batch_window_ms=20)
+
+    async def main():
+        return await asyncio.gather(*(service.ask(f"question {i}") for i in range(5)))
+
+    results = asyncio.run(main())
+    assert stages.embed_calls == [5] and stages.generate_calls == [5]
+    assert [r["answer"] for r in results] == [f"answer {i}" for i in range(5)]
+    assert results[0]["timings"]["batch_size"] == 5 and stages.store_calls == 5
+
+    events = list(service.stream_sync("streamed question"))
+    assert [v for kind, v in events if kind == "token"] == ["stream", "ed"]
+    assert events[-1][0] == "timings" and "generate_ms" in events[-1][1]
+    service.close()
+
+
+def test_admission_control_and_deadlines():
+    """Test 2: Excess requests are rejected; slow ones fail with DeadlineExceeded."""
+    service = RAGService(FakeStages(generate_s=0.3), max_pending=1, batch_window_ms=1)
+
+    async def main():
+        first = asyncio.ensure_future(service.ask("slow question", deadline_s=0.1))
+        await asyncio.sleep(0)
+        with pytest.raises(ServiceOverloaded):
+            await service.ask("one too many")
+        with pytest.raises(DeadlineExceeded):
+            await first
+        assert service.stats()["pending"] == 0
+
+    asyncio.run(main())
+
+    # Streamlit sessions call in from their own threads
+    from concurrent.futures import ThreadPoolExecutor
+    service = RAGService(FakeStages(), batch_window_ms=1)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda i: service.ask_sync(f"question {i}"), range(32)))
+    assert service.stats()["admitted"] == 32 and service.stats()["pending"] == 0
+    service.close()
+
+
+def test_generation_failure_degrades_to_evidence():
+    """Test 3: When generation keeps failing the service answers with the retrieved evidence."""
+    from rag_engine import CircuitBreaker, ResilientGenerator
+
+    class BrokenStages(FakeStages):
+        def generate(self, prompts):
+            raise ConnectionError("model server down")
+
+        def stream(self, prompt):
+            raise ConnectionError("model server down")
+
+    stages = BrokenStages()
+    generator = ResilientGenerator(CircuitBreaker(), max_attempts=1)
+    service = RAGService(stages, generator=generator)
+    result = asyncio.run(service.ask("why the fee?"))
+    assert result["fallback"] and "evidence for why the fee?" in result["answer"]
+    assert "fallback_reason" in result["timings"] and stages.store_calls == 0
+
+    events = list(service.stream_sync("why the delay?"))
+    assert "evidence for why the delay?" in "".join(v for kind, v in events if kind == "token")
+    assert service.stats()["fallbacks"] == 2 and service.stats()["generation"]["fallback"] == 2
+    service.close()
+
+
+def test_batch_reads_one_snapshot_across_a_swap(monkeypatch):
+    """Test 4: Scope, cache, retrieval and stored answers of a batch use the version pinned at its start."""
+    import rag_pipeline as rp
+
+    class Snapshot:
+        def __init__(self, version):
+            self.version, self.resources = version, {}
+
+    class SwappingManager:
+        """A newer version is published every time a snapshot is handed out."""
+        def __init__(self):
+            self.version, self.released = 0, []
+
+        def current(self):
+            self.version += 1
+            return Snapshot(self.version)
+
+        def acquire(self):
+            return self.current()
+
+        def release(self, snapshot):
+            self.released.append(snapshot.version)
+
+    manager = SwappingManager()
+    monkeypatch.setattr(rp, "get_snapshots", lambda: manager)
+    seen = []
+
+    class VersionedStages(FakeStages):
+        def pin(self):
+            return rp.pinned_snapshot()
+
+        def version(self):
+            return rp.get_index_version()
+
+        def store(self, question, scope, result, rerank=False, version=None):
+            seen.append(("store", version))  # checked against the served version by the cache
+
+        def scope(self, question, product=None, issue=None):
+            seen.append(("scope", rp.get_index_version()))
+            return super().scope(question, product, issue)
+
+        def retrieve(self, question, scope, vector, rerank=False, k=3):
+            seen.append(("retrieve", rp.get_index_version()))  # runs in a search thread
+            return super().retrieve(question, scope, vector, rerank, k)
+
+    service = RAGService(VersionedStages(), batch_window_ms=20)
+
+    async def main():
+        return await asyncio.gather(*(service.ask(f"question {i}") for i in range(3)))
+
+    asyncio.run(main())
+    assert len(seen) == 9 and {version for _, version in seen} == {1}
+    for _ in range(100):  # the batch thread lets go of the snapshot just after answering
+        if manager.released:
+            break
+        time.sleep(0.01)
+    assert manager.released == [1]
+    service.close()
+
+
+def test_streamed_answer_and_own_breaker():
+    """Test 5: Tokens are streamed one by one with the first-token time; each service has its own breaker."""
+    from rag_engine import MAX_CONCURRENT_GENERATIONS, get_generator
+    from telemetry import telemetry
+
+    telemetry.reset()
+    service = RAGService(FakeStages(), batch_window_ms=1, stream_workers=2)
+    other = RAGService(FakeStages(), batch_window_ms=1, stream_workers=7)
+    assert service.generator.breaker.max_concurrent == 3 and other.generator.breaker.max_concurrent == 8
+    assert get_generator().breaker.max_concurrent == MAX_CONCURRENT_GENERATIONS  # shared policy untouched
+
+    events = list(service.stream_sync("why the delay?"))
+    assert [value for kind, value in events if kind == "token"] == ["stream", "ed"]
+    kind, timings = events[-1]
+    assert kind == "timings" and 0 <= timings["first_token_ms"] <= timings["total_ms"]
+    assert telemetry.snapshot()["spans"]["query.first_token"]["count"] == 1
+    service.close()
+    other.close()
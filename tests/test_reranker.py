@@ -0,0 +1,68 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from langchain_core.documents import Document
+from reranker import CrossEncoderReranker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_docs():
+    return [Document(page_content=text, id=f"chunk-{i}") for i, text in enumerate(["b", "ccc", "a", "dd"])]
+
+
+def test_rerank_orders_by_score_and_memoizes():
+    """Test 1: All pairs are scored in one call; repeated questions reuse the scores."""
+    calls = []
+
+    def score_fn(pairs):
+        calls.append(len(pairs))
+        return [len(text) for _, text in pairs]
+
+    reranker = CrossEncoderReranker(score_fn)
+    docs, timings = reranker.rerank("Why the fee?", make_docs(), k=2)
+    assert [d.id for d in docs] == ["chunk-1", "chunk-3"]
+    assert calls == [4] and timings["scored"] == 4
+
+    docs, timings = reranker.rerank("  why the FEE? ", make_docs(), k=2)
+    assert [d.id for d in docs] == ["chunk-1", "chunk-3"]
+    assert calls == [4] and timings["cached"] == 4
+
+
+def test_over_budget_scores_what_fits_and_recovers():
+    """Test 2: Over budget, only the best first-stage hits are re-ranked; a faster model is noticed again."""
+    clock = FakeClock()
+    ms_per_pair = [10]
+
+    def score_fn(pairs):
+        clock.now += ms_per_pair[0] / 1000 * len(pairs)
+        return [len(text) for _, text in pairs]
+
+    reranker = CrossEncoderReranker(score_fn, budget_ms=30, clock=clock)
+    reranker.rerank("first question", make_docs(), k=2)  # 40 ms: learns the cost per pair
+    docs, timings = reranker.rerank("another question", make_docs(), k=2)
+    assert timings["fallback"] and (timings["scored"], timings["unscored"]) == (3, 1)
+    assert [d.id for d in docs] == ["chunk-1", "chunk-0"]  # "dd" was not scored, so it stays behind
+
+    ms_per_pair[0] = 1  # the model warmed up
+    passes = [reranker.rerank(f"question {i}", make_docs(), k=2)[1] for i in range(5)]
+    assert passes[0]["fallback"] and not passes[-1]["fallback"] and passes[-1]["scored"] == 4
+
+
+def test_reranked_answers_are_cached_apart():
+    """Test 3: An answer built from re-ranked chunks is not served to a plain request, or the other way round."""
+    import rag_pipeline as rp
+    from query_cache import QueryCache
+
+    cache = QueryCache(lambda text: [1.0, float(len(text))])
+    scope = {"products": ["Credit card"], "issue": None}
+    cache.put("Why the fee?", "re-ranked answer", scope=rp.scope_key(scope, rerank=True))
+    assert cache.get("Why the fee?", scope=rp.scope_key(scope)) is None
+    assert cache.get("Why the fee?", scope=rp.scope_key(scope, rerank=True)) == "re-ranked answer"
@@ -0,0 +1,35 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from scope_index import ScopeIndex, build_filter
+from chunking import ChunkRecord
+
+
+def make_index(tmp_path):
+    chunks = [
+        ChunkRecord("a", "text", {"product": "Student loan", "issue": "Dealing with your lender or servicer"}),
+        ChunkRecord("b", "text", {"product": "Credit card", "issue": "Fees or interest"}),
+        ChunkRecord("c", "text", {"product": "Credit card or prepaid card", "issue": "Fees or interest"}),
+    ]
+    scope = ScopeIndex()
+    assert len(list(scope.observe(chunks))) == 3
+    scope.save(str(tmp_path))
+    return ScopeIndex.load(str(tmp_path))
+
+
+def test_infer_scope_from_question(tmp_path):
+    scope = make_index(tmp_path)
+    assert scope.infer("What are the main issues with Student Loans?") == (["Student loan"], None)
+    assert scope.infer("Why are credit card fees and interest so high?") == (
+        ["Credit card", "Credit card or prepaid card"], "Fees or interest")
+    # Products that are not in the index are never used as a filter
+    assert scope.infer("Are there delays in Money Transfers?") == ([], None)
+
+
+def test_build_filter():
+    assert build_filter() is None
+    assert build_filter(["Student loan"]) == {"product": "Student loan"}
+    assert build_filter(["Credit card", "Personal loan"], "Fees or interest") == {
+        "$and": [{"product": {"$in": ["Credit card", "Personal loan"]}}, {"issue": "Fees or interest"}]
+    }
@@ -0,0 +1,127 @@
+import sys
+import os
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from snapshots import (
+    LEGACY_LEASE, Lease, SnapshotManager, collect_garbage, current_version, discard, list_snapshots, new_snapshot, publish,
+    resolve, snapshot_path
+)
+
+
+def write_snapshot(root, text, rebuild=False):
+    version, path = new_snapshot(root, rebuild=rebuild)
+    with open(os.path.join(path, "data.txt"), "a") as f:
+        f.write(text)
+    return version, path
+
+
+def read(path):
+    with open(os.path.join(path, "data.txt")) as f:
+        return f.read()
+
+
+def test_publish_copy_and_garbage_collection(tmp_path):
+    """Test 1: Snapshots start as a copy of the published one, go live in one rename and are collected unless leased."""
+    root = str(tmp_path / "db")
+    os.makedirs(root)
+    with open(os.path.join(root, "data.txt"), "w") as f:  # an index written in place by an older ingestion
+        f.write("legacy ")
+    assert resolve(root) == ("", root)
+
+    v1, _ = write_snapshot(root, "v1 ")
+    assert resolve(root) == ("", root)  # not visible before publish
+    publish(root, v1)
+    assert resolve(root) == (v1, snapshot_path(root, v1)) and read(snapshot_path(root, v1)) == "legacy v1 "
+    v2, _ = write_snapshot(root, "v2 ")
+    publish(root, v2)
+    v3, _ = write_snapshot(root, "v3 ", rebuild=True)
+    publish(root, v3)
+    assert read(snapshot_path(root, v2)) == "legacy v1 v2 " and read(snapshot_path(root, v3)) == "v3 "
+    assert list_snapshots(root) == [v1, v2, v3]
+
+    unchanged, _ = write_snapshot(root, "")
+    discard(root, unchanged)
+    discard(root, v3)  # the published snapshot is never discarded
+    assert list_snapshots(root) == [v1, v2, v3]
+
+    lease, legacy_reader = Lease(root, v1), Lease(root, LEGACY_LEASE)
+    assert collect_garbage(root, keep=1) == [v2]  # v1 is still read by someone
+    assert os.path.exists(os.path.join(root, "data.txt"))  # so is the in-place index
+    legacy_reader.release()
+    os.utime(lease.path, (time.time() - 120, time.time() - 120))  # ... who stopped refreshing it
+    building, _ = write_snapshot(root, "v4 ")
+    assert collect_garbage(root, keep=1, lease_ttl=60) == [v1]
+    assert list_snapshots(root) == [v3, building] and current_version(root) == v3
+    assert sorted(os.listdir(root)) == ["CURRENT", "leases", "snapshots"]  # in-place index removed too
+
+
+def test_requests_pinned_to_a_snapshot_survive_a_swap(tmp_path, monkeypatch):
+    """Test 2: A published snapshot is swapped in for new requests; the old one closes after its last request."""
+    import rag_pipeline as rp
+    from langchain_chroma import Chroma
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    root = str(tmp_path / "db")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    monkeypatch.setattr(rp, "get_embeddings", lambda: embeddings)
+
+    def ingest(texts):
+        version, path = new_snapshot(root)
+        store = Chroma(persist_directory=path, embedding_function=embeddings)
+        store.add_texts(texts, ids=texts, metadatas=[{"product": "Credit card"}] * len(texts))
+        store._client.close()
+        publish(root, version)
+        return version
+
+    v1 = ingest(["late fee"])
+    closed = []
+    manager = SnapshotManager(root, rp._open_snapshot, lambda r: closed.append(r) or rp._close_snapshot(r),
+                              poll_interval_s=0.05, keep=1)
+    monkeypatch.setattr(rp, "get_snapshots", lambda: manager)
+    try:
+        with rp.pinned_snapshot() as snapshot:
+            assert snapshot.version == v1 and len(rp.get_vectorstore().get()["ids"]) == 1
+            retriever = rp.get_retriever(k=2)  # outlives the snapshot it was made on
+            v2 = ingest(["zelle refund"])
+            manager.start()
+            deadline = time.time() + 5
+            while manager.stats()["version"] != v2 and time.time() < deadline:
+                time.sleep(0.01)
+            assert manager.stats() == {"version": v2, "path": snapshot_path(root, v2), "in_flight": 0,
+                                       "retired": 1, "swaps": 1}
+            # Still the old index inside the pinned request: open, leased and on disk
+            assert rp.get_index_version() == v1 and len(rp.get_vectorstore().get()["ids"]) == 1
+            assert closed == [] and os.path.isdir(snapshot_path(root, v1))
+
+        assert rp.get_index_version() == v2 and sorted(rp.get_vectorstore().get()["ids"]) == ["late fee", "zelle refund"]
+        assert len(closed) == 1 and list_snapshots(root) == [v2]  # closed and collected after the last request
+        assert rp.retrieve("zelle refund", {"products": [], "issue": None}, hybrid=False, k=2)["docs"]
+        assert len(retriever.invoke("zelle refund")) == 2  # served from v2, not the closed v1
+    finally:
+        manager.stop()
+
+
+def test_snapshot_embedded_by_another_model_is_refused(tmp_path, monkeypatch, caplog):
+    """Test 3: The embedder is recorded with the index; another model is refused on open, another backend warns."""
+    import pytest
+    import rag_pipeline as rp
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from inference_backends import EmbedderMismatch, check_index_embedder, index_embedder
+    from snapshots import read_index_meta, write_index_meta
+
+    monkeypatch.setattr(rp, "get_embeddings", lambda: DeterministicFakeEmbedding(size=16))
+    path = str(tmp_path / "snapshot")
+    os.makedirs(path)
+    assert check_index_embedder(read_index_meta(path), "all-MiniLM-L6-v2", "torch") is None  # older index
+
+    write_index_meta(path, token_counter="approx", **index_embedder("all-MiniLM-L6-v2", "int8"))
+    assert read_index_meta(path)["token_counter"] == "approx"  # merged with what was there
+    assert "int8 backend, not torch" in check_index_embedder(read_index_meta(path), "all-MiniLM-L6-v2", "torch")
+    monkeypatch.setattr(rp, "EMBED_BACKEND", "torch")
+    rp._close_snapshot(rp._open_snapshot(path))
+    assert "int8 backend, not torch" in caplog.text
+
+    write_index_meta(path, **index_embedder("bge-small-en", "torch"))
+    with pytest.raises(EmbedderMismatch):
+        rp._open_snapshot(path)
@@ -0,0 +1,62 @@
+import sys
+import os
+import json
+import urllib.request
+import pytest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from telemetry import Histogram, Telemetry
+
+
+def test_spans_feed_histograms_counters_and_exports(tmp_path):
+    """Test 1: Spans record latency and errors; snapshot, Prometheus text and JSONL agree."""
+    jsonl = tmp_path / "spans.jsonl"
+    telemetry = Telemetry(enabled=True, jsonl_path=str(jsonl))
+    for ms in (3, 7, 40):
+        telemetry.observe("query.embed", ms)
+    with pytest.raises(ValueError):
+        with telemetry.span("query.generate"):
+            raise ValueError("boom")
+    assert list(telemetry.timed_iter("ingest.chunk", [1, 2])) == [1, 2]
+
+    report = telemetry.snapshot()
+    embed = report["spans"]["query.embed"]
+    assert embed["count"] == 3 and embed["total_ms"] == 50 and embed["max_ms"] == 40
+    assert 5 <= embed["p50_ms"] <= 10 and embed["p99_ms"] <= 40
+    assert report["counters"]["query.generate.errors"] == 1
+    assert report["spans"]["ingest.chunk"]["count"] == 3  # two items and the final StopIteration
+    assert report["peak_rss_mb"] > 0
+
+    text = telemetry.to_prometheus()
+    assert 'creditrag_stage_latency_ms_bucket{stage="query.embed",le="5"} 1' in text
+    assert 'creditrag_stage_latency_ms_count{stage="query.embed"} 3' in text
+    port = telemetry.serve(port=0)
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        assert 'creditrag_stage_latency_ms_count{stage="query.embed"} 3' in response.read().decode()
+    assert Telemetry(enabled=True).start_exporter(port) is None  # port taken: warn, don't raise
+    assert Telemetry(enabled=True).start_exporter(0) is None  # RAG_METRICS_PORT unset
+
+    telemetry.export_jsonl(str(jsonl))
+    lines = [json.loads(line) for line in jsonl.read_text().splitlines()]
+    assert lines[0] == {"ts": lines[0]["ts"], "span": "query.embed", "ms": 3, "ok": True}
+    assert lines[-1]["spans"]["query.embed"]["count"] == 3
+
+
+def test_disabled_telemetry_records_nothing():
+    """Test 2: With telemetry off, spans are a shared no-op and nothing is stored."""
+    telemetry = Telemetry(enabled=False)
+    assert telemetry.span("a") is telemetry.span("b")
+    with telemetry.span("query.embed"):
+        pass
+    telemetry.incr("query.cache_hits")
+    assert list(telemetry.timed_iter("ingest.chunk", range(3))) == [0, 1, 2]
+    assert telemetry.snapshot()["spans"] == {} and telemetry.snapshot()["counters"] == {}
+    assert Histogram().quantile(0.95) == 0.0
+
+
+def test_sub_millisecond_spans_have_distinct_quantiles():
+    """Test 3: Spans well under 1 ms still get a p50 below their max."""
+    histogram = Histogram()
+    for ms in (0.08, 0.12, 0.3, 0.6):
+        histogram.observe(ms)
+    assert 0.1 <= histogram.quantile(0.5) <= 0.25 < histogram.quantile(0.95) == histogram.max == 0.6